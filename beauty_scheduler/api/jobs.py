@@ -0,0 +1,144 @@
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+
+from ..models.staff import Staff
+from ..models.booking import Booking
+from ..optimizer.schedule_optimizer import BeautySchedulerOptimizer
+from .solver_pool import SolverPool
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+@dataclass
+class OptimizationJob:
+    """非同期最適化ジョブ"""
+    id: str
+    schedule_date: datetime
+    optimizer: BeautySchedulerOptimizer
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    best_objective: Optional[float] = None
+    best_bound: Optional[float] = None
+    solutions_found: int = 0
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    stop_event: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "schedule_date": self.schedule_date.isoformat(),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "best_objective": self.best_objective,
+            "best_bound": self.best_bound,
+            "solutions_found": self.solutions_found,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """最適化ジョブの投入・進捗管理・キャンセル
+
+    求解は SolverPool 上で実行し、探索中の改善解で最良目的関数値を更新する。
+    完了済みジョブは max_finished_jobs 件まで保持する。
+    """
+
+    def __init__(self, pool: SolverPool, max_finished_jobs: int = 1000):
+        self.pool = pool
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: "OrderedDict[str, OptimizationJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, optimizer: BeautySchedulerOptimizer, staff_list: List[Staff],
+               bookings: List[Booking], schedule_date: datetime, **options) -> OptimizationJob:
+        """ジョブを登録してワーカープールに投入（満杯なら SolverPoolSaturated）
+
+        options は optimize_schedule にそのまま渡す。
+        """
+        job = OptimizationJob(id=uuid.uuid4().hex, schedule_date=schedule_date,
+                              optimizer=optimizer)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self.pool.submit(self._run, job, staff_list, bookings, options)
+        except Exception:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[OptimizationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[OptimizationJob]:
+        """ジョブをキャンセル（実行中ならCP-SATの探索を停止）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            job.cancel_requested = True
+            if job.status == JobStatus.QUEUED:
+                job.status = JobStatus.CANCELLED
+                job.finished_at = datetime.now()
+        job.optimizer.request_stop(job.stop_event)
+        return job
+
+    def _run(self, job: OptimizationJob, staff_list: List[Staff], bookings: List[Booking],
+             options: Dict):
+        with self._lock:
+            if job.cancel_requested:
+                return
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+
+        def on_solution(progress: Dict):
+            with self._lock:
+                job.best_objective = progress["objective_value"]
+                job.best_bound = progress["best_bound"]
+                job.solutions_found += 1
+
+        try:
+            result = job.optimizer.optimize_schedule(
+                staff_list, bookings, job.schedule_date, on_solution=on_solution,
+                stop_event=job.stop_event, **options)
+        except Exception as e:
+            with self._lock:
+                job.status = JobStatus.FAILED
+                job.error = str(e)
+                job.finished_at = datetime.now()
+            return
+
+        with self._lock:
+            job.result = result
+            job.status = JobStatus.CANCELLED if job.cancel_requested else JobStatus.SUCCEEDED
+            job.finished_at = datetime.now()
+
+    def _evict_finished(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items()
+                        if job.status in FINISHED_STATUSES]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
@@ -0,0 +1,290 @@
+import bisect
+import math
+import threading
+import time as time_module
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+# Prometheus のテキスト形式（exposition format 0.0.4）
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ヒストグラムの既定のバケット上限
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MODEL_SIZE_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+# 制限時間内に解が見つからなかった CP-SAT のステータスを timeout として数える
+TIMEOUT_STATUS = "UNKNOWN"
+
+Labels = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    """ラベルの組ごとに値を保持するメトリクス"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._samples(key, value)]
+        return lines
+
+    def _samples(self, key: Labels, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def sync(self, total: float, **labels):
+        """外部で集計している累計値（キャッシュの統計など）をそのまま反映"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = total
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """累積バケット・合計・件数を出力するヒストグラム"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def _samples(self, key: Labels, value) -> List[str]:
+        counts, total = value
+        names = self.labelnames + ("le",)
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} "
+                         f"{cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """プロセス内のメトリクスの登録と Prometheus テキスト形式への出力
+
+    collector は出力の直前に呼ばれ、ワーカープールやキャッシュの現在値を
+    ゲージに反映する。
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+class SchedulerMetrics:
+    """スケジューラーAPIのメトリクス
+
+    observe_optimization は BeautySchedulerOptimizer の phase_hook として渡し、
+    フェーズごとの時間・終了ステータス・モデル規模を記録する。
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.requests = r.counter("beauty_scheduler_http_requests_total",
+                                  "ルートごとのリクエスト数", ("route", "method", "status"))
+        self.request_seconds = r.histogram("beauty_scheduler_http_request_duration_seconds",
+                                           "ルートごとの応答時間（秒）", ("route", "method"))
+        self.optimize_seconds = r.histogram("beauty_scheduler_optimize_duration_seconds",
+                                            "optimize_schedule 1回の経過時間（秒）")
+        self.phase_seconds = r.histogram("beauty_scheduler_optimize_phase_duration_seconds",
+                                         "最適化のフェーズごとの経過時間（秒）", ("phase",))
+        self.phase_cpu_seconds = r.counter("beauty_scheduler_optimize_phase_cpu_seconds_total",
+                                           "最適化のフェーズごとのCPU時間（秒）", ("phase",))
+        self.solver_status = r.counter("beauty_scheduler_solver_status_total",
+                                       "求解の終了ステータス（timeout は制限時間内に解なし）",
+                                       ("engine", "status"))
+        self.fallbacks = r.counter("beauty_scheduler_solver_fallback_total",
+                                   "CP-SATの解が得られず貪欲法の結果を返した回数")
+        self.model_variables = r.histogram("beauty_scheduler_model_variables",
+                                           "CP-SATモデルの変数の数", buckets=MODEL_SIZE_BUCKETS)
+        self.model_constraints = r.histogram("beauty_scheduler_model_constraints",
+                                             "CP-SATモデルの制約の数", buckets=MODEL_SIZE_BUCKETS)
+        self.pool_in_flight = r.gauge("beauty_scheduler_solver_pool_in_flight",
+                                      "実行中の求解数")
+        self.pool_queue_depth = r.gauge("beauty_scheduler_solver_pool_queue_depth",
+                                        "ワーカーの空きを待っている求解数")
+        self.pool_capacity = r.gauge("beauty_scheduler_solver_pool_capacity",
+                                     "求解ワーカープールの上限", ("kind",))
+        self.cache_events = r.counter("beauty_scheduler_result_cache_events_total",
+                                      "結果キャッシュのヒット（メモリ・ディスク別）・ミス・追い出しの数", ("event",))
+        self.cache_hit_ratio = r.gauge("beauty_scheduler_result_cache_hit_ratio",
+                                       "結果キャッシュのヒット率（ディスクからの復元を含む）")
+        self.cache_size = r.gauge("beauty_scheduler_result_cache_size",
+                                  "結果キャッシュの使用量", ("unit",))
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float):
+        self.requests.inc(route=route, method=method, status=str(status))
+        self.request_seconds.observe(seconds, route=route, method=method)
+
+    def observe_optimization(self, event: Dict):
+        """最適化器の phase_hook"""
+        if event["event"] == "phase":
+            self.phase_seconds.observe(event["wall_time"], phase=event["phase"])
+            self.phase_cpu_seconds.inc(event["cpu_time"], phase=event["phase"])
+            return
+        stats = event["solver_stats"]
+        if "cp_status" in stats:
+            # フォールバックした場合はCP-SATの結果として数える
+            engine, status = "cp", stats["cp_status"]
+            self.fallbacks.inc()
+        else:
+            engine, status = stats.get("engine", "cp"), event["status"]
+        self.solver_status.inc(engine=engine, status="timeout" if status == TIMEOUT_STATUS else status)
+        self.optimize_seconds.observe(stats.get("wall_time", 0.0))
+        if "model" in stats:
+            self.model_variables.observe(stats["model"]["variables"])
+            self.model_constraints.observe(stats["model"]["constraints"])
+
+    def watch_solver_pool(self, pool):
+        """SolverPool の状態を出力時に反映"""
+        def collect():
+            stats = pool.stats()
+            self.pool_in_flight.set(stats["in_flight"])
+            self.pool_queue_depth.set(stats["queue_depth"])
+            self.pool_capacity.set(stats["max_workers"], kind="workers")
+            self.pool_capacity.set(stats["max_queue"], kind="queue")
+        self.registry.add_collector(collect)
+
+    def watch_result_cache(self, cache):
+        """ResultCache の統計を出力時に反映"""
+        def collect():
+            stats = cache.stats()
+            # stats の hits はディスクからの復元を含むので、系列が重ならないよう分けて出す
+            events = {"memory_hits": stats["hits"] - stats["disk_hits"], "disk_hits": stats["disk_hits"],
+                      "misses": stats["misses"], "evictions": stats["evictions"]}
+            for event, total in events.items():
+                self.cache_events.sync(total, event=event)
+            lookups = stats["hits"] + stats["misses"]
+            self.cache_hit_ratio.set(stats["hits"] / lookups if lookups else 0.0)
+            self.cache_size.set(stats["entries"], unit="entries")
+            self.cache_size.set(stats["bytes"], unit="bytes")
+        self.registry.add_collector(collect)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def _route_label(path: str, template: str) -> str:
+    """リクエストのパスに対応するルートのテンプレート（include_router のプレフィックスを含む）"""
+    depth = template.count("/")
+    return path.rsplit("/", depth)[0] + template if depth else template
+
+
+def instrumented_route(metrics: SchedulerMetrics) -> Type[APIRoute]:
+    """リクエスト数と応答時間をルートのパスごとに記録する APIRoute"""
+
+    class InstrumentedRoute(APIRoute):
+        def get_route_handler(self):
+            handler = super().get_route_handler()
+
+            async def timed(request):
+                started = time_module.perf_counter()
+                status = 500
+                try:
+                    response = await handler(request)
+                    status = response.status_code
+                    return response
+                except HTTPException as e:
+                    status = e.status_code
+                    raise
+                except RequestValidationError:
+                    status = 422
+                    raise
+                finally:
+                    metrics.observe_request(_route_label(request.url.path, self.path_format),
+                                            request.method, status,
+                                            time_module.perf_counter() - started)
+            return timed
+
+    return InstrumentedRoute
@@ -1,14 +1,29 @@
+import asyncio
+import json
+import os
+import threading
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict
-from datetime import datetime, time
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Dict, Optional, Tuple
+from datetime import date, datetime, time
 from pydantic import BaseModel
 
 from ..models.staff import Staff, Skill, Availability, ServiceType, SkillLevel
-from ..models.booking import Booking, Service, Customer, Priority
-from ..models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives
-from ..optimizer.schedule_optimizer import BeautySchedulerOptimizer
+from ..models.booking import Booking, Service, Customer, Priority, EquipmentUsage
+from ..models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives, SolverConfig
+from ..optimizer.schedule_optimizer import BeautySchedulerOptimizer, MODES
+from ..optimizer.batch import BatchScheduleOptimizer
+from ..optimizer.cache import ResultCache, fingerprint
+from ..storage.repository import ScheduleRepository
+from .solver_pool import SolverPool, SolverPoolSaturated
+from .jobs import JobManager
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, SchedulerMetrics, instrumented_route
 
-router = APIRouter()
+# プロセス内のメトリクス（/metrics で Prometheus テキスト形式で出力）
+metrics = SchedulerMetrics()
+
+router = APIRouter(route_class=instrumented_route(metrics))
 
 # Pydanticモデル for API
 class StaffRequest(BaseModel):
@@ -25,21 +40,59 @@ class BookingRequest(BaseModel):
     scheduled_start: datetime
     priority: str = "NORMAL"
     preferred_staff_ids: List[str] = []
+    is_flexible_time: bool = False  # 時間調整可能か
+    latest_acceptable_start: Optional[datetime] = None  # 時間調整可能な場合の最遅開始
 
-class ScheduleOptimizationRequest(BaseModel):
-    schedule_date: datetime
+class SolverConfigRequest(BaseModel):
+    max_time_in_seconds: Optional[float] = None
+    num_search_workers: Optional[int] = None
+    relative_gap_limit: Optional[float] = None
+    random_seed: Optional[int] = None
+    log_search_progress: bool = False
+
+class OptimizationInputRequest(BaseModel):
     staff_ids: List[str] = []
     booking_ids: List[str] = []
+    formulation: str = "slot"  # "slot" または "interval"
+    solver: Optional[SolverConfigRequest] = None
+    mode: str = "cp"  # "cp" または "fast"（貪欲法のみ）
+    # 担当可能なスタッフの連結成分ごとに分割して並列求解（最小スタッフ数が0の場合のみ。
+    # APIの既定の制約では min_staff_count=2 なので1つのモデルで求解し、理由を返す）
+    decompose: bool = False
+    allow_partial: bool = False  # 割り当てられない予約を除き、優先度の高い予約から最大限割り当てる
+
+class ScheduleOptimizationRequest(OptimizationInputRequest):
+    schedule_date: datetime
+    previous_schedule: List[Dict] = []  # 前回の最適化結果の schedule（ウォームスタート用）
+    now: Optional[datetime] = None  # 指定すると増分モード（確定済み予約を固定し、以降のみ再最適化）
+
+class BatchOptimizationRequest(OptimizationInputRequest):
+    start_date: datetime
+    end_date: datetime  # この日を含む
+
+# スタッフ・予約の永続化（BEAUTY_SCHEDULER_DATABASE_URL、既定はSQLiteファイル）
+repository = ScheduleRepository.from_env()
 
-# 仮想データストレージ（本来はデータベース）
-staff_db: Dict[str, Staff] = {}
-booking_db: Dict[str, Booking] = {}
+# サーバー側のソルバー設定上限（リクエストの指定はこの範囲に丸める）
+SOLVER_CONFIG_LIMITS = SolverConfig(
+    max_time_in_seconds=float(os.environ.get("BEAUTY_SCHEDULER_MAX_SOLVE_SECONDS", "60")),
+    num_search_workers=int(os.environ.get("BEAUTY_SCHEDULER_MAX_SEARCH_WORKERS", str(os.cpu_count() or 1))),
+    log_search_progress=False
+)
+
+# 求解はイベントループ外の上限付きワーカープールで実行
+solver_pool = SolverPool.from_env()
+job_manager = JobManager(solver_pool)
+# 同じ入力の最適化結果を再利用するキャッシュ
+result_cache = ResultCache.from_env()
+metrics.watch_solver_pool(solver_pool)
+metrics.watch_result_cache(result_cache)
+# バッチ最適化で同時に求解する日数
+BATCH_MAX_WORKERS = int(os.environ.get("BEAUTY_SCHEDULER_BATCH_WORKERS", str(os.cpu_count() or 1)))
 
 @router.post("/staff/", response_model=Dict[str, str])
-async def create_staff(staff_request: StaffRequest):
+def create_staff(staff_request: StaffRequest):
     """スタッフを作成"""
-    staff_id = f"staff_{len(staff_db) + 1}"
-    
     skills = []
     for skill_data in staff_request.skills:
         skill = Skill(
@@ -60,7 +113,7 @@ async def create_staff(staff_request: StaffRequest):
         availability.append(avail)
     
     staff = Staff(
-        id=staff_id,
+        id="",  # 保存時に採番
         name=staff_request.name,
         skills=skills,
         availability=availability,
@@ -68,11 +121,11 @@ async def create_staff(staff_request: StaffRequest):
         max_hours_per_day=staff_request.max_hours_per_day
     )
     
-    staff_db[staff_id] = staff
-    return {"staff_id": staff_id, "message": "スタッフが正常に作成されました"}
+    staff = repository.add_staff(staff)
+    return {"staff_id": staff.id, "message": "スタッフが正常に作成されました"}
 
 @router.get("/staff/", response_model=List[Dict])
-async def get_all_staff():
+def get_all_staff():
     """全スタッフを取得"""
     return [
         {
@@ -81,16 +134,16 @@ async def get_all_staff():
             "skills": [{"service_type": s.service_type.value, "level": s.level.value} for s in staff.skills],
             "hourly_rate": staff.hourly_rate
         }
-        for staff in staff_db.values()
+        for staff in repository.list_staff()
     ]
 
 @router.get("/staff/{staff_id}", response_model=Dict)
-async def get_staff(staff_id: str):
+def get_staff(staff_id: str):
     """特定のスタッフを取得"""
-    if staff_id not in staff_db:
+    staff = repository.get_staff(staff_id)
+    if staff is None:
         raise HTTPException(status_code=404, detail="スタッフが見つかりません")
     
-    staff = staff_db[staff_id]
     return {
         "id": staff.id,
         "name": staff.name,
@@ -109,13 +162,10 @@ async def get_staff(staff_id: str):
     }
 
 @router.post("/bookings/", response_model=Dict[str, str])
-async def create_booking(booking_request: BookingRequest):
+def create_booking(booking_request: BookingRequest):
     """予約を作成"""
-    booking_id = f"booking_{len(booking_db) + 1}"
-    customer_id = f"customer_{len(booking_db) + 1}"
-    
     customer = Customer(
-        id=customer_id,
+        id="",  # 保存時に採番
         name=booking_request.customer_name,
         phone=booking_request.customer_phone,
         email="",  # メール未実装
@@ -129,23 +179,32 @@ async def create_booking(booking_request: BookingRequest):
             service_type=ServiceType(service_data["service_type"]),
             duration_minutes=service_data["duration_minutes"],
             required_skill_level=SkillLevel(service_data["required_skill_level"]),
-            price=service_data["price"]
+            price=service_data["price"],
+            equipment=[EquipmentUsage(**usage) for usage in service_data.get("equipment", [])]
         )
         services.append(service)
     
     booking = Booking(
-        id=booking_id,
+        id="",  # 保存時に採番
         customer=customer,
         services=services,
-        scheduled_start=booking_request.scheduled_start
+        scheduled_start=booking_request.scheduled_start,
+        is_flexible_time=booking_request.is_flexible_time,
+        latest_acceptable_start=booking_request.latest_acceptable_start
     )
     
-    booking_db[booking_id] = booking
-    return {"booking_id": booking_id, "message": "予約が正常に作成されました"}
+    booking = repository.add_booking(booking)
+    return {"booking_id": booking.id, "message": "予約が正常に作成されました"}
 
 @router.get("/bookings/", response_model=List[Dict])
-async def get_all_bookings():
-    """全予約を取得"""
+def get_all_bookings(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                           staff_id: Optional[str] = None):
+    """予約を取得（期間・担当スタッフで絞り込み可能）
+    
+    start_date / end_date（両端を含む）を指定すると、その期間に開始できる予約だけを返す。
+    """
+    if start_date is not None and end_date is not None and end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date は start_date 以降である必要があります")
     return [
         {
             "id": booking.id,
@@ -155,71 +214,238 @@ async def get_all_bookings():
             "status": booking.status.value,
             "assigned_staff_id": booking.assigned_staff_id
         }
-        for booking in booking_db.values()
+        for booking in repository.find_bookings(start_date, end_date, staff_id)
     ]
 
+@router.delete("/staff/{staff_id}", response_model=Dict[str, str])
+def delete_staff(staff_id: str):
+    """スタッフを削除"""
+    if not repository.delete_staff(staff_id):
+        raise HTTPException(status_code=404, detail="スタッフが見つかりません")
+    return {"staff_id": staff_id, "message": "スタッフを削除しました"}
+
+@router.delete("/bookings/{booking_id}", response_model=Dict[str, str])
+def delete_booking(booking_id: str):
+    """予約を削除"""
+    if not repository.delete_booking(booking_id):
+        raise HTTPException(status_code=404, detail="予約が見つかりません")
+    return {"booking_id": booking_id, "message": "予約を削除しました"}
+
+def _build_optimizer(request: OptimizationInputRequest) -> BeautySchedulerOptimizer:
+    """リクエストから最適化器を作成"""
+    # 制約条件の設定
+    salon_constraints = SalonConstraints(
+        operating_hours={
+            0: (time(9, 0), time(18, 0)),  # 月曜日
+            1: (time(9, 0), time(18, 0)),  # 火曜日
+            2: (time(9, 0), time(18, 0)),  # 水曜日
+            3: (time(9, 0), time(18, 0)),  # 木曜日
+            4: (time(9, 0), time(19, 0)),  # 金曜日
+            5: (time(8, 0), time(17, 0)),  # 土曜日
+            6: (time(10, 0), time(16, 0)), # 日曜日
+        },
+        max_staff_count=5,
+        min_staff_count=2
+    )
+    
+    scheduling_constraints = SchedulingConstraints()
+    objectives = OptimizationObjectives()
+    objectives.normalize_weights()
+    
+    try:
+        requested = SolverConfig(**request.solver.model_dump()) if request.solver else SolverConfig()
+        return BeautySchedulerOptimizer(
+            salon_constraints, scheduling_constraints, objectives,
+            formulation=request.formulation,
+            decompose=request.decompose,
+            solver_config=requested.capped(SOLVER_CONFIG_LIMITS),
+            phase_hook=metrics.observe_optimization
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _select_inputs(request: OptimizationInputRequest, days: Tuple[date, date]):
+    """最適化対象のスタッフと予約のリストを取得
+    
+    予約IDの指定がなければ、対象期間 days（両端を含む）の予約だけを読み込む。
+    リポジトリは同期APIなので、非同期のハンドラからは run_in_threadpool で呼び出す。
+    """
+    staff_list = repository.list_staff(request.staff_ids or None)
+    booking_list = (repository.list_bookings(request.booking_ids) if request.booking_ids
+                    else repository.bookings_between(*days))
+    
+    if not staff_list:
+        raise HTTPException(status_code=400, detail="有効なスタッフが見つかりません")
+    
+    if not booking_list:
+        raise HTTPException(status_code=400, detail="有効な予約が見つかりません")
+    
+    return staff_list, booking_list
+
 @router.post("/optimize-schedule/", response_model=Dict)
 async def optimize_schedule(request: ScheduleOptimizationRequest):
     """スケジュールを最適化"""
     try:
-        # 制約条件の設定
-        salon_constraints = SalonConstraints(
-            operating_hours={
-                0: (time(9, 0), time(18, 0)),  # 月曜日
-                1: (time(9, 0), time(18, 0)),  # 火曜日
-                2: (time(9, 0), time(18, 0)),  # 水曜日
-                3: (time(9, 0), time(18, 0)),  # 木曜日
-                4: (time(9, 0), time(19, 0)),  # 金曜日
-                5: (time(8, 0), time(17, 0)),  # 土曜日
-                6: (time(10, 0), time(16, 0)), # 日曜日
-            },
-            max_staff_count=5,
-            min_staff_count=2
-        )
-        
-        scheduling_constraints = SchedulingConstraints()
-        objectives = OptimizationObjectives()
-        objectives.normalize_weights()
+        optimizer = _build_optimizer(request)
+        staff_list, booking_list = await run_in_threadpool(_select_inputs, request,
+                                                           _schedule_day(request))
+        options = _optimize_options(request)
         
-        # 最適化器の初期化
-        optimizer = BeautySchedulerOptimizer(
-            salon_constraints, scheduling_constraints, objectives
-        )
+        # 同じ入力の結果があれば求解しない
+        key = fingerprint(optimizer, staff_list, booking_list, request.schedule_date, **options)
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
         
-        # スタッフと予約のリストを取得
-        staff_list = list(staff_db.values()) if not request.staff_ids else [
-            staff_db[sid] for sid in request.staff_ids if sid in staff_db
-        ]
-        
-        booking_list = list(booking_db.values()) if not request.booking_ids else [
-            booking_db[bid] for bid in request.booking_ids if bid in booking_db
-        ]
-        
-        if not staff_list:
-            raise HTTPException(status_code=400, detail="有効なスタッフが見つかりません")
-        
-        if not booking_list:
-            raise HTTPException(status_code=400, detail="有効な予約が見つかりません")
-        
-        # 最適化実行
-        result = optimizer.optimize_schedule(staff_list, booking_list, request.schedule_date)
+        # 最適化実行（ワーカープールが満杯なら503）
+        try:
+            result = await solver_pool.run(
+                optimizer.optimize_schedule, staff_list, booking_list, request.schedule_date,
+                **options
+            )
+        except SolverPoolSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
         
+        result_cache.put(key, result)
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"最適化エラー: {str(e)}")
 
+def _schedule_day(request: ScheduleOptimizationRequest) -> Tuple[date, date]:
+    day = request.schedule_date.date()
+    return day, day
+
+def _validated_mode(request: OptimizationInputRequest) -> str:
+    if request.mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"未対応の求解モードです: {request.mode}")
+    return request.mode
+
+def _optimize_options(request: ScheduleOptimizationRequest) -> Dict:
+    """optimize_schedule に渡す追加オプション"""
+    return {"previous_schedule": request.previous_schedule or None, "now": request.now,
+            "mode": _validated_mode(request), "allow_partial": request.allow_partial}
+
+def _sse_event(event: str, payload: Dict) -> str:
+    """Server-Sent Events 形式のメッセージを作成"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/optimize-schedule/batch", response_model=Dict)
+async def optimize_schedule_batch(request: BatchOptimizationRequest):
+    """期間内のスケジュールを日ごとに並列で最適化"""
+    optimizer = _build_optimizer(request)
+    staff_list, booking_list = await run_in_threadpool(
+        _select_inputs, request, (request.start_date.date(), request.end_date.date()))
+    mode = _validated_mode(request)
+    if request.end_date.date() < request.start_date.date():
+        raise HTTPException(status_code=400, detail="end_date は start_date 以降である必要があります")
+    
+    batch = BatchScheduleOptimizer(optimizer, max_workers=BATCH_MAX_WORKERS)
+    try:
+        return await solver_pool.run(batch.optimize_range, staff_list, booking_list,
+                                     request.start_date, request.end_date, mode=mode,
+                                     allow_partial=request.allow_partial)
+    except SolverPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+@router.post("/optimize-schedule/stream")
+async def stream_optimize_schedule(request: ScheduleOptimizationRequest):
+    """探索中の改善解を Server-Sent Events で配信
+    
+    改善解ごとに solution イベント（schedule・目的関数値・上界）を送り、
+    最後に result イベントで最終結果を送る。クライアントが切断すると探索を停止する。
+    """
+    optimizer = _build_optimizer(request)
+    staff_list, booking_list = await run_in_threadpool(_select_inputs, request,
+                                                       _schedule_day(request))
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    stop_event = threading.Event()
+    
+    def on_solution(progress: Dict):
+        loop.call_soon_threadsafe(events.put_nowait, ("solution", progress))
+    
+    try:
+        future = solver_pool.submit(
+            optimizer.optimize_schedule, staff_list, booking_list, request.schedule_date,
+            on_solution=on_solution, stop_event=stop_event, **_optimize_options(request)
+        )
+    except SolverPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, ("done", None)))
+    
+    async def event_stream():
+        try:
+            while True:
+                kind, payload = await events.get()
+                if kind == "solution":
+                    yield _sse_event("solution", payload)
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield _sse_event("error", {"detail": f"最適化エラー: {str(e)}"})
+                else:
+                    yield _sse_event("result", result)
+                return
+        finally:
+            if not future.done():
+                optimizer.request_stop(stop_event)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@router.post("/optimize-jobs/", response_model=Dict, status_code=202)
+def create_optimization_job(request: ScheduleOptimizationRequest):
+    """最適化ジョブを投入してジョブIDを返す"""
+    optimizer = _build_optimizer(request)
+    staff_list, booking_list = _select_inputs(request, _schedule_day(request))
+    
+    try:
+        job = job_manager.submit(optimizer, staff_list, booking_list, request.schedule_date,
+                                 **_optimize_options(request))
+    except SolverPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    
+    return {"job_id": job.id, "status": job.status.value}
+
+@router.get("/optimize-jobs/{job_id}", response_model=Dict)
+async def get_optimization_job(job_id: str):
+    """最適化ジョブの状態・途中経過・結果を取得"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job.to_dict()
+
+@router.post("/optimize-jobs/{job_id}/cancel", response_model=Dict)
+async def cancel_optimization_job(job_id: str):
+    """最適化ジョブをキャンセル"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job.to_dict()
+
 @router.get("/health")
 async def health_check():
     """ヘルスチェック"""
     return {"status": "healthy", "message": "Beauty Scheduler API is running"}
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus テキスト形式のメトリクス"""
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @router.get("/stats")
-async def get_stats():
+def get_stats():
     """統計情報を取得"""
     return {
-        "total_staff": len(staff_db),
-        "total_bookings": len(booking_db),
+        "total_staff": repository.count_staff(),
+        "total_bookings": repository.count_bookings(),
+        "solver_pool": solver_pool.stats(),
+        "result_cache": result_cache.stats(),
         "service_types": [service_type.value for service_type in ServiceType],
         "skill_levels": [skill_level.value for skill_level in SkillLevel]
     }
\ No newline at end of file
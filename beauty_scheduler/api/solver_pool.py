@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+class SolverPoolSaturated(Exception):
+    """実行中・待機中の求解数が上限に達している"""
+
+
+class SolverPool:
+    """CP-SAT求解用の上限付きワーカープール
+
+    CP-SATは求解中にGILを解放するため、スレッドプールでイベントループを
+    ブロックせずに並行実行できる。同時実行数 (max_workers) と待機数
+    (max_queue) を超える投入は SolverPoolSaturated で即座に拒否する。
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8):
+        if max_workers < 1:
+            raise ValueError("max_workers は1以上である必要があります")
+        if max_queue < 0:
+            raise ValueError("max_queue は0以上である必要があります")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="solver")
+        self._lock = threading.Lock()
+        self._pending = 0  # 実行中 + 待機中
+        self._in_flight = 0  # 実行中
+
+    @classmethod
+    def from_env(cls) -> "SolverPool":
+        """環境変数から設定を読み込んで作成"""
+        return cls(
+            max_workers=int(os.environ.get("BEAUTY_SCHEDULER_SOLVER_WORKERS", "2")),
+            max_queue=int(os.environ.get("BEAUTY_SCHEDULER_SOLVER_QUEUE", "8")),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending - self._in_flight
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """求解を投入（満杯なら SolverPoolSaturated）"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise SolverPoolSaturated("求解ワーカーが混み合っています")
+            self._pending += 1
+
+        def run():
+            with self._lock:
+                self._in_flight += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._pending -= 1
+
+        try:
+            return self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """イベントループをブロックせずに求解結果を待つ"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
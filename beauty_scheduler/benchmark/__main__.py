@@ -0,0 +1,46 @@
+"""最適化エンジンのベンチマーク
+
+例:
+    python -m beauty_scheduler.benchmark --sizes small medium --json bench.json
+    python -m beauty_scheduler.benchmark --baseline bench.json --threshold 1.25
+回帰が見つかると終了コード1で終了する。
+"""
+import argparse
+import sys
+
+from .runner import (DEFAULT_MIN_DELTA, DEFAULT_THRESHOLD, compare, default_cases, format_table,
+                     load_json, run_suite, write_csv, write_json)
+from .workload import SIZES
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m beauty_scheduler.benchmark",
+                                     description="合成データで最適化エンジンの各フェーズを計測")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small", "medium"])
+    parser.add_argument("--formulations", nargs="+", choices=["slot", "interval"], default=["slot"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=10.0, help="1回の求解時間の上限（秒）")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    parser.add_argument("--csv", help="結果をCSVで保存するパス")
+    parser.add_argument("--baseline", help="比較する基準のJSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA)
+    args = parser.parse_args(argv)
+
+    cases = default_cases(args.sizes, args.formulations, seed=args.seed, time_limit=args.time_limit)
+    report = run_suite(cases, repeats=args.repeats)
+    if args.json:
+        write_json(report, args.json)
+    if args.csv:
+        write_csv(report, args.csv)
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(load_json(args.baseline), report, args.threshold, args.min_delta)
+    print(format_table(report, regressions))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
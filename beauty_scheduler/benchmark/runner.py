@@ -0,0 +1,195 @@
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time as time_module
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from ortools import __version__ as ortools_version
+
+from ..models.constraints import SolverConfig
+from ..optimizer.schedule_optimizer import PHASES as OPTIMIZER_PHASES
+from ..optimizer.schedule_optimizer import BeautySchedulerOptimizer, MODE_CP
+from .workload import SIZES, WorkloadConfig, generate_workload
+
+# 回帰判定の既定値: 基準の1.25倍を超え、かつ差が0.05秒を超えたら回帰
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_MIN_DELTA = 0.05
+
+# 計測対象外の時間（レスポンスの組み立てなど）をまとめるフェーズ
+OTHER_PHASE = "other"
+PHASES = OPTIMIZER_PHASES + (OTHER_PHASE,)
+
+
+@dataclass
+class BenchmarkCase:
+    """1つの計測条件（生成する入力と最適化器の設定）"""
+    name: str
+    workload: WorkloadConfig
+    formulation: str = "slot"
+    mode: str = MODE_CP
+    decompose: bool = False
+    solver_config: SolverConfig = field(default_factory=lambda: SolverConfig(
+        max_time_in_seconds=10.0, num_search_workers=8, random_seed=0))
+
+
+def default_cases(sizes: Iterable[str] = tuple(SIZES), formulations: Iterable[str] = ("slot",),
+                  seed: int = 0, time_limit: float = 10.0) -> List[BenchmarkCase]:
+    """プリセットの規模 × 定式化の計測条件"""
+    return [
+        BenchmarkCase(
+            name=f"{size}-{formulation}",
+            workload=replace(SIZES[size], seed=seed),
+            formulation=formulation,
+            solver_config=SolverConfig(max_time_in_seconds=time_limit, num_search_workers=8,
+                                       random_seed=0),
+        )
+        for size in sizes
+        for formulation in formulations
+    ]
+
+
+def run_case(case: BenchmarkCase, repeats: int = 3) -> Dict:
+    """1つの条件を repeats 回計測し、全体とフェーズごとの中央値を返す
+
+    フェーズごとの時間は最適化器が solver_stats["phases"] に記録する経過時間で、
+    全体から記録済みのフェーズを引いた残りを other とする。
+    """
+    workload = generate_workload(case.workload)
+    optimizer = BeautySchedulerOptimizer(
+        workload.salon_constraints, workload.scheduling_constraints, workload.objectives,
+        formulation=case.formulation, solver_config=case.solver_config, decompose=case.decompose)
+
+    totals: List[float] = []
+    phases: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    result: Dict = {}
+    for _ in range(max(1, repeats)):
+        started = time_module.perf_counter()
+        result = optimizer.optimize_schedule(workload.staff, workload.bookings,
+                                             workload.config.schedule_date, mode=case.mode)
+        total = time_module.perf_counter() - started
+        totals.append(total)
+        recorded = result.get("solver_stats", {}).get("phases", {})
+        seconds = {phase: recorded.get(phase, {}).get("wall_time", 0.0) for phase in OPTIMIZER_PHASES}
+        seconds[OTHER_PHASE] = max(0.0, total - sum(seconds.values()))
+        for phase, value in seconds.items():
+            phases[phase].append(value)
+
+    return {
+        "name": case.name,
+        "formulation": case.formulation,
+        "mode": case.mode,
+        "decompose": case.decompose,
+        "seed": case.workload.seed,
+        "staff": len(workload.staff),
+        "bookings": len(workload.bookings),
+        "repeats": len(totals),
+        "status": result.get("status"),
+        "fallback": result.get("fallback", False),
+        "scheduled": len(result.get("schedule", [])),
+        "objective_value": result.get("solver_stats", {}).get("objective_value"),
+        "variables": result.get("solver_stats", {}).get("model", {}).get("variables"),
+        "constraints": result.get("solver_stats", {}).get("model", {}).get("constraints"),
+        "total_time": statistics.median(totals),
+        "phases": {phase: statistics.median(values) for phase, values in phases.items()},
+    }
+
+
+def run_suite(cases: List[BenchmarkCase], repeats: int = 3) -> Dict:
+    """全条件を計測して、実行環境の情報と合わせたレポートを返す"""
+    return {"metadata": _metadata(), "results": [run_case(case, repeats) for case in cases]}
+
+
+def _metadata() -> Dict:
+    """コミット間で比較するための実行環境の情報"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "ortools": ortools_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_json(report: Dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load_json(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_csv(report: Dict, path: str):
+    """1条件1行のCSV（フェーズは phase_<名前> 列）"""
+    columns = ["name", "formulation", "mode", "decompose", "seed", "staff", "bookings", "repeats",
+               "status", "fallback", "scheduled", "objective_value", "variables", "constraints",
+               "total_time"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + [f"phase_{phase}" for phase in PHASES])
+        for result in report["results"]:
+            writer.writerow([result[column] for column in columns]
+                            + [result["phases"].get(phase, 0.0) for phase in PHASES])
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD,
+            min_delta: float = DEFAULT_MIN_DELTA) -> List[Dict]:
+    """基準レポートに対する回帰の一覧
+
+    同じ名前の条件について、全体・各フェーズの時間が基準の threshold 倍を超え、
+    かつ差が min_delta 秒を超えたもの、割り当て数が減ったものを回帰とする。
+    """
+    previous = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = previous.get(result["name"])
+        if base is None:
+            continue
+        timings = [("total_time", base["total_time"], result["total_time"])]
+        timings += [(f"phase.{phase}", base["phases"].get(phase, 0.0), seconds)
+                    for phase, seconds in result["phases"].items()]
+        for metric, before, after in timings:
+            if after > before * threshold and after - before > min_delta:
+                regressions.append(_regression(result["name"], metric, before, after))
+        if result["scheduled"] < base["scheduled"]:
+            regressions.append(_regression(result["name"], "scheduled",
+                                           base["scheduled"], result["scheduled"]))
+    return regressions
+
+
+def _regression(name: str, metric: str, before: float, after: float) -> Dict:
+    return {
+        "name": name,
+        "metric": metric,
+        "baseline": before,
+        "current": after,
+        "ratio": after / before if before else None,
+    }
+
+
+def format_table(report: Dict, regressions: Optional[List[Dict]] = None) -> str:
+    """結果と回帰の一覧をテキストの表にする"""
+    lines = [f"{'case':<20} {'staff':>5} {'bookings':>8} {'status':<10} {'scheduled':>9} "
+             f"{'total[s]':>9} {'solve[s]':>9} {'build[s]':>9}"]
+    for result in report["results"]:
+        phases = result["phases"]
+        build = result["total_time"] - phases.get("solve", 0.0)
+        lines.append(f"{result['name']:<20} {result['staff']:>5} {result['bookings']:>8} "
+                     f"{result['status'] or '-':<10} {result['scheduled']:>9} "
+                     f"{result['total_time']:>9.3f} {phases.get('solve', 0.0):>9.3f} {build:>9.3f}")
+    for regression in regressions or []:
+        lines.append(f"REGRESSION {regression['name']} {regression['metric']}: "
+                     f"{regression['baseline']} -> {regression['current']}")
+    return "\n".join(lines)
@@ -0,0 +1,213 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from ..models.staff import Staff, Skill, Availability, ServiceType, SkillLevel
+from ..models.booking import Booking, Service, Customer, Priority
+from ..models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives
+from ..optimizer.schedule_optimizer import SLOT_MINUTES
+
+# 勤務可能時間のパターン
+AVAILABILITY_FULL = "full"  # 全員が営業時間いっぱい
+AVAILABILITY_STAGGERED = "staggered"  # 早番・遅番
+AVAILABILITY_PART_TIME = "part_time"  # 半数が4〜6時間のパートタイム
+AVAILABILITY_PATTERNS = (AVAILABILITY_FULL, AVAILABILITY_STAGGERED, AVAILABILITY_PART_TIME)
+
+# スタッフがそのサービスのスキルを持つ確率
+DEFAULT_SKILL_MIX = {
+    ServiceType.CUT.value: 0.9,
+    ServiceType.COLOR.value: 0.6,
+    ServiceType.PERM.value: 0.3,
+    ServiceType.TREATMENT.value: 0.5,
+    ServiceType.STYLING.value: 0.5,
+    ServiceType.FACIAL.value: 0.15,
+}
+
+
+@dataclass
+class WorkloadConfig:
+    """合成サロンの規模と構成（seed が同じなら同じ入力を生成する）"""
+    staff_count: int = 10
+    bookings_per_staff: float = 3.0  # 予約密度（スタッフ1人あたりの予約数）
+    skill_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_SKILL_MIX))
+    availability_pattern: str = AVAILABILITY_FULL
+    service_durations: Tuple[int, ...] = (30, 45, 60, 90, 120)  # サービス時間（分）の候補
+    max_services_per_booking: int = 2
+    vip_ratio: float = 0.1
+    flexible_ratio: float = 0.3  # 時間調整可能な予約の割合
+    preferred_staff_ratio: float = 0.3  # 希望スタッフがいる予約の割合
+    overbooking_ratio: float = 0.0  # 割り当て可能かを考えずに置く予約の割合
+    opening: time = time(9, 0)
+    closing: time = time(19, 0)
+    schedule_date: datetime = datetime(2024, 1, 16)
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.availability_pattern not in AVAILABILITY_PATTERNS:
+            raise ValueError(f"未対応の勤務パターンです: {self.availability_pattern}")
+
+
+@dataclass
+class Workload:
+    """生成した最適化入力"""
+    config: WorkloadConfig
+    staff: List[Staff]
+    bookings: List[Booking]
+    salon_constraints: SalonConstraints
+    scheduling_constraints: SchedulingConstraints
+    objectives: OptimizationObjectives
+
+
+# 担当予定の予約の間に空ける時間（休憩と連続勤務時間の制限を満たせるように）
+BREAK_GAP_MINUTES = 30
+
+# 規模別のプリセット
+SIZES: Dict[str, WorkloadConfig] = {
+    "small": WorkloadConfig(staff_count=4, bookings_per_staff=3.0),
+    "medium": WorkloadConfig(staff_count=10, bookings_per_staff=3.0,
+                             availability_pattern=AVAILABILITY_STAGGERED),
+    "large": WorkloadConfig(staff_count=30, bookings_per_staff=2.5,
+                            availability_pattern=AVAILABILITY_PART_TIME),
+}
+
+
+def generate_workload(config: WorkloadConfig) -> Workload:
+    """設定に従ってスタッフ・予約・制約を生成
+
+    各予約は担当予定のスタッフを1人選び、そのスタッフのスキルで施術でき、勤務可能時間・
+    昼休み・既に生成した予約と重ならない時刻に置く（少なくとも1つの割り当てが存在する）。
+    overbooking_ratio の割合の予約はこの条件を無視して置く。
+    """
+    rng = random.Random(config.seed)
+    staff = [_generate_staff(rng, config, index) for index in range(config.staff_count)]
+    salon_constraints = SalonConstraints(
+        operating_hours={day: (config.opening, config.closing) for day in range(7)},
+        max_staff_count=config.staff_count,
+        min_staff_count=min(2, config.staff_count),
+    )
+    lunch_start = _minutes(salon_constraints.lunch_break_start)
+    lunch = (lunch_start, lunch_start + int(salon_constraints.lunch_break_duration.total_seconds() // 60))
+    busy: Dict[str, List[Tuple[int, int]]] = {s.id: [] for s in staff}
+
+    booking_count = round(config.staff_count * config.bookings_per_staff)
+    bookings = [_generate_booking(rng, config, index, staff, busy, lunch)
+                for index in range(booking_count)]
+
+    objectives = OptimizationObjectives()
+    objectives.normalize_weights()
+    return Workload(config, staff, bookings, salon_constraints, SchedulingConstraints(), objectives)
+
+
+def _minutes(moment: time) -> int:
+    return moment.hour * 60 + moment.minute
+
+
+def _at(config: WorkloadConfig, minutes: int) -> datetime:
+    return datetime.combine(config.schedule_date.date(), time()) + timedelta(minutes=minutes)
+
+
+def _planned_shift(staff: Staff) -> Tuple[int, int]:
+    """担当予定の予約を置く範囲（勤務可能時間の先頭から max_hours_per_day まで）"""
+    start, end = (_minutes(staff.availability[0].start_time),
+                  _minutes(staff.availability[0].end_time))
+    return start, min(end, start + staff.max_hours_per_day * 60)
+
+
+def _generate_staff(rng: random.Random, config: WorkloadConfig, index: int) -> Staff:
+    skills = [
+        Skill(ServiceType(service_type), SkillLevel(rng.randint(1, 4)),
+              years_experience=rng.randint(0, 15))
+        for service_type, probability in sorted(config.skill_mix.items())
+        if rng.random() < probability
+    ]
+    if not skills:
+        skills = [Skill(ServiceType.CUT, SkillLevel(rng.randint(1, 4)))]
+
+    opening, closing = _minutes(config.opening), _minutes(config.closing)
+    if config.availability_pattern == AVAILABILITY_STAGGERED:
+        # 早番は開店から、遅番は閉店までの8時間（営業時間が短ければ全体）
+        length = min(8 * 60, closing - opening)
+        start = opening if index % 2 == 0 else closing - length
+        end = start + length
+    elif config.availability_pattern == AVAILABILITY_PART_TIME and index % 2 == 1:
+        length = min(rng.choice((4, 5, 6)) * 60, closing - opening)
+        start = opening + rng.randrange(0, closing - opening - length + 1, SLOT_MINUTES)
+        end = start + length
+    else:
+        start, end = opening, closing
+    window = Availability(config.schedule_date.weekday(), _at(config, start).time(),
+                          _at(config, end).time(), True)
+
+    return Staff(
+        id=f"staff_{index:03d}",
+        name=f"スタッフ{index:03d}",
+        skills=skills,
+        availability=[window],
+        hourly_rate=rng.choice((1500, 1800, 2200, 2500, 3000, 3500)),
+        max_hours_per_day=8,
+    )
+
+
+def _generate_services(rng: random.Random, config: WorkloadConfig, staff: Staff) -> List[Service]:
+    """担当予定のスタッフが施術できるサービス"""
+    count = rng.randint(1, max(1, config.max_services_per_booking))
+    services = []
+    for skill in rng.sample(staff.skills, min(count, len(staff.skills))):
+        services.append(Service(skill.service_type, rng.choice(config.service_durations),
+                                SkillLevel(rng.randint(1, min(3, skill.level.value))),
+                                rng.choice((3000, 5000, 8000, 12000))))
+    return services
+
+
+def _free_starts(shift: Tuple[int, int], duration: int, busy: List[Tuple[int, int]],
+                 lunch: Tuple[int, int]) -> List[int]:
+    """予定シフト内で昼休みと重ならず、既存の予約と休憩分（BREAK_GAP_MINUTES）離れた開始時刻（分）"""
+    def clear(start: int) -> bool:
+        if start < lunch[1] and start + duration > lunch[0]:
+            return False
+        return all(start + duration + BREAK_GAP_MINUTES <= b_start
+                   or start >= b_end + BREAK_GAP_MINUTES for b_start, b_end in busy)
+    return [start for start in range(shift[0], shift[1] - duration + 1, SLOT_MINUTES) if clear(start)]
+
+
+def _generate_booking(rng: random.Random, config: WorkloadConfig, index: int, staff: List[Staff],
+                      busy: Dict[str, List[Tuple[int, int]]], lunch: Tuple[int, int]) -> Booking:
+    opening, closing = _minutes(config.opening), _minutes(config.closing)
+    overbooked = rng.random() < config.overbooking_ratio
+    services: List[Service] = []
+    start = None
+    for member in rng.sample(staff, len(staff)):
+        services = _generate_services(rng, config, member)
+        duration = sum(service.total_minutes for service in services)
+        if overbooked:
+            break
+        starts = _free_starts(_planned_shift(member), duration, busy[member.id], lunch)
+        if starts:
+            start = rng.choice(starts)
+            busy[member.id].append((start, start + duration))
+            break
+    total = sum(service.total_minutes for service in services)
+    latest = max(opening, closing - total)
+    if start is None:
+        start = opening + rng.randrange(0, latest - opening + 1, SLOT_MINUTES)
+    flexible = rng.random() < config.flexible_ratio
+
+    customer = Customer(
+        id=f"customer_{index:04d}",
+        name=f"顧客{index:04d}",
+        phone="",
+        email="",
+        priority=Priority.VIP if rng.random() < config.vip_ratio else rng.choice(
+            (Priority.LOW, Priority.NORMAL, Priority.NORMAL, Priority.HIGH)),
+        preferred_staff_ids=([rng.choice(staff).id]
+                             if staff and rng.random() < config.preferred_staff_ratio else []),
+    )
+    return Booking(
+        id=f"booking_{index:04d}",
+        customer=customer,
+        services=services,
+        scheduled_start=_at(config, start),
+        is_flexible_time=flexible,
+        latest_acceptable_start=_at(config, max(start, min(start + 120, latest))) if flexible else None,
+    )
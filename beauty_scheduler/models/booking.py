@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from enum import Enum
 from .staff import ServiceType, SkillLevel
 
@@ -17,6 +17,13 @@ class Priority(Enum):
     HIGH = 3
     VIP = 4
 
+@dataclass
+class EquipmentUsage:
+    """サービスが占有する設備（ステーション）と占有時間帯"""
+    station: str  # SalonConstraints.equipment_constraints のキー
+    offset_minutes: int = 0  # サービス開始（準備時間を含む）からの開始オフセット
+    duration_minutes: Optional[int] = None  # 占有時間（Noneはサービス終了まで）
+
 @dataclass
 class Service:
     service_type: ServiceType
@@ -25,6 +32,15 @@ class Service:
     price: float
     setup_time_minutes: int = 0  # 準備時間
     cleanup_time_minutes: int = 0  # 片付け時間
+    equipment: List[EquipmentUsage] = None  # 占有する設備
+    
+    def __post_init__(self):
+        if self.equipment is None:
+            self.equipment = []
+    
+    @property
+    def total_minutes(self) -> int:
+        return self.duration_minutes + self.setup_time_minutes + self.cleanup_time_minutes
 
 @dataclass
 class Customer:
@@ -54,16 +70,26 @@ class Booking:
     
     @property
     def total_duration(self) -> timedelta:
-        total_minutes = sum(
-            service.duration_minutes + service.setup_time_minutes + service.cleanup_time_minutes
-            for service in self.services
-        )
+        total_minutes = sum(service.total_minutes for service in self.services)
         return timedelta(minutes=total_minutes)
     
     @property
     def estimated_end_time(self) -> datetime:
         return self.scheduled_start + self.total_duration
     
+    def equipment_usage(self) -> List[Tuple[str, int, int]]:
+        """予約開始からの (設備, 開始オフセット分, 占有分) のリスト（サービスは順に実施）"""
+        usage = []
+        service_start = 0
+        for service in self.services:
+            for item in service.equipment:
+                remaining = service.total_minutes - item.offset_minutes
+                minutes = remaining if item.duration_minutes is None else min(item.duration_minutes, remaining)
+                if minutes > 0:
+                    usage.append((item.station, service_start + item.offset_minutes, minutes))
+            service_start += service.total_minutes
+        return usage
+    
     def requires_skill_level(self, service_type: ServiceType) -> Optional[SkillLevel]:
         for service in self.services:
             if service.service_type == service_type:
@@ -44,4 +44,41 @@ class OptimizationObjectives:
         self.customer_satisfaction_weight /= total
         self.staff_utilization_weight /= total
         self.cost_minimization_weight /= total
-        self.schedule_stability_weight /= total
\ No newline at end of file
+        self.schedule_stability_weight /= total
+
+@dataclass
+class SolverConfig:
+    """CP-SATソルバーのパラメータ（Noneはソルバーの既定値）"""
+    max_time_in_seconds: Optional[float] = None  # 求解時間の上限
+    num_search_workers: Optional[int] = None  # 並列探索ワーカー数（0/Noneは全コア）
+    relative_gap_limit: Optional[float] = None  # 許容する相対ギャップ
+    random_seed: Optional[int] = None
+    log_search_progress: bool = False
+    
+    def __post_init__(self):
+        if self.max_time_in_seconds is not None and self.max_time_in_seconds <= 0:
+            raise ValueError("max_time_in_seconds は正の値である必要があります")
+        if self.num_search_workers is not None and self.num_search_workers < 0:
+            raise ValueError("num_search_workers は0以上である必要があります")
+        if self.relative_gap_limit is not None and self.relative_gap_limit < 0:
+            raise ValueError("relative_gap_limit は0以上である必要があります")
+    
+    def capped(self, limits: "SolverConfig") -> "SolverConfig":
+        """サーバー側の上限を適用した設定を返す（上限がNoneの項目は制限なし）
+        
+        ワーカー数の 0（全コア）は上限があれば上限の値にする。
+        """
+        def cap(value, limit):
+            if limit is None:
+                return value
+            return limit if value is None else min(value, limit)
+        
+        workers = self.num_search_workers or None
+        
+        return SolverConfig(
+            max_time_in_seconds=cap(self.max_time_in_seconds, limits.max_time_in_seconds),
+            num_search_workers=cap(workers, limits.num_search_workers),
+            relative_gap_limit=self.relative_gap_limit,
+            random_seed=self.random_seed,
+            log_search_progress=self.log_search_progress and limits.log_search_progress,
+        )
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..models.staff import Staff
+from ..models.booking import Booking
+from .schedule_optimizer import BeautySchedulerOptimizer, SLOT_MINUTES
+
+# (ISO年, ISO週番号)
+WeekKey = Tuple[int, int]
+
+
+def week_key(day: date) -> WeekKey:
+    iso = day.isocalendar()
+    return (iso[0], iso[1])
+
+
+class BatchScheduleOptimizer:
+    """期間内の予約を日ごとに分割して並列に最適化するバッチ最適化
+
+    各日は独立したモデルとして求解し（CP-SATは求解中にGILを解放するため
+    スレッドで並列実行できる）、結果を結合する。週あたりの勤務時間上限
+    (max_hours_per_week) は1つの巨大なモデルに入れず、調整パスで扱う:
+    上限を超えたスタッフについて、週の上限を日付順に各日の担当時間まで
+    配分し、その週の日だけ担当時間の上限付きで再求解する。再求解で予約が
+    別のスタッフに移り、そのスタッフが上限を超えることがあるので、上限を
+    超えるスタッフがいなくなるまで（配分済みの上限は保ったまま）繰り返す。
+    同時に求解する日数で optimizer の探索ワーカー数（未指定なら全コア）を
+    分け合い、バッチ全体で1回の求解と同じワーカー数に収める。
+    """
+
+    def __init__(self, optimizer: BeautySchedulerOptimizer, max_workers: Optional[int] = None):
+        self.optimizer = optimizer
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def optimize_range(self, staff_list: List[Staff], bookings: List[Booking],
+                       start_date: datetime, end_date: datetime,
+                       stop_event: Optional[threading.Event] = None, **options) -> Dict:
+        """start_date から end_date（両端を含む）までを最適化
+
+        options は各日の optimize_schedule にそのまま渡す。
+        """
+        if end_date.date() < start_date.date():
+            raise ValueError("end_date は start_date 以降である必要があります")
+        stop_event = stop_event or threading.Event()
+        days = self._partition_by_day(bookings, start_date.date(), end_date.date())
+
+        results = self._solve_days(staff_list, days, {}, stop_event, options)
+
+        # 調整パス: 週の勤務時間上限を超えたスタッフの担当時間を日ごとに配分して再求解
+        budgets: Dict[date, Dict[str, int]] = defaultdict(dict)
+        while not stop_event.is_set():
+            added = self._weekly_budgets(staff_list, results, budgets)
+            if not added:
+                break
+            for day, shares in added.items():
+                budgets[day].update(shares)
+            resolved = {day: days[day] for day in added}
+            results.update(self._solve_days(staff_list, resolved, budgets, stop_event, options))
+
+        return self._merge(results, sorted(budgets), self._weekly_violations(staff_list, results))
+
+    def _partition_by_day(self, bookings: List[Booking], first_day: date,
+                          last_day: date) -> Dict[date, List[Booking]]:
+        """予約を予約開始日ごとに分割（期間外は除く）"""
+        days: Dict[date, List[Booking]] = defaultdict(list)
+        for booking in bookings:
+            day = booking.scheduled_start.date()
+            if first_day <= day <= last_day:
+                days[day].append(booking)
+        return dict(sorted(days.items()))
+
+    def _solve_days(self, staff_list: List[Staff], days: Dict[date, List[Booking]],
+                    budgets: Dict[date, Dict[str, int]], stop_event: threading.Event,
+                    options: Dict) -> Dict[date, Dict]:
+        """各日を並列に求解"""
+        if not days:
+            return {}
+        parallel = min(self.max_workers, len(days))
+        optimizer = self._day_optimizer(parallel)
+
+        def solve(day: date) -> Dict:
+            return optimizer.optimize_schedule(
+                staff_list, days[day], datetime.combine(day, datetime.min.time()),
+                stop_event=stop_event, staff_minute_budgets=budgets.get(day), **options)
+
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="batch-day") as executor:
+            futures = {day: executor.submit(solve, day) for day in days}
+            return {day: future.result() for day, future in futures.items()}
+
+    def _day_optimizer(self, parallel: int) -> BeautySchedulerOptimizer:
+        """parallel 日を同時に求解するときの各日の最適化器（探索ワーカー数を等分）"""
+        if parallel <= 1:
+            return self.optimizer
+        optimizer = self.optimizer
+        workers = optimizer.solver_config.num_search_workers or os.cpu_count() or 1
+        return BeautySchedulerOptimizer(
+            optimizer.salon_constraints, optimizer.scheduling_constraints, optimizer.objectives,
+            formulation=optimizer.formulation,
+            solver_config=replace(optimizer.solver_config,
+                                  num_search_workers=max(1, workers // parallel)),
+            decompose=optimizer.decompose, phase_hook=optimizer.phase_hook)
+
+    def _weekly_budgets(self, staff_list: List[Staff], results: Dict[date, Dict],
+                        assigned: Dict[date, Dict[str, int]]) -> Dict[date, Dict[str, int]]:
+        """週の上限を超えたスタッフについて、再求解する日ごとの担当時間（分）上限
+
+        週の上限を日付の早い順に、現在の担当時間を上限として配分する
+        （配分の合計は上限以下になる）。assigned ですでに配分したスタッフと週は
+        対象にしない（上限を守れなかった分は _weekly_violations で報告する）。
+        """
+        budgets: Dict[date, Dict[str, int]] = defaultdict(dict)
+        for staff, minutes_by_day in self._over_limit(staff_list, results):
+            if any(staff.id in assigned.get(day, {}) for day in minutes_by_day):
+                continue
+            remaining = staff.max_hours_per_week * 60
+            for day, minutes in sorted(minutes_by_day.items()):
+                share = min(minutes, remaining - remaining % SLOT_MINUTES)
+                budgets[day][staff.id] = share
+                remaining -= share
+        return dict(budgets)
+
+    def _weekly_violations(self, staff_list: List[Staff],
+                           results: Dict[date, Dict]) -> Dict[str, Dict[str, float]]:
+        """調整後も週の上限を超えているスタッフの週ごとの勤務時間"""
+        violations: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for staff, minutes_by_day in self._over_limit(staff_list, results):
+            year, week = week_key(min(minutes_by_day))
+            violations[f"{year}-W{week:02d}"][staff.id] = sum(minutes_by_day.values()) / 60
+        return {week: dict(sorted(by_staff.items())) for week, by_staff in sorted(violations.items())}
+
+    def _over_limit(self, staff_list: List[Staff],
+                    results: Dict[date, Dict]) -> List[Tuple[Staff, Dict[date, int]]]:
+        """週の上限を超えた (スタッフ, その週の日ごとの担当時間（分）) の組"""
+        usage = self._staff_minutes(results)
+        over = []
+        for staff in staff_list:
+            limit = staff.max_hours_per_week * 60
+            by_week: Dict[WeekKey, Dict[date, int]] = defaultdict(dict)
+            for day in results:
+                by_week[week_key(day)][day] = usage[day].get(staff.id, 0)
+            over.extend((staff, minutes_by_day) for _, minutes_by_day in sorted(by_week.items())
+                        if sum(minutes_by_day.values()) > limit)
+        return over
+
+    def _staff_minutes(self, results: Dict[date, Dict]) -> Dict[date, Dict[str, int]]:
+        """日ごと・スタッフごとの担当時間（分）"""
+        usage: Dict[date, Dict[str, int]] = {}
+        for day, result in results.items():
+            minutes: Dict[str, int] = defaultdict(int)
+            for item in result.get("schedule", []):
+                minutes[item["staff_id"]] += item["duration_slots"] * SLOT_MINUTES
+            usage[day] = dict(minutes)
+        return usage
+
+    def _merge(self, results: Dict[date, Dict], rebalanced_days: List[date],
+               violations: Dict[str, Dict[str, float]]) -> Dict:
+        """日ごとの結果を1つのレスポンスにまとめる
+
+        週の上限を守れなかったスタッフが残れば（中断時など）、各日が OPTIMAL でも
+        PARTIAL とし、weekly_limit_violations に報告する。
+        """
+        schedule = []
+        for day, result in results.items():
+            schedule.extend({**item, "date": day.isoformat()} for item in result.get("schedule", []))
+
+        weekly_minutes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for day, minutes in self._staff_minutes(results).items():
+            year, week = week_key(day)
+            for staff_id, value in minutes.items():
+                weekly_minutes[f"{year}-W{week:02d}"][staff_id] += value
+
+        statuses = [result["status"] for result in results.values()]
+        if any(status == "CANCELLED" for status in statuses):
+            status = "CANCELLED"
+        elif violations:
+            status = "PARTIAL"
+        elif all(status == "OPTIMAL" for status in statuses):
+            status = "OPTIMAL"
+        elif all(status in ("OPTIMAL", "FEASIBLE") for status in statuses):
+            status = "FEASIBLE"
+        else:
+            status = "PARTIAL"
+
+        return {
+            "status": status,
+            "schedule": schedule,
+            "days": {day.isoformat(): result for day, result in results.items()},
+            "weekly_hours": {
+                week: {staff_id: minutes / 60 for staff_id, minutes in sorted(by_staff.items())}
+                for week, by_staff in sorted(weekly_minutes.items())
+            },
+            "rebalanced_days": [day.isoformat() for day in rebalanced_days],
+            "weekly_limit_violations": violations,
+        }
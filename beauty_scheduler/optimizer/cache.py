@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import threading
+import time as time_module
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..models.staff import Staff
+from ..models.booking import Booking
+from .schedule_optimizer import BeautySchedulerOptimizer
+
+# 並び順が意味を持たないリスト項目（フィンガープリントでは正規化して並べ替える）
+UNORDERED_FIELDS = frozenset({"skills", "availability", "preferred_staff_ids",
+                              "preferred_customers", "equipment"})
+
+# 結果に影響しないため鍵に含めない optimize_schedule のオプション
+UNKEYED_OPTIONS = frozenset({"on_solution", "stop_event"})
+
+# キャッシュしない終了ステータス（中断された結果）
+UNCACHED_STATUSES = frozenset({"CANCELLED"})
+
+
+def _canonical(value: Any) -> Any:
+    """JSONにできる正規形（dataclass・Enum・日時を展開し、順不同のリストを並べ替える）"""
+    if is_dataclass(value) and not isinstance(value, type):
+        return {
+            f.name: (_unordered(getattr(value, f.name)) if f.name in UNORDERED_FIELDS
+                     else _canonical(getattr(value, f.name)))
+            for f in fields(value)
+        }
+    if isinstance(value, Enum):
+        return _canonical(value.value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _unordered(items) -> List:
+    """順不同のリストの正規形"""
+    canonical = [_canonical(item) for item in items or []]
+    return sorted(canonical, key=lambda item: json.dumps(item, sort_keys=True))
+
+
+def fingerprint(optimizer: BeautySchedulerOptimizer, staff_list: List[Staff],
+                bookings: List[Booking], schedule_date: datetime, **options) -> str:
+    """最適化入力の正規化ハッシュ（SHA-256）
+
+    スタッフ・予約・制約・目的関数の重み・ソルバー設定・定式化と
+    optimize_schedule のオプションから計算する。スタッフと予約のリストの順序、
+    スキル・勤務可能時間などの順不同のリストの順序には依存しない。
+    """
+    payload = {
+        "staff": _unordered(staff_list),
+        "bookings": _unordered(bookings),
+        "schedule_date": _canonical(schedule_date),
+        "salon_constraints": _canonical(optimizer.salon_constraints),
+        "scheduling_constraints": _canonical(optimizer.scheduling_constraints),
+        "objectives": _canonical(optimizer.objectives),
+        "solver_config": _canonical(optimizer.solver_config),
+        "formulation": optimizer.formulation,
+        "decompose": optimizer.decompose,
+        "options": {
+            key: (_unordered(value) if key == "previous_schedule" else _canonical(value))
+            for key, value in sorted(options.items())
+            if key not in UNKEYED_OPTIONS and value is not None
+        },
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """最適化結果のLRUキャッシュ（有効期限・メモリ上限付き）
+
+    結果はJSONにシリアライズして保持する（取り出すたびに新しいオブジェクトを
+    返し、サイズはその長さで見積もる）。エントリ数 max_entries とバイト数
+    max_bytes を超えると古いものから捨てる。directory を指定すると結果を
+    ファイルにも書き出し、再起動後もメモリにないキーはディスクから読み込む。
+    """
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300.0,
+                 max_bytes: int = 64 * 1024 * 1024, directory: Optional[str] = None,
+                 clock: Callable[[], float] = time_module.time):
+        if max_entries < 0:
+            raise ValueError("max_entries は0以上である必要があります")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # キー -> (作成時刻, JSON)
+        self._bytes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """環境変数から設定を読み込んで作成"""
+        return cls(
+            max_entries=int(os.environ.get("BEAUTY_SCHEDULER_CACHE_SIZE", "128")),
+            ttl_seconds=float(os.environ.get("BEAUTY_SCHEDULER_CACHE_TTL", "300")),
+            max_bytes=int(os.environ.get("BEAUTY_SCHEDULER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            directory=os.environ.get("BEAUTY_SCHEDULER_CACHE_DIR") or None,
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+        """キャッシュ済みの結果（なければ None）"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0], now):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return json.loads(entry[1])
+            if entry is not None:
+                self._discard(key)
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._disk_hits += 1
+            self._store(key, *entry)
+        return json.loads(entry[1])
+
+    def put(self, key: str, result: Dict):
+        """結果を保存（中断された結果は保存しない）"""
+        if result.get("status") in UNCACHED_STATUSES:
+            return
+        created = self._clock()
+        encoded = json.dumps(result, ensure_ascii=False, default=str)
+        with self._lock:
+            self._store(key, created, encoded)
+        self._write_disk(key, created, encoded)
+
+    def optimize(self, optimizer: BeautySchedulerOptimizer, staff_list: List[Staff],
+                 bookings: List[Booking], schedule_date: datetime, **options) -> Dict:
+        """キャッシュを通して optimize_schedule を呼ぶ"""
+        key = fingerprint(optimizer, staff_list, bookings, schedule_date, **options)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        result = optimizer.optimize_schedule(staff_list, bookings, schedule_date, **options)
+        self.put(key, result)
+        return result
+
+    def clear(self):
+        """メモリ上のエントリを破棄（ディスクのファイルは残す）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _expired(self, created: float, now: float) -> bool:
+        return now - created >= self.ttl_seconds
+
+    def _store(self, key: str, created: float, encoded: str):
+        """メモリに保存して上限を超えた分を古い順に捨てる（ロック内で呼ぶ）"""
+        self._discard(key)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes or self.max_entries == 0:
+            return
+        self._entries[key] = (created, encoded)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self._evictions += 1
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].encode("utf-8"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        """ディスクのエントリ（期限切れのファイルは削除）"""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored["created"], now):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return stored["created"], json.dumps(stored["result"], ensure_ascii=False)
+
+    def _write_disk(self, key: str, created: float, encoded: str):
+        """一時ファイルに書いてから置き換える（書き込み失敗はキャッシュしないだけ）"""
+        if not self.directory:
+            return
+        path = self._path(key)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(f'{{"created": {created!r}, "result": {encoded}}}')
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
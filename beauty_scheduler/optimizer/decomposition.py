@@ -0,0 +1,45 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+from .variables import StartDomains
+
+# グラフのノード: ("b", booking_id) または ("s", staff_id)
+Node = Tuple[str, str]
+
+
+class Component(NamedTuple):
+    """担当可能グラフの連結成分（互いに独立に割り当てられる予約とスタッフ）"""
+    booking_ids: List[str]
+    staff_ids: List[str]
+
+
+def find_components(start_domains: StartDomains) -> List[Component]:
+    """(予約, スタッフ) の担当可能グラフを連結成分に分解
+
+    start_domains に候補がある組を辺とする二部グラフを Union-Find で分解する。
+    候補のない予約・スタッフはどの成分にも含まれない。成分は予約数の多い順。
+    """
+    parent: Dict[Node, Node] = {}
+
+    def find(node: Node) -> Node:
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for booking_id, staff_id in start_domains:
+        b, s = ("b", booking_id), ("s", staff_id)
+        for node in (b, s):
+            parent.setdefault(node, node)
+        root_b, root_s = find(b), find(s)
+        if root_b != root_s:
+            parent[root_s] = root_b
+
+    groups: Dict[Node, Component] = {}
+    for node in parent:
+        kind, node_id = node
+        component = groups.setdefault(find(node), Component([], []))
+        (component.booking_ids if kind == "b" else component.staff_ids).append(node_id)
+
+    return sorted(groups.values(), key=lambda c: (-len(c.booking_ids), sorted(c.staff_ids)))
@@ -0,0 +1,189 @@
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..models.booking import Booking
+from ..models.staff import ServiceType
+from .eligibility import EligibilityMatrix
+from .variables import StartDomains
+
+# 重大度: error はモデルが実行不可能であることを示す（CP-SATを実行しない）
+SEVERITY_ERROR = "error"
+# 部分割り当てモードでその予約だけ割り当てられない、またはペナルティ付きで満たせない
+SEVERITY_WARNING = "warning"
+
+# 問題の種類
+NO_ELIGIBLE_STAFF = "no_eligible_staff"  # スキルを満たすスタッフがいない
+EXCEEDS_CLOSING = "exceeds_closing"  # 最も早く開始しても閉店までに終わらない
+NO_START_SLOT = "no_start_slot"  # 勤務可能時間・昼休み・希望時間帯に合う開始時刻がない
+SKILL_CAPACITY = "skill_capacity"  # サービス種別ごとの所要時間が担当可能なスタッフの勤務時間を超える
+MIN_STAFF_COUNT = "min_staff_count"  # 勤務可能なスタッフが最小スタッフ数より少ない
+PINNED_OVERLAP = "pinned_overlap"  # 同じスタッフに固定した予約が重なる
+CONFLICT = "conflict"  # CP-SATが見つけた同時に満たせない予約と制約の組
+
+# 割り当て不能の理由を説明するときの制約の種類（CP-SATの仮定リテラル単位）
+CONSTRAINT_BOOKING = "booking"  # 予約を1人のスタッフに割り当てる
+CONSTRAINT_STAFF_OVERLAP = "staff_overlap"  # スタッフの施術・休憩が重ならない
+CONSTRAINT_SHIFT_LENGTH = "max_hours_per_day"  # シフトの長さの上限
+CONSTRAINT_BREAKS = "staff_break_frequency"  # 休憩頻度ごとの休憩
+CONSTRAINT_CONSECUTIVE_WORK = "consecutive_work_limit"  # 連続勤務時間の上限
+CONSTRAINT_MAX_STAFF = "max_staff_count"  # 同時に勤務するスタッフ数の上限
+CONSTRAINT_STAFF_BUDGET = "staff_budget"  # スタッフの担当時間の上限
+CONSTRAINT_EQUIPMENT = "equipment"  # 設備の同時使用数の上限
+
+# 仮定リテラルのキー (制約の種類, 対象のID)
+ConstraintKey = Tuple[str, str]
+
+
+@dataclass
+class FeasibilityIssue:
+    """最適化の前後で見つかった実行不可能性の理由"""
+    kind: str
+    severity: str
+    message: str
+    booking_ids: List[str] = field(default_factory=list)
+    staff_ids: List[str] = field(default_factory=list)
+    constraints: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def find_unplaceable_bookings(bookings: List[Booking], eligibility: EligibilityMatrix,
+                              start_domains: StartDomains, durations: Dict[str, int],
+                              start_windows: Dict[str, Tuple[int, int]], horizon: int,
+                              severity: str = SEVERITY_ERROR) -> List[FeasibilityIssue]:
+    """開始候補が1つもない予約（モデルに含まれず、割り当てられない）
+
+    すべての予約の割り当てが必要な通常のモードでは実行不可能（error）。部分割り当て
+    モードではその予約だけが割り当てられないので severity に warning を渡す。
+    """
+    placeable = {booking_id for booking_id, _ in start_domains}
+    no_staff, too_late, no_slot = [], [], []
+    for booking in bookings:
+        if booking.id in placeable:
+            continue
+        earliest, _ = start_windows[booking.id]
+        if not eligibility.eligible_staff_ids(booking.id):
+            no_staff.append(booking.id)
+        elif earliest + durations[booking.id] > horizon:
+            too_late.append(booking.id)
+        else:
+            no_slot.append(booking.id)
+
+    issues = []
+    if no_staff:
+        issues.append(FeasibilityIssue(
+            NO_ELIGIBLE_STAFF, severity,
+            "必要なスキルレベルを満たすスタッフがいない予約があります", booking_ids=no_staff))
+    if too_late:
+        issues.append(FeasibilityIssue(
+            EXCEEDS_CLOSING, severity,
+            "予約時刻に開始しても閉店時刻までに終わらない予約があります", booking_ids=too_late))
+    if no_slot:
+        issues.append(FeasibilityIssue(
+            NO_START_SLOT, severity,
+            "担当可能なスタッフの勤務可能時間・昼休み・希望時間帯に収まらない予約があります",
+            booking_ids=no_slot))
+    return issues
+
+
+def find_skill_shortages(bookings: List[Booking], start_domains: StartDomains,
+                         durations: Dict[str, int], capacities: Dict[str, int], slot_minutes: int,
+                         severity: str = SEVERITY_ERROR,
+                         pinned: Iterable[str] = ()) -> List[FeasibilityIssue]:
+    """サービス種別ごとの所要時間が、担当できるスタッフの勤務可能時間の合計を超えていないか
+
+    モデルに含まれる予約はすべて割り当てが必要で、予約は1人のスタッフが通しで
+    担当するため、種別 s を含む予約の所要時間の合計は、それらの予約の開始候補を持つ
+    スタッフの勤務可能時間（capacities: 昼休み・1日の上限時間・担当時間の上限を考慮）の
+    合計以下でなければならない。種別ごとに不足がなければ全予約について同じ条件を調べる
+    （時間はスロット数で渡す）。pinned の予約はスキルや勤務可能時間に関係なく担当が
+    決まっているので需要に含めない。部分割り当てモードでは一部の予約が割り当てられない
+    だけなので severity に warning を渡す。
+    """
+    staff_by_booking: Dict[str, Set[str]] = {}
+    for booking_id, staff_id in start_domains:
+        staff_by_booking.setdefault(booking_id, set()).add(staff_id)
+    pinned = set(pinned)
+    placeable = [booking for booking in bookings
+                 if booking.id in staff_by_booking and booking.id not in pinned]
+    groups: Dict[Optional[ServiceType], List[Booking]] = {}
+    for booking in placeable:
+        for service_type in {service.service_type for service in booking.services}:
+            groups.setdefault(service_type, []).append(booking)
+
+    issues = _capacity_issues(groups, staff_by_booking, durations, capacities, slot_minutes,
+                              severity)
+    return issues or _capacity_issues({None: placeable}, staff_by_booking, durations, capacities,
+                                      slot_minutes, severity)
+
+
+def _capacity_issues(groups: Dict[Optional[ServiceType], List[Booking]],
+                     staff_by_booking: Dict[str, Set[str]], durations: Dict[str, int],
+                     capacities: Dict[str, int], slot_minutes: int,
+                     severity: str) -> List[FeasibilityIssue]:
+    issues = []
+    for service_type, members in groups.items():
+        if not members:
+            continue
+        demand = sum(durations[booking.id] for booking in members)
+        staff_ids = sorted({staff_id for booking in members
+                            for staff_id in staff_by_booking[booking.id]})
+        capacity = sum(capacities.get(staff_id, 0) for staff_id in staff_ids)
+        if demand <= capacity:
+            continue
+        label = service_type.value if service_type is not None else "全サービス"
+        issues.append(FeasibilityIssue(
+            SKILL_CAPACITY, severity,
+            f"{label}の予約の所要時間 {demand * slot_minutes}分 が担当可能なスタッフの"
+            f"勤務可能時間 {capacity * slot_minutes}分 を超えています",
+            booking_ids=[booking.id for booking in members], staff_ids=staff_ids))
+    return issues
+
+
+def find_staffing_shortage(min_staff_count: int,
+                           available_staff_ids: Iterable[str]) -> List[FeasibilityIssue]:
+    """勤務可能なスタッフ数が最小スタッフ数に届かない（不足分はペナルティとして扱う）"""
+    staff_ids = sorted(available_staff_ids)
+    if len(staff_ids) >= min_staff_count:
+        return []
+    return [FeasibilityIssue(
+        MIN_STAFF_COUNT, SEVERITY_WARNING,
+        f"勤務可能なスタッフ {len(staff_ids)}名 が最小スタッフ数 {min_staff_count}名 に足りません",
+        staff_ids=staff_ids)]
+
+
+def find_pinned_overlaps(pinned: Dict[str, Tuple[Optional[str], int]],
+                         durations: Dict[str, int]) -> List[FeasibilityIssue]:
+    """同じスタッフに固定した予約の時間帯が重なっていないか"""
+    by_staff: Dict[str, List[Tuple[int, str]]] = {}
+    for booking_id, (staff_id, slot) in pinned.items():
+        if staff_id is not None and booking_id in durations:
+            by_staff.setdefault(staff_id, []).append((slot, booking_id))
+
+    issues = []
+    for staff_id, entries in sorted(by_staff.items()):
+        entries.sort()
+        end, previous = None, None
+        for slot, booking_id in entries:
+            if end is not None and slot < end:
+                issues.append(FeasibilityIssue(
+                    PINNED_OVERLAP, SEVERITY_ERROR,
+                    "同じスタッフに固定された予約の時間帯が重なっています",
+                    booking_ids=[previous, booking_id], staff_ids=[staff_id]))
+            if end is None or slot + durations[booking_id] > end:
+                end, previous = slot + durations[booking_id], booking_id
+    return issues
+
+
+def conflict_issue(keys: List[ConstraintKey]) -> FeasibilityIssue:
+    """CP-SATの仮定リテラルのコア（同時に満たせない組）を説明にまとめる"""
+    booking_ids = sorted(subject for kind, subject in keys if kind == CONSTRAINT_BOOKING)
+    staff_ids = sorted({subject for kind, subject in keys
+                        if kind in (CONSTRAINT_STAFF_OVERLAP, CONSTRAINT_SHIFT_LENGTH, CONSTRAINT_BREAKS,
+                                    CONSTRAINT_CONSECUTIVE_WORK, CONSTRAINT_STAFF_BUDGET)})
+    constraints = sorted(f"{kind}:{subject}" for kind, subject in keys if kind != CONSTRAINT_BOOKING)
+    return FeasibilityIssue(
+        CONFLICT, SEVERITY_ERROR,
+        "次の予約と制約を同時に満たせません（いずれかの予約を外すか制約を緩めてください）",
+        booking_ids=booking_ids, staff_ids=staff_ids, constraints=constraints)
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ..models.staff import Staff, ServiceType
+from ..models.booking import Booking
+
+SERVICE_TYPES: List[ServiceType] = list(ServiceType)
+SERVICE_TYPE_INDEX: Dict[ServiceType, int] = {t: i for i, t in enumerate(SERVICE_TYPES)}
+
+# ロスター（スタッフ構成）ごとのスキル行列キャッシュの上限
+SKILL_MATRIX_CACHE_SIZE = 32
+
+
+def roster_fingerprint(staff_list: List[Staff]) -> str:
+    """スタッフIDとスキルからロスターの指紋を計算（リスト順には依存しない）"""
+    digest = hashlib.sha1()
+    for staff in sorted(staff_list, key=lambda s: s.id):
+        skills = sorted((skill.service_type.value, skill.level.value) for skill in staff.skills)
+        digest.update(repr((staff.id, skills)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SkillMatrix:
+    """スタッフ × サービス種別のスキルレベル行列（スキルなしは0）"""
+
+    def __init__(self, staff_list: List[Staff]):
+        self.staff_ids: List[str] = sorted(staff.id for staff in staff_list)
+        self.staff_index: Dict[str, int] = {sid: i for i, sid in enumerate(self.staff_ids)}
+        self.levels = np.zeros((len(self.staff_ids), len(SERVICE_TYPES)), dtype=np.int8)
+        for staff in staff_list:
+            row = self.staff_index[staff.id]
+            for skill in staff.skills:
+                col = SERVICE_TYPE_INDEX[skill.service_type]
+                self.levels[row, col] = max(self.levels[row, col], skill.level.value)
+        self.levels.setflags(write=False)
+
+
+_skill_matrix_cache: "OrderedDict[str, SkillMatrix]" = OrderedDict()
+_skill_matrix_lock = threading.Lock()
+
+
+def get_skill_matrix(staff_list: List[Staff]) -> SkillMatrix:
+    """ロスターの指紋をキーにキャッシュしたスキル行列を返す"""
+    fingerprint = roster_fingerprint(staff_list)
+    with _skill_matrix_lock:
+        matrix = _skill_matrix_cache.get(fingerprint)
+        if matrix is not None:
+            _skill_matrix_cache.move_to_end(fingerprint)
+            return matrix
+
+    matrix = SkillMatrix(staff_list)
+    with _skill_matrix_lock:
+        _skill_matrix_cache[fingerprint] = matrix
+        while len(_skill_matrix_cache) > SKILL_MATRIX_CACHE_SIZE:
+            _skill_matrix_cache.popitem(last=False)
+    return matrix
+
+
+def requirement_matrix(bookings: List[Booking]) -> np.ndarray:
+    """予約 × サービス種別の必要スキルレベル行列（不要は0）"""
+    required = np.zeros((len(bookings), len(SERVICE_TYPES)), dtype=np.int8)
+    for row, booking in enumerate(bookings):
+        for service in booking.services:
+            col = SERVICE_TYPE_INDEX[service.service_type]
+            required[row, col] = max(required[row, col], service.required_skill_level.value)
+    return required
+
+
+class EligibilityMatrix:
+    """予約 × スタッフの担当可否行列
+
+    全サービス種別でスタッフのスキルレベルが要求レベル以上であれば担当可能。
+    判定は1回の配列演算で行う。
+    """
+
+    def __init__(self, staff_list: List[Staff], bookings: List[Booking]):
+        self.skills = get_skill_matrix(staff_list)
+        self.booking_ids: List[str] = [booking.id for booking in bookings]
+        self.booking_index: Dict[str, int] = {bid: i for i, bid in enumerate(self.booking_ids)}
+        required = requirement_matrix(bookings)
+        self.eligible: np.ndarray = (
+            self.skills.levels[np.newaxis, :, :] >= required[:, np.newaxis, :]
+        ).all(axis=2)
+
+    def is_eligible(self, booking_id: str, staff_id: str) -> bool:
+        row = self.booking_index.get(booking_id)
+        col = self.skills.staff_index.get(staff_id)
+        if row is None or col is None:
+            return False
+        return bool(self.eligible[row, col])
+
+    def eligible_staff_ids(self, booking_id: str) -> List[str]:
+        row = self.booking_index.get(booking_id)
+        if row is None:
+            return []
+        return [self.skills.staff_ids[col] for col in np.flatnonzero(self.eligible[row])]
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """担当可能な (booking_id, staff_id) の組を列挙"""
+        rows, cols = np.nonzero(self.eligible)
+        return [(self.booking_ids[r], self.skills.staff_ids[c]) for r, c in zip(rows, cols)]
@@ -0,0 +1,192 @@
+from collections import defaultdict
+from typing import Collection, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..models.staff import Staff
+from ..models.booking import Booking
+from .eligibility import get_skill_matrix, requirement_matrix
+from .variables import Assignments, StartDomains
+
+
+class ShiftRule(NamedTuple):
+    """スタッフ1人分のシフトの規則（スロット数）"""
+    max_length: int  # シフトの長さの上限（勤務可能時間・max_hours_per_day）
+    frequency: int  # 休憩なしで続けられるシフトの長さ（staff_break_frequency）
+    break_slots: int  # 1回の休憩の長さ
+
+
+def place_breaks(busy: np.ndarray, start: int, end: int, rule: ShiftRule) -> Optional[List[int]]:
+    """シフト [start, end) に施術（busy）と重ならない休憩を置き、開始スロットを返す
+
+    CP-SATのシフトモデルと同じ規則で、シフトが k * frequency を超えたら k 回目の
+    休憩を取り、k 回目はシフト開始から k * frequency 以内かつ前の休憩の終了から
+    frequency 以内、最後の休憩からシフト終了までも frequency 以内とする。各休憩を
+    置ける最も遅い位置に置く（次の休憩・シフト終了までの余裕が最大になる）。
+    規則を満たせなければ None を返す。
+    """
+    length = end - start
+    if length > rule.max_length:
+        return None
+    breaks: List[int] = []
+    rest_end = start
+    for k in range(1, (length - 1) // rule.frequency + 1 if length > 0 else 1):
+        latest = min(start + k * rule.frequency, rest_end + rule.frequency,
+                     end - rule.break_slots)
+        slot = next((slot for slot in range(latest, rest_end - 1, -1)
+                     if not busy[slot:slot + rule.break_slots].any()), None)
+        if slot is None:
+            return None
+        breaks.append(slot)
+        rest_end = slot + rule.break_slots
+    if breaks and end > rest_end + rule.frequency:
+        return None
+    return breaks
+
+
+def shift_breaks(tasks: List[Tuple[int, int]], rule: ShiftRule) -> Optional[List[int]]:
+    """施術 (開始スロット, スロット数) の最初から最後までをシフトとした休憩の開始スロット"""
+    start = min(slot for slot, _ in tasks)
+    end = max(slot + duration for slot, duration in tasks)
+    busy = np.zeros(end, dtype=bool)
+    for slot, duration in tasks:
+        busy[slot:slot + duration] = True
+    return place_breaks(busy, start, end, rule)
+
+
+class GreedyScheduler:
+    """優先度順のリストスケジューリング
+
+    予約を優先度順（固定予約 → VIP → ... → LOW、同順位は候補の早い順）に
+    処理し、各予約を最も早く開始できるスタッフに割り当てる。開始時刻が
+    同じなら希望スタッフ、次にスキルの余剰が小さい（要求レベルに最も近い）
+    スタッフを選ぶ。スタッフごとの施術は重ならず、連続勤務は各スタッフの
+    consecutive_work_limit 以内、同時施術数は max_concurrent 以下に保つ。
+    shift_rules を渡すと、各スタッフの最初から最後の施術までのシフトが
+    その規則（長さの上限・休憩）を満たす割り当てだけを選ぶ（place_breaks）。
+    budgets を渡すと、スタッフごとの担当スロット数の合計をその値以下に保つ。
+    equipment（予約ごとの (設備, 開始オフセット, 占有スロット数)）を渡すと、
+    設備ごとの同時使用数を station_capacities 以下に保つ。
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None,
+                 station_capacities: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max_concurrent
+        self.station_capacities = station_capacities or {}
+
+    def schedule(self, staff_list: List[Staff], bookings: List[Booking],
+                 start_domains: StartDomains, durations: Dict[str, int], horizon: int,
+                 first: Collection[str] = (),
+                 budgets: Optional[Dict[str, int]] = None,
+                 equipment: Optional[Dict[str, List[Tuple[str, int, int]]]] = None,
+                 shift_rules: Optional[Dict[str, ShiftRule]] = None
+                 ) -> Tuple[Assignments, List[str]]:
+        """割り当てと、割り当てられなかった予約IDのリストを返す"""
+        options: Dict[str, List[Tuple[str, List[int]]]] = defaultdict(list)
+        for (booking_id, staff_id), starts in start_domains.items():
+            options[booking_id].append((staff_id, starts))
+
+        surplus = self._skill_surplus(staff_list, bookings)
+        max_duration = max(durations.values(), default=0)
+        busy = {staff.id: np.zeros(horizon + max_duration, dtype=bool) for staff in staff_list}
+        run_limits = {staff.id: staff.consecutive_work_limit * 4 for staff in staff_list}
+        remaining = dict(budgets or {})
+        shift_rules = shift_rules or {}
+        occupancy = np.zeros(horizon + max_duration, dtype=np.int32)
+        equipment = equipment or {}
+        stations = {station: np.zeros(horizon + max_duration, dtype=np.int32)
+                    for station in self.station_capacities}
+
+        def order(indexed):
+            index, booking = indexed
+            starts = [slot for _, slots in options.get(booking.id, []) for slot in slots]
+            return (booking.id not in first, -booking.customer.priority.value,
+                    min(starts, default=horizon), index)
+
+        assignments: Assignments = {}
+        unscheduled: List[str] = []
+        for index, booking in sorted(enumerate(bookings), key=order):
+            duration = durations[booking.id]
+            preferred = set(booking.customer.preferred_staff_ids)
+            best = None
+            for staff_id, starts in options.get(booking.id, []):
+                if remaining.get(staff_id, duration) < duration:
+                    continue
+                slot = self._earliest_free(busy[staff_id], occupancy, stations, starts, duration,
+                                           run_limits[staff_id], equipment.get(booking.id, []),
+                                           shift_rules.get(staff_id))
+                if slot is None:
+                    continue
+                rank = (slot, staff_id not in preferred,
+                        surplus.get((booking.id, staff_id), 0), staff_id)
+                if best is None or rank < best:
+                    best = rank
+
+            if best is None:
+                unscheduled.append(booking.id)
+                continue
+            slot, _, _, staff_id = best
+            busy[staff_id][slot:slot + duration] = True
+            occupancy[slot:slot + duration] += 1
+            if staff_id in remaining:
+                remaining[staff_id] -= duration
+            for station, offset, length in equipment.get(booking.id, []):
+                stations[station][slot + offset:slot + offset + length] += 1
+            assignments[booking.id] = (staff_id, slot)
+
+        return assignments, unscheduled
+
+    def _earliest_free(self, staff_busy: np.ndarray, occupancy: np.ndarray,
+                       stations: Dict[str, np.ndarray], starts: List[int], duration: int,
+                       run_limit: int, segments: List[Tuple[str, int, int]],
+                       rule: Optional[ShiftRule] = None) -> Optional[int]:
+        for slot in starts:
+            if staff_busy[slot:slot + duration].any():
+                continue
+            if self._run_length(staff_busy, slot, duration) > run_limit:
+                continue
+            if (self.max_concurrent is not None
+                    and occupancy[slot:slot + duration].max(initial=0) >= self.max_concurrent):
+                continue
+            if any(stations[station][slot + offset:slot + offset + length].max(initial=0)
+                   >= self.station_capacities[station]
+                   for station, offset, length in segments):
+                continue
+            if rule is not None and not self._fits_shift(staff_busy, slot, duration, rule):
+                continue
+            return slot
+        return None
+
+    def _fits_shift(self, staff_busy: np.ndarray, slot: int, duration: int,
+                    rule: ShiftRule) -> bool:
+        """[slot, slot + duration) を加えてもシフトの規則を満たせるか"""
+        busy = staff_busy.copy()
+        busy[slot:slot + duration] = True
+        occupied = np.flatnonzero(busy)
+        return place_breaks(busy, int(occupied[0]), int(occupied[-1]) + 1, rule) is not None
+
+    def _run_length(self, staff_busy: np.ndarray, slot: int, duration: int) -> int:
+        """[slot, slot + duration) に割り当てた場合の連続勤務スロット数"""
+        start, end = slot, slot + duration
+        while start > 0 and staff_busy[start - 1]:
+            start -= 1
+        while end < len(staff_busy) and staff_busy[end]:
+            end += 1
+        return end - start
+
+    def _skill_surplus(self, staff_list: List[Staff],
+                       bookings: List[Booking]) -> Dict[Tuple[str, str], int]:
+        """(予約, スタッフ) ごとの要求レベルに対するスキル余剰の合計"""
+        if not staff_list or not bookings:
+            return {}
+        skills = get_skill_matrix(staff_list)
+        required = requirement_matrix(bookings).astype(np.int32)
+        levels = skills.levels.astype(np.int32)
+        mask = required > 0
+        surplus = ((levels[np.newaxis, :, :] - required[:, np.newaxis, :])
+                   * mask[:, np.newaxis, :]).sum(axis=2)
+        return {
+            (booking.id, staff_id): int(surplus[row, col])
+            for row, booking in enumerate(bookings)
+            for col, staff_id in enumerate(skills.staff_ids)
+        }
@@ -0,0 +1,192 @@
+import random
+import threading
+import time as time_module
+from dataclasses import replace
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ..models.staff import Staff
+from ..models.booking import Booking
+from .schedule_optimizer import BeautySchedulerOptimizer, MODE_FAST
+from .variables import Assignments
+
+# 近傍の種類
+NEIGHBORHOOD_TIME_WINDOW = "time_window"  # 開始時刻が一定の時間帯にある予約
+NEIGHBORHOOD_STAFF = "staff"  # 一部のスタッフが担当する予約
+NEIGHBORHOOD_SERVICE = "service_type"  # 特定のサービス種別を含む予約
+NEIGHBORHOODS = (NEIGHBORHOOD_TIME_WINDOW, NEIGHBORHOOD_STAFF, NEIGHBORHOOD_SERVICE)
+
+# 改善のたびに呼ばれるハンドラ（目的関数曲線の1点を受け取る）
+ImprovementHandler = Callable[[Dict], None]
+
+
+class LargeNeighborhoodSearch:
+    """大近傍探索（LNS）による大規模な日の最適化
+
+    貪欲法の解から始め、現在のスケジュールの大部分を固定したまま近傍
+    （時間帯・スタッフの一部・サービス種別）の予約だけを解放し、短い制限時間で
+    CP-SATの部分問題を繰り返し解く。貪欲法の解はすべて固定したモデルで
+    CP-SATに検証させ、制約を満たさなければ固定なしで解き直した解から始める
+    （どちらも得られなければステータスを UNKNOWN とする）。固定した部分も
+    含めてモデル全体の目的関数値が得られるので、割り当て数、次に目的関数値が
+    改善したときだけ解を更新し、その推移を目的関数曲線 (curve) として返す。
+    部分問題が実行不可能でも矛盾の説明は求めず、貪欲法へのフォールバック結果は
+    採用しない。現在の解は初期解のヒントとしてだけ渡し、部分問題の
+    目的関数にはスケジュール安定性（現在の解との一致）を含めない（基準となる
+    解が反復ごとに変わり、目的関数値を比較できなくなるため）。
+    """
+
+    def __init__(self, optimizer: BeautySchedulerOptimizer,
+                 iteration_time_limit: float = 1.0,
+                 max_free_bookings: int = 30,
+                 window_slots: int = 8,
+                 staff_per_neighborhood: int = 3,
+                 seed: Optional[int] = None):
+        self.optimizer = optimizer
+        # 部分問題は短い制限時間で、スケジュール安定性を除いた目的関数で解く
+        self.sub_optimizer = BeautySchedulerOptimizer(
+            optimizer.salon_constraints, optimizer.scheduling_constraints,
+            replace(optimizer.objectives, schedule_stability_weight=0.0),
+            formulation=optimizer.formulation,
+            solver_config=replace(optimizer.solver_config, max_time_in_seconds=iteration_time_limit),
+            phase_hook=optimizer.phase_hook)
+        self.max_free_bookings = max_free_bookings
+        self.window_slots = window_slots
+        self.staff_per_neighborhood = staff_per_neighborhood
+        self.seed = seed
+
+    def optimize(self, staff_list: List[Staff], bookings: List[Booking], schedule_date: datetime,
+                 time_budget: float = 10.0, max_iterations: Optional[int] = None,
+                 stop_event: Optional[threading.Event] = None,
+                 on_improvement: Optional[ImprovementHandler] = None) -> Dict:
+        """time_budget 秒（または max_iterations 回）まで近傍の再最適化を繰り返す"""
+        rng = random.Random(self.seed)
+        stop_event = stop_event or threading.Event()
+        started = time_module.monotonic()
+        deadline = started + time_budget
+
+        best = self._initial_solution(staff_list, bookings, schedule_date, stop_event)
+        verified = best is not None
+        if best is None:
+            best = self.optimizer.optimize_schedule(staff_list, bookings, schedule_date,
+                                                    stop_event=stop_event, mode=MODE_FAST)
+        best_score = self._score(best)
+        curve = [self._curve_point(0, started, best_score, None)]
+        if on_improvement is not None:
+            on_improvement(curve[-1])
+
+        iteration = 0
+        while (time_module.monotonic() < deadline and not stop_event.is_set()
+               and (max_iterations is None or iteration < max_iterations)):
+            iteration += 1
+            assignments = self._assignments(best)
+            neighborhood = rng.choice(NEIGHBORHOODS)
+            free = self._select_free(neighborhood, assignments, staff_list, bookings, rng)
+            fixed = {bid: value for bid, value in assignments.items() if bid not in free}
+
+            candidate = self._solve(staff_list, bookings, schedule_date, stop_event,
+                                    best["schedule"], fixed)
+            if candidate["status"] == "CANCELLED":
+                break
+            if not self._accepted(candidate):
+                continue
+            score = self._score(candidate)
+            if score > best_score:
+                best, best_score, verified = candidate, score, True
+                curve.append(self._curve_point(iteration, started, best_score, neighborhood))
+                if on_improvement is not None:
+                    on_improvement(curve[-1])
+
+        unscheduled = sorted({b.id for b in bookings} - set(self._assignments(best)))
+        if not verified:
+            status = "UNKNOWN"
+        else:
+            status = "PARTIAL" if unscheduled else "FEASIBLE"
+        return {
+            "status": status,
+            "schedule": best["schedule"],
+            "unscheduled_booking_ids": unscheduled,
+            "solver_stats": {
+                "engine": "lns",
+                "solve_time": time_module.monotonic() - started,
+                "objective_value": curve[-1]["objective_value"],
+                "iterations": iteration,
+                "improvements": len(curve) - 1,
+            },
+            "curve": curve,
+        }
+
+    def _initial_solution(self, staff_list: List[Staff], bookings: List[Booking],
+                          schedule_date: datetime,
+                          stop_event: threading.Event) -> Optional[Dict]:
+        """CP-SATで制約を満たすことを確かめた初期解（得られなければ None）
+
+        貪欲法の解をすべて固定して解き、満たさなければ貪欲法の解をヒントに
+        固定なしで解き直す。
+        """
+        greedy = self.optimizer.optimize_schedule(staff_list, bookings, schedule_date,
+                                                  stop_event=stop_event, mode=MODE_FAST)
+        for fixed in (self._assignments(greedy), {}):
+            result = self._solve(staff_list, bookings, schedule_date, stop_event,
+                                 greedy["schedule"], fixed)
+            if self._accepted(result):
+                return result
+            if result["status"] == "CANCELLED":
+                break
+        return None
+
+    def _solve(self, staff_list: List[Staff], bookings: List[Booking], schedule_date: datetime,
+               stop_event: threading.Event, hint: List[Dict], fixed: Assignments) -> Dict:
+        """部分問題（fixed 以外の予約は割り当てなくてもよい）を解く"""
+        return self.sub_optimizer.optimize_schedule(
+            staff_list, bookings, schedule_date, stop_event=stop_event,
+            previous_schedule=hint, fixed_assignments=fixed, allow_partial=True,
+            explain_infeasibility=False)
+
+    def _accepted(self, result: Dict) -> bool:
+        """CP-SATが制約を満たす解を返したか（貪欲法へのフォールバックは除く）"""
+        return (not result.get("fallback")
+                and result.get("solver_stats", {}).get("status") in ("OPTIMAL", "FEASIBLE"))
+
+    def _assignments(self, result: Dict) -> Assignments:
+        return {item["booking_id"]: (item["staff_id"], item["start_slot"])
+                for item in result.get("schedule", [])}
+
+    def _score(self, result: Dict) -> Tuple[int, float]:
+        """(割り当て数, CP-SATの目的関数値)。貪欲法の結果は目的関数値を -inf とする"""
+        stats = result.get("solver_stats", {})
+        objective = stats["objective_value"] if "objective_value" in stats else float("-inf")
+        return len(result.get("schedule", [])), objective
+
+    def _curve_point(self, iteration: int, started: float, score: Tuple[int, float],
+                     neighborhood: Optional[str]) -> Dict:
+        return {
+            "iteration": iteration,
+            "elapsed": time_module.monotonic() - started,
+            "scheduled": score[0],
+            "objective_value": score[1] if score[1] != float("-inf") else None,
+            "neighborhood": neighborhood,
+        }
+
+    def _select_free(self, neighborhood: str, assignments: Assignments, staff_list: List[Staff],
+                     bookings: List[Booking], rng: random.Random) -> Set[str]:
+        """近傍に含まれる予約（未割り当ての予約は常に含む）"""
+        unscheduled = {b.id for b in bookings if b.id not in assignments}
+        if neighborhood == NEIGHBORHOOD_TIME_WINDOW and assignments:
+            start = rng.choice([slot for _, slot in assignments.values()])
+            selected = {bid for bid, (_, slot) in assignments.items()
+                        if start <= slot < start + self.window_slots}
+        elif neighborhood == NEIGHBORHOOD_STAFF:
+            staff_ids = {s.id for s in rng.sample(staff_list, min(self.staff_per_neighborhood,
+                                                                  len(staff_list)))}
+            selected = {bid for bid, (sid, _) in assignments.items() if sid in staff_ids}
+        else:
+            service_types = sorted({s.service_type.value for b in bookings for s in b.services})
+            service_type = rng.choice(service_types) if service_types else None
+            selected = {b.id for b in bookings if b.id in assignments
+                        and any(s.service_type.value == service_type for s in b.services)}
+
+        selected = sorted(selected)
+        if len(selected) > self.max_free_bookings:
+            selected = rng.sample(selected, self.max_free_bookings)
+        return unscheduled | set(selected)
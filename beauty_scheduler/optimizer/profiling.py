@@ -0,0 +1,82 @@
+import threading
+import time as time_module
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from ortools.sat.python import cp_model
+
+# 計測イベントを受け取るフック（トレーシングへの連携用）
+# {"event": "phase", "phase", "started_at", "wall_time", "cpu_time", "variables", "constraints"}
+# と、最適化の終了時に {"event": "result", "status", "solver_stats"} を受け取る
+PhaseHook = Callable[[Dict], None]
+
+
+def model_size(model: cp_model.CpModel) -> Dict[str, int]:
+    """モデルの変数・制約の数"""
+    proto = model.Proto()
+    return {"variables": len(proto.variables), "constraints": len(proto.constraints)}
+
+
+def search_statistics(solver: cp_model.CpSolver) -> Dict:
+    """CP-SATの探索統計（presolve後のモデル規模・分岐・衝突など）"""
+    response = solver.ResponseProto()
+    return {
+        "presolved_booleans": response.num_booleans,
+        "presolved_integers": response.num_integers,
+        "fixed_booleans": response.num_fixed_booleans,
+        "branches": response.num_branches,
+        "conflicts": response.num_conflicts,
+        "restarts": response.num_restarts,
+        "binary_propagations": response.num_binary_propagations,
+        "integer_propagations": response.num_integer_propagations,
+        "lp_iterations": response.num_lp_iterations,
+        "deterministic_time": response.deterministic_time,
+        "user_time": response.user_time,
+    }
+
+
+class PhaseTimer:
+    """フェーズごとの経過時間（wall）とCPU時間、追加した変数・制約の数を集計
+
+    CPU時間は呼び出したスレッドのもの（time.thread_time）。CP-SATの探索は
+    ワーカースレッドで動くため、Solve のように process_cpu=True を指定した
+    フェーズはプロセス全体のCPU時間で計る（同時に動く他の求解の分も含む）。
+    分解した部分モデルは1つのタイマーを共有するため、並列に動いたフェーズの
+    合計は全体の経過時間を超えることがある。
+    """
+
+    def __init__(self, hook: Optional[PhaseHook] = None):
+        self.hook = hook
+        self._lock = threading.Lock()
+        self._phases: Dict[str, Dict] = {}
+
+    @contextmanager
+    def phase(self, name: str, model: Optional[cp_model.CpModel] = None,
+              process_cpu: bool = False) -> Iterator[None]:
+        cpu_clock = time_module.process_time if process_cpu else time_module.thread_time
+        before = model_size(model) if model is not None else None
+        started_at = time_module.time()
+        wall, cpu = time_module.perf_counter(), cpu_clock()
+        try:
+            yield
+        finally:
+            record = {
+                "wall_time": time_module.perf_counter() - wall,
+                "cpu_time": cpu_clock() - cpu,
+                "calls": 1,
+            }
+            if before is not None:
+                after = model_size(model)
+                record["variables"] = after["variables"] - before["variables"]
+                record["constraints"] = after["constraints"] - before["constraints"]
+            with self._lock:
+                total = self._phases.setdefault(name, dict.fromkeys(record, 0))
+                for key, value in record.items():
+                    total[key] = total.get(key, 0) + value
+            if self.hook is not None:
+                self.hook({"event": "phase", "phase": name, "started_at": started_at, **record})
+
+    def summary(self) -> Dict[str, Dict]:
+        """フェーズ名 -> {wall_time, cpu_time, calls[, variables, constraints]}（計測順）"""
+        with self._lock:
+            return {name: dict(record) for name, record in self._phases.items()}
@@ -1,68 +1,749 @@
+import os
+import threading
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from ortools.sat.python import cp_model
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Set, Tuple
 from datetime import datetime, timedelta, time
 from ..models.staff import Staff, ServiceType, SkillLevel
-from ..models.booking import Booking, Service, Customer
-from ..models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives
+from ..models.booking import Booking, BookingStatus, Service, Customer
+from ..models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives, SolverConfig
+from .variables import (AssignmentVariables, Assignments, IntervalVariables, ShiftBreak,
+                        ShiftEntry, StartDomains, Task)
+from .eligibility import EligibilityMatrix
+from .greedy import GreedyScheduler, ShiftRule, shift_breaks
+from .decomposition import Component, find_components
+from .profiling import PhaseHook, PhaseTimer, model_size, search_statistics
+from .diagnostics import (CONSTRAINT_BOOKING, CONSTRAINT_BREAKS, CONSTRAINT_CONSECUTIVE_WORK,
+                          CONSTRAINT_EQUIPMENT,
+                          CONSTRAINT_MAX_STAFF, CONSTRAINT_SHIFT_LENGTH, CONSTRAINT_STAFF_BUDGET,
+                          CONSTRAINT_STAFF_OVERLAP, SEVERITY_ERROR, SEVERITY_WARNING,
+                          ConstraintKey, FeasibilityIssue,
+                          conflict_issue, find_pinned_overlaps, find_skill_shortages,
+                          find_staffing_shortage, find_unplaceable_bookings)
+
+SLOT_MINUTES = 15
+
+# 最小スタッフ数に足りないスロット・人あたりのペナルティ（他のどの項より優先）
+COVERAGE_SHORTFALL_PENALTY = 1000
+
+# 部分割り当てモードで予約1件を割り当てたときの報酬（優先度の値を掛ける。他のどの項より優先）
+PLACEMENT_REWARD = 100000
+
+# 実行不可能だったときに矛盾する予約と制約を探す求解の制限時間（秒）
+EXPLANATION_TIME_LIMIT = 5.0
+
+# 定式化モード
+FORMULATION_SLOT = "slot"  # 開始スロットごとのBool変数
+FORMULATION_INTERVAL = "interval"  # (予約, スタッフ) ごとのオプショナル区間変数 + NoOverlap
+FORMULATIONS = (FORMULATION_SLOT, FORMULATION_INTERVAL)
+
+# 求解モード
+MODE_CP = "cp"  # CP-SATで最適化（解がなければ貪欲法の結果にフォールバック）
+MODE_FAST = "fast"  # 貪欲法のみ
+MODES = (MODE_CP, MODE_FAST)
+
+# solver_stats["phases"] に記録するフェーズ（実行順）
+PHASES = ("time_slots", "start_domains", "diagnostics", "greedy", "variables", "shift_model",
+          "booking_constraints", "staff_constraints", "salon_constraints", "budget_constraints",
+          "equipment_constraints", "objective", "hints", "solve", "extraction", "explanation")
+
+# 改善解が見つかるたびに呼ばれるハンドラ
+SolutionHandler = Callable[[Dict], None]
+# 変数の値を取り出す関数（ソルバーまたは解コールバックの Value）
+ValueFn = Callable[[cp_model.IntVar], int]
+
+# booking_id -> (staff_id または None, start_slot)。staff_id が None なら時刻のみ固定
+PinnedAssignments = Dict[str, Tuple[Optional[str], int]]
+
+# 増分モードで担当・時刻を固定するステータスと、最適化対象から外すステータス
+FROZEN_STATUSES = (BookingStatus.CONFIRMED, BookingStatus.IN_PROGRESS)
+INACTIVE_STATUSES = (BookingStatus.COMPLETED, BookingStatus.CANCELLED)
+
+class _SolutionObserver(cp_model.CpSolverSolutionCallback):
+    """改善解を通知し、停止要求があれば探索を打ち切るコールバック"""
+    
+    def __init__(self, on_solution: Optional[SolutionHandler], stop_requested: threading.Event,
+                 schedule_builder: Optional[Callable[[ValueFn], List[Dict]]] = None):
+        super().__init__()
+        self._on_solution = on_solution
+        self._stop_requested = stop_requested
+        self._schedule_builder = schedule_builder
+    
+    def on_solution_callback(self):
+        if self._on_solution is not None:
+            progress = {
+                "objective_value": self.ObjectiveValue(),
+                "best_bound": self.BestObjectiveBound(),
+                "wall_time": self.WallTime(),
+            }
+            if self._schedule_builder is not None:
+                progress["schedule"] = self._schedule_builder(self.Value)
+            self._on_solution(progress)
+        if self._stop_requested.is_set():
+            self.StopSearch()
+
+@dataclass(eq=False)
+class _SolveContext:
+    """optimize_schedule 1回分のモデル・ソルバー・停止要求"""
+    model: cp_model.CpModel
+    solver: cp_model.CpSolver
+    stop_event: threading.Event
+    previous_assignments: Assignments = field(default_factory=dict)
+    now: Optional[datetime] = None  # 増分モードの現在時刻
+    pinned: PinnedAssignments = field(default_factory=dict)
+    hints: Assignments = field(default_factory=dict)  # 初期解のヒント（貪欲解 + 前回解）
+    staff_budgets: Dict[str, int] = field(default_factory=dict)  # スタッフごとの担当スロット数上限
+    salon_wide: bool = True  # サロン全体の制約を含めるか（分解した部分モデルでは False）
+    allow_partial: bool = False  # 固定していない予約の割り当てを任意にする
+    explain: bool = True  # INFEASIBLE のとき矛盾する予約と制約を調べる
+    shifts: Dict[str, ShiftEntry] = field(default_factory=dict)
+    shift_rules: Dict[str, ShiftRule] = field(default_factory=dict)  # 貪欲法のシフトの規則
+    coverage_shortfalls: List[cp_model.IntVar] = field(default_factory=list)  # 最小スタッフ数の不足
+    timer: PhaseTimer = field(default_factory=PhaseTimer)
+    # 矛盾の説明用: 制約のグループごとの仮定リテラル（None なら通常の求解）
+    assumptions: Optional[Dict[ConstraintKey, cp_model.IntVar]] = None
 
 class BeautySchedulerOptimizer:
+    """美容室スケジュール最適化エンジン
+    
+    モデルとソルバーは optimize_schedule の呼び出しごとに作成するため、
+    1つのインスタンスを複数スレッドから同時に再利用できる。曜日別の
+    タイムスロットや目的関数の重みなど、入力に依存しない前計算は
+    インスタンス内で共有する（制約条件・重みは作成後に変更しないこと）。
+    
+    decompose=True にすると、担当可能グラフの連結成分ごとに部分モデルを
+    作って並列に求解し、結果を結合する。サロン全体の制約（最大・最小
+    スタッフ数）が成分間を結びつける場合は1つのモデルで求解する。
+    
+    各フェーズの経過時間・CPU時間とモデル規模・探索統計は solver_stats に含める。
+    phase_hook を渡すと、フェーズの終了ごとと最適化の終了時にイベントを通知する。
+    """
+    
     def __init__(self, salon_constraints: SalonConstraints, 
                  scheduling_constraints: SchedulingConstraints,
-                 objectives: OptimizationObjectives):
+                 objectives: OptimizationObjectives,
+                 formulation: str = FORMULATION_SLOT,
+                 solver_config: Optional[SolverConfig] = None,
+                 decompose: bool = False,
+                 phase_hook: Optional[PhaseHook] = None):
+        if formulation not in FORMULATIONS:
+            raise ValueError(f"未対応の定式化モードです: {formulation}")
         self.salon_constraints = salon_constraints
         self.scheduling_constraints = scheduling_constraints
         self.objectives = objectives
-        self.model = cp_model.CpModel()
-        self.solver = cp_model.CpSolver()
+        self.formulation = formulation
+        self.solver_config = solver_config or SolverConfig()
+        self.decompose = decompose
+        self.phase_hook = phase_hook
+        
+        # 呼び出し間で共有する前計算
+        self._satisfaction_weight = int(objectives.customer_satisfaction_weight * 100)
+        self._utilization_weight = int(objectives.staff_utilization_weight * 10)
+        self._cost_weight = objectives.cost_minimization_weight * 100
+        self._stability_weight = int(objectives.schedule_stability_weight * 100)
+        self._time_slot_cache: Dict[int, Tuple[int, ...]] = {}
+        self._cache_lock = threading.Lock()
+        
+        # 実行中の求解（request_stop 用）
+        self._active_contexts: Set[_SolveContext] = set()
+        self._active_lock = threading.Lock()
         
     def optimize_schedule(self, 
                          staff_list: List[Staff],
                          bookings: List[Booking],
-                         schedule_date: datetime) -> Dict:
-        """メインの最適化関数"""
+                         schedule_date: datetime,
+                         on_solution: Optional[SolutionHandler] = None,
+                         stop_event: Optional[threading.Event] = None,
+                         previous_schedule: Optional[List[Dict]] = None,
+                         now: Optional[datetime] = None,
+                         mode: str = MODE_CP,
+                         staff_minute_budgets: Optional[Dict[str, int]] = None,
+                         fixed_assignments: Optional[Assignments] = None,
+                         allow_partial: bool = False,
+                         explain_infeasibility: bool = True) -> Dict:
+        """メインの最適化関数
+        
+        on_solution を渡すと、探索中に改善解が見つかるたびにその時点の
+        スケジュール（schedule と同じ形式）、目的関数値、上界を通知する。
+        stop_event がセットされると探索を打ち切る。
+        previous_schedule（以前返した schedule）を渡すと、それを初期解のヒントにし、
+        schedule_stability_weight に応じて同じ担当・時刻を維持した予約に報酬を与える。
+        now を渡すと増分モードになり、確定済み・施術中の予約を現在の担当・時刻に
+        固定し、それ以外の予約は now 以降の時刻だけで再最適化する。完了・キャンセル
+        済みの予約は対象外とする。
+        mode="fast" ではCP-SATを使わず貪欲法の結果を返す。mode="cp" でも
+        貪欲解をCP-SATの初期解ヒントに使い、キャンセル以外で解が得られなければ
+        貪欲解を fallback として返す。
+        staff_minute_budgets（staff_id -> 分）を渡すと、各スタッフの担当時間の
+        合計をその値以下に制限する（週次の勤務時間を日ごとに配分する用途）。
+        fixed_assignments（booking_id -> (staff_id, start_slot)）の予約は
+        指定した担当・開始スロットに固定する（大近傍探索で使用）。
+        allow_partial=True にすると、固定していない予約は割り当てなくてもよいものとし、
+        優先度に応じた報酬で割り当てる予約の集合を最大化する。
+        割り当てられなかった予約は unscheduled_booking_ids に含め、1件でもあれば
+        ステータスを PARTIAL にする。
+        explain_infeasibility=False にすると、INFEASIBLE のときに矛盾する予約と
+        制約を調べる再求解を省く（大近傍探索の部分問題など、結果を捨てる用途）。
+        """
+        if mode not in MODES:
+            raise ValueError(f"未対応の求解モードです: {mode}")
+        ctx = _SolveContext(model=cp_model.CpModel(), solver=self._new_solver(),
+                            stop_event=stop_event or threading.Event(),
+                            previous_assignments=self._parse_schedule(previous_schedule or []),
+                            now=now,
+                            staff_budgets={staff_id: minutes // SLOT_MINUTES
+                                           for staff_id, minutes in (staff_minute_budgets or {}).items()},
+                            allow_partial=allow_partial, explain=explain_infeasibility,
+                            timer=PhaseTimer(self.phase_hook))
+        if now is not None:
+            bookings = [b for b in bookings if b.status not in INACTIVE_STATUSES]
+            ctx.pinned = self._frozen_assignments(bookings, schedule_date)
+        ctx.pinned.update(fixed_assignments or {})
+        with self._active_lock:
+            self._active_contexts.add(ctx)
+        wall, cpu = time_module.perf_counter(), time_module.process_time()
+        try:
+            result = self._optimize(ctx, staff_list, bookings, schedule_date, on_solution, mode)
+        finally:
+            with self._active_lock:
+                self._active_contexts.discard(ctx)
+        stats = result.setdefault("solver_stats", {})
+        stats["wall_time"] = time_module.perf_counter() - wall
+        stats["cpu_time"] = time_module.process_time() - cpu
+        stats["phases"] = ctx.timer.summary()
+        if self.phase_hook is not None:
+            self.phase_hook({"event": "result", "status": result["status"], "solver_stats": stats})
+        return result
+    
+    def _optimize(self, ctx: _SolveContext, staff_list: List[Staff], bookings: List[Booking],
+                  schedule_date: datetime, on_solution: Optional[SolutionHandler],
+                  mode: str = MODE_CP) -> Dict:
+        """1回分のモデル構築と求解"""
+        timer = ctx.timer
         
         # 時間スロットを15分単位で分割
-        time_slots = self._generate_time_slots(schedule_date)
+        with timer.phase("time_slots"):
+            time_slots = self._generate_time_slots(schedule_date)
         
-        # 変数の定義
-        assignment_vars = {}
-        staff_schedule_vars = {}
+        # 勤務可能時間・昼休み・閉店時刻・希望時間帯から開始スロットを事前に絞り込む
+        with timer.phase("start_domains"):
+            start_domains = self._compute_start_domains(staff_list, bookings, schedule_date,
+                                                        time_slots, now=ctx.now, pinned=ctx.pinned)
         
-        # スタッフ-予約の割り当て変数
-        for booking in bookings:
-            for staff in staff_list:
-                if self._can_staff_handle_booking(staff, booking):
-                    for slot in time_slots:
-                        var_name = f"assign|{booking.id}|{staff.id}|{slot}"
-                        assignment_vars[var_name] = self.model.NewBoolVar(var_name)
+        # モデルを作る前に分かる実行不可能性（割り当てられない予約・スキルごとの人手不足など）
+        with timer.phase("diagnostics"):
+            issues = self._precheck(ctx, staff_list, bookings, schedule_date, time_slots,
+                                    start_domains)
+        errors = [issue for issue in issues if issue.severity == SEVERITY_ERROR]
+        
+        # 貪欲法による解（高速モードの結果・フォールバック・CP-SATのヒント）
+        with timer.phase("greedy"):
+            greedy_assignments, unscheduled = self._greedy_schedule(
+                ctx, staff_list, bookings, schedule_date, start_domains, len(time_slots))
+        if mode == MODE_FAST:
+            result = self._greedy_result(ctx, greedy_assignments, unscheduled, bookings, staff_list)
+            return self._attach_diagnostics(result, issues)
+        ctx.hints = {**greedy_assignments, **ctx.previous_assignments}
         
-        # スタッフのスケジュール変数
+        components = find_components(start_domains) if self.decompose else []
+        blocker = (self._decomposition_blocker(staff_list, bookings, components)
+                   if len(components) > 1 else None)
+        if errors:
+            # 実行不可能と分かっているのでCP-SATは実行しない
+            result = {"status": "INFEASIBLE", "message": errors[0].message}
+        elif len(components) > 1 and blocker is None:
+            result = self._optimize_components(ctx, components, staff_list, bookings, schedule_date,
+                                               time_slots, start_domains, on_solution)
+        else:
+            result = self._optimize_model(ctx, staff_list, bookings, schedule_date,
+                                          time_slots, start_domains, on_solution)
+            if blocker is not None:
+                result.setdefault("solver_stats", {})["decomposition"] = {
+                    "components": len(components), "fallback_reason": blocker}
+        
+        if (result["status"] == "INFEASIBLE" and ctx.explain and not errors
+                and not ctx.stop_event.is_set()):
+            with timer.phase("explanation"):
+                conflicts = self._explain_infeasibility(ctx, staff_list, bookings, schedule_date,
+                                                        time_slots, start_domains)
+            if conflicts:
+                result["message"] = conflicts[0].message
+            issues += conflicts
+        
+        if result["status"] in ("INFEASIBLE", "UNKNOWN") and not ctx.stop_event.is_set():
+            fallback = self._greedy_result(ctx, greedy_assignments, unscheduled, bookings, staff_list)
+            fallback["fallback"] = True
+            fallback["solver_stats"]["cp_status"] = result["status"]
+            if "message" in result:
+                fallback["message"] = result["message"]
+            return self._attach_diagnostics(fallback, issues)
+        if "schedule" in result:
+            self._mark_unscheduled(result, bookings)
+        return self._attach_diagnostics(result, issues)
+    
+    def _mark_unscheduled(self, result: Dict, bookings: List[Booking]):
+        """割り当てられなかった予約を unscheduled_booking_ids に含める
+
+        開始候補がなくモデルに含まれない予約も含む。1件でもあればステータスを PARTIAL
+        にする（CP-SATのステータスは solver_stats["status"] に残る）。
+        """
+        scheduled = {item["booking_id"] for item in result["schedule"]}
+        unscheduled = [b.id for b in bookings if b.id not in scheduled]
+        result["unscheduled_booking_ids"] = unscheduled
+        if unscheduled:
+            result["status"] = "PARTIAL"
+    
+    def _attach_diagnostics(self, result: Dict, issues: List[FeasibilityIssue]) -> Dict:
+        """見つかった実行不可能性の理由をレスポンスの diagnostics に含める"""
+        if issues:
+            result["diagnostics"] = [issue.to_dict() for issue in issues]
+        return result
+    
+    def _precheck(self, ctx: _SolveContext, staff_list: List[Staff], bookings: List[Booking],
+                  schedule_date: datetime, time_slots: List[int],
+                  start_domains: StartDomains) -> List[FeasibilityIssue]:
+        """モデルを作らずに調べられる実行不可能性
+        
+        担当可能なスタッフがいない・閉店までに終わらない・勤務可能時間に収まらない予約と、
+        サービス種別ごとの所要時間が担当可能なスタッフの勤務可能時間を超える場合（全予約の
+        割り当てが必要なので実行不可能。部分割り当てモードでは一部の予約が割り当てられない
+        だけ）、同じスタッフに固定した予約の重なり、勤務可能なスタッフが最小スタッフ数に
+        足りない場合を検出する。
+        """
+        horizon = len(time_slots)
+        if horizon == 0:
+            return []
+        eligibility = EligibilityMatrix(staff_list, bookings)
+        durations = {booking.id: self._duration_slots(booking) for booking in bookings}
+        start_windows = {booking.id: self._booking_start_window(booking, schedule_date, horizon)
+                         for booking in bookings}
+        # 固定していない予約は昼休みにかからないので、昼休みは勤務可能時間から除く
+        lunch = self._lunch_break_slots(schedule_date)
+        capacities = {}
         for staff in staff_list:
-            for slot in time_slots:
-                var_name = f"staff_{staff.id}_slot_{slot}"
-                staff_schedule_vars[var_name] = self.model.NewBoolVar(var_name)
+            slots = self._staff_available_slots(staff, schedule_date, horizon)
+            if lunch:
+                slots = [slot for slot in slots if not lunch[0] <= slot < lunch[1]]
+            capacity = min(len(slots), staff.max_hours_per_day * 60 // SLOT_MINUTES)
+            capacities[staff.id] = min(capacity, ctx.staff_budgets.get(staff.id, capacity))
+        placeable = {booking_id for booking_id, _ in start_domains}
+        pinned = {booking_id: value for booking_id, value in ctx.pinned.items()
+                  if booking_id in placeable}
+        severity = SEVERITY_WARNING if ctx.allow_partial else SEVERITY_ERROR
+        return (find_unplaceable_bookings(bookings, eligibility, start_domains, durations,
+                                          start_windows, horizon, severity)
+                + find_pinned_overlaps(pinned, durations)
+                + find_skill_shortages(bookings, start_domains, durations, capacities,
+                                       SLOT_MINUTES, severity, pinned)
+                + find_staffing_shortage(self.salon_constraints.min_staff_count,
+                                         [staff_id for staff_id, capacity in capacities.items()
+                                          if capacity > 0]))
+    
+    def _explain_infeasibility(self, ctx: _SolveContext, staff_list: List[Staff],
+                               bookings: List[Booking], schedule_date: datetime,
+                               time_slots: List[int],
+                               start_domains: StartDomains) -> List[FeasibilityIssue]:
+        """実行不可能なモデルから、同時に満たせない予約と制約の組を取り出す
         
-        # 制約条件を追加
-        self._add_booking_constraints(assignment_vars, bookings, staff_list, time_slots)
-        self._add_staff_constraints(staff_schedule_vars, assignment_vars, staff_list, time_slots)
-        self._add_salon_constraints(assignment_vars, staff_schedule_vars, staff_list, time_slots)
+        予約の割り当て・スタッフの重なり禁止・シフトの長さなどの制約をグループごとの
+        仮定リテラルで有効にしたモデル（開始スロットの定式化）を作り、CP-SATが返す
+        実行不可能性の十分条件となる仮定の集合（最小とは限らない）を説明にする。
+        """
+        solver = cp_model.CpSolver()
+        limit = self.solver_config.max_time_in_seconds
+        solver.parameters.max_time_in_seconds = min(limit or EXPLANATION_TIME_LIMIT,
+                                                    EXPLANATION_TIME_LIMIT)
+        solver.parameters.num_workers = 1  # 仮定のコアは単一ワーカーの探索で得られる
+        explain_ctx = _SolveContext(
+            model=cp_model.CpModel(), solver=solver, stop_event=ctx.stop_event, now=ctx.now,
+            pinned=ctx.pinned, staff_budgets=ctx.staff_budgets, allow_partial=ctx.allow_partial,
+            timer=PhaseTimer(), assumptions={})
+        self._build_slot_model(explain_ctx, staff_list, bookings, schedule_date, time_slots,
+                               start_domains)
+        keys = {literal.Index(): key for key, literal in explain_ctx.assumptions.items()}
+        explain_ctx.model.AddAssumptions(list(explain_ctx.assumptions.values()))
+        with self._active_lock:
+            self._active_contexts.add(explain_ctx)
+        try:
+            status = solver.Solve(explain_ctx.model)
+        finally:
+            with self._active_lock:
+                self._active_contexts.discard(explain_ctx)
+        if status != cp_model.INFEASIBLE:
+            return []
+        core = [keys[index] for index in solver.SufficientAssumptionsForInfeasibility()
+                if index in keys]
+        return [conflict_issue(core)] if core else []
+    
+    def _guard(self, ctx: _SolveContext, constraint: cp_model.Constraint, kind: str, subject: str):
+        """矛盾の説明用のモデルでは、制約をグループの仮定リテラルで有効にする"""
+        if ctx.assumptions is None:
+            return
+        literal = ctx.assumptions.get((kind, subject))
+        if literal is None:
+            literal = ctx.model.NewBoolVar(f"assume|{kind}|{subject}")
+            ctx.assumptions[(kind, subject)] = literal
+        constraint.OnlyEnforceIf(literal)
+    
+    def _optimize_model(self, ctx: _SolveContext, staff_list: List[Staff], bookings: List[Booking],
+                        schedule_date: datetime, time_slots: List[int], start_domains: StartDomains,
+                        on_solution: Optional[SolutionHandler] = None) -> Dict:
+        """定式化モードに応じて1つのモデルを構築して求解"""
+        if self.formulation == FORMULATION_INTERVAL:
+            return self._optimize_interval_model(ctx, staff_list, bookings, schedule_date,
+                                                 time_slots, start_domains, on_solution)
+        return self._optimize_slot_model(ctx, staff_list, bookings, schedule_date,
+                                         time_slots, start_domains, on_solution)
+    
+    def _decomposition_blocker(self, staff_list: List[Staff], bookings: List[Booking],
+                               components: List[Component]) -> Optional[str]:
+        """成分ごとに分解できない理由（分解できれば None）
+        
+        最大スタッフ数は全スタッフ数以上なら成分の割り当てに関係なく満たせる。
+        最小スタッフ数は担当のないスタッフのシフトにも関わるため、0 の場合に限る。
+        容量のある設備は1つの成分の予約だけが使う場合に限り部分モデルで扱える。
+        """
+        constraints = self.salon_constraints
+        component_of = {bid: index for index, component in enumerate(components)
+                        for bid in component.booking_ids}
+        station_components: Dict[str, Set[int]] = {}
+        for booking in bookings:
+            if booking.id not in component_of:
+                continue
+            for station, _, _ in self._equipment_segments(booking):
+                station_components.setdefault(station, set()).add(component_of[booking.id])
+        if any(len(indexes) > 1 for indexes in station_components.values()):
+            return "equipment"
+        if len(staff_list) > constraints.max_staff_count:
+            return "max_staff_count"
+        if constraints.min_staff_count > 0:
+            return "min_staff_count"
+        return None
+    
+    def _optimize_components(self, ctx: _SolveContext, components: List[Component],
+                             staff_list: List[Staff], bookings: List[Booking],
+                             schedule_date: datetime, time_slots: List[int],
+                             start_domains: StartDomains,
+                             on_solution: Optional[SolutionHandler] = None) -> Dict:
+        """連結成分ごとの部分モデルを並列に求解して結合"""
+        staff_map = {s.id: s for s in staff_list}
+        booking_map = {b.id: b for b in bookings}
+        
+        def solve(index: int, component: Component) -> Tuple[_SolveContext, Dict]:
+            sub_ctx = _SolveContext(
+                model=cp_model.CpModel(), solver=self._new_solver(), stop_event=ctx.stop_event,
+                previous_assignments=ctx.previous_assignments, now=ctx.now, pinned=ctx.pinned,
+                hints=ctx.hints, staff_budgets=ctx.staff_budgets, salon_wide=False,
+                allow_partial=ctx.allow_partial, timer=ctx.timer)
+            booking_ids = set(component.booking_ids)
+            sub_domains = {key: starts for key, starts in start_domains.items()
+                           if key[0] in booking_ids}
+            def handler(progress: Dict):
+                on_solution({**progress, "component": index})
+            with self._active_lock:
+                self._active_contexts.add(sub_ctx)
+            try:
+                return sub_ctx, self._optimize_model(
+                    sub_ctx, [staff_map[sid] for sid in component.staff_ids],
+                    [booking_map[bid] for bid in component.booking_ids],
+                    schedule_date, time_slots, sub_domains, handler if on_solution else None)
+            finally:
+                with self._active_lock:
+                    self._active_contexts.discard(sub_ctx)
+        
+        with ThreadPoolExecutor(max_workers=min(len(components), os.cpu_count() or 1),
+                                thread_name_prefix="component") as executor:
+            futures = [executor.submit(solve, index, component)
+                       for index, component in enumerate(components)]
+            solved = [future.result() for future in futures]
+        
+        return self._merge_component_results(ctx, solved, bookings)
+    
+    def _merge_component_results(self, ctx: _SolveContext, solved: List[Tuple[_SolveContext, Dict]],
+                                 bookings: List[Booking]) -> Dict:
+        """部分モデルの結果を1つのレスポンスにまとめる（1つでも解がなければその結果）"""
+        for _, result in solved:
+            if result["status"] not in ("OPTIMAL", "FEASIBLE"):
+                return result
+        
+        order = {b.id: i for i, b in enumerate(bookings)}
+        schedule = sorted((item for _, result in solved for item in result["schedule"]),
+                          key=lambda item: order[item["booking_id"]])
+        objective_value = sum(sub.solver.ObjectiveValue() for sub, _ in solved)
+        best_bound = sum(sub.solver.BestObjectiveBound() for sub, _ in solved)
+        statuses = {result["status"] for _, result in solved}
+        status = "OPTIMAL" if statuses == {"OPTIMAL"} else "FEASIBLE"
+        shifts = [shift for _, result in solved for shift in result.get("shifts", [])]
+        models = [model_size(sub.model) for sub, _ in solved]
+        searches = [search_statistics(sub.solver) for sub, _ in solved]
+        result = {
+            "status": status,
+            "schedule": schedule,
+            "shifts": shifts,
+            "labor_cost": sum(shift["labor_cost"] for shift in shifts),
+            "solver_stats": {
+                "status": status,
+                "solve_time": max(sub.solver.WallTime() for sub, _ in solved),
+                "objective_value": objective_value,
+                "best_bound": best_bound,
+                "gap": abs(best_bound - objective_value) / max(1.0, abs(objective_value)),
+                "solver_config": asdict(self.solver_config),
+                "model": {key: sum(model[key] for model in models) for key in models[0]},
+                "search": {key: sum(search[key] for search in searches) for key in searches[0]},
+                "decomposition": {"components": len(solved)},
+            }
+        }
+        if ctx.now is not None:
+            result["frozen_booking_ids"] = sorted(ctx.pinned)
+        return result
+    
+    def _optimize_slot_model(self, ctx: _SolveContext, staff_list: List[Staff],
+                             bookings: List[Booking], schedule_date: datetime,
+                             time_slots: List[int], start_domains: StartDomains,
+                             on_solution: Optional[SolutionHandler] = None) -> Dict:
+        """開始スロットごとのBool変数で最適化"""
+        model, timer = ctx.model, ctx.timer
+        assignment_vars, tasks = self._build_slot_model(ctx, staff_list, bookings, schedule_date,
+                                                        time_slots, start_domains)
         
         # 目的関数の設定
-        objective_expr = self._create_objective_function(assignment_vars, staff_schedule_vars, 
-                                                        bookings, staff_list, time_slots)
-        self.model.Maximize(objective_expr)
+        with timer.phase("objective", model):
+            objective_expr = self._create_objective_function(assignment_vars, bookings)
+            objective_expr += self._create_shift_cost_terms(ctx, staff_list, tasks)
+            objective_expr += self._create_stability_terms(ctx, assignment_vars)
+            objective_expr += self._create_placement_terms(ctx, bookings, assignment_vars.for_booking)
+            model.Maximize(objective_expr)
+        
+        # 貪欲解・前回のスケジュールから初期解のヒントを与える
+        with timer.phase("hints"):
+            self._add_solution_hints(ctx, assignment_vars)
         
         # 求解
-        status = self.solver.Solve(self.model)
+        with timer.phase("solve", process_cpu=True):
+            status = self._solve(ctx, on_solution, lambda value: self._collect_schedule(
+                assignment_vars, bookings, staff_list, value))
         
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            return self._extract_solution(assignment_vars, staff_schedule_vars, 
-                                        bookings, staff_list, time_slots)
+            with timer.phase("extraction"):
+                return self._extract_solution(ctx, assignment_vars, bookings, staff_list, status)
         else:
-            return {"status": "INFEASIBLE", "message": "最適解が見つかりませんでした"}
+            return self._no_solution_result(ctx, status)
+    
+    def _build_slot_model(self, ctx: _SolveContext, staff_list: List[Staff],
+                          bookings: List[Booking], schedule_date: datetime,
+                          time_slots: List[int], start_domains: StartDomains
+                          ) -> Tuple[AssignmentVariables, Dict[str, List[Task]]]:
+        """開始スロットの定式化の変数と制約（目的関数を除く）"""
+        model, timer = ctx.model, ctx.timer
+        
+        # 変数の定義
+        assignment_vars = AssignmentVariables()
+        
+        with timer.phase("variables", model):
+            # スタッフ-予約の割り当て変数（実行可能な開始スロットのみ）
+            for (booking_id, staff_id), starts in start_domains.items():
+                for slot in starts:
+                    assignment_vars.add(model, booking_id, staff_id, slot)
+            
+            # スタッフごとの施術区間
+            tasks = self._slot_tasks(model, assignment_vars, bookings)
+        
+        # スタッフごとのシフト
+        with timer.phase("shift_model", model):
+            ctx.shifts = self._add_shift_model(ctx, staff_list, tasks, schedule_date, len(time_slots))
+        
+        # 制約条件を追加
+        with timer.phase("booking_constraints", model):
+            self._add_booking_constraints(ctx, assignment_vars, bookings, staff_list, time_slots)
+        with timer.phase("staff_constraints", model):
+            self._add_staff_constraints(ctx, tasks, assignment_vars, staff_list, time_slots)
+        if ctx.salon_wide:
+            with timer.phase("salon_constraints", model):
+                self._add_salon_constraints(ctx, staff_list, schedule_date, len(time_slots))
+        with timer.phase("budget_constraints", model):
+            self._add_budget_constraints(ctx, assignment_vars, bookings)
+        with timer.phase("equipment_constraints", model):
+            self._add_equipment_constraints(ctx, assignment_vars, bookings)
+        return assignment_vars, tasks
+    
+    def _frozen_assignments(self, bookings: List[Booking],
+                            schedule_date: datetime) -> PinnedAssignments:
+        """確定済み・施術中の予約を現在の担当・予約時刻に固定"""
+        day_start = self._day_start(schedule_date)
+        if day_start is None:
+            return {}
+        return {
+            booking.id: (booking.assigned_staff_id,
+                         self._to_slot(booking.scheduled_start, day_start, round_up=False))
+            for booking in bookings
+            if booking.status in FROZEN_STATUSES
+        }
+    
+    def _parse_schedule(self, schedule: List[Dict]) -> Assignments:
+        """レスポンス形式のスケジュールを booking_id -> (staff_id, start_slot) に変換"""
+        return {
+            item["booking_id"]: (item["staff_id"], int(item["start_slot"]))
+            for item in schedule
+        }
+    
+    def _add_solution_hints(self, ctx: _SolveContext, assignment_vars: AssignmentVariables):
+        """ヒントに含まれる予約の割り当て変数にヒントを与える"""
+        hints = ctx.hints
+        if not hints:
+            return
+        for key, var in assignment_vars.items():
+            if key.booking_id in hints:
+                ctx.model.AddHint(var, hints[key.booking_id] == (key.staff_id, key.slot))
+    
+    def _greedy_schedule(self, ctx: _SolveContext, staff_list: List[Staff], bookings: List[Booking],
+                         schedule_date: datetime, start_domains: StartDomains,
+                         horizon: int) -> Tuple[Assignments, List[str]]:
+        """貪欲法で割り当て（固定予約を最初に処理し、シフトの規則を守る）"""
+        durations = {booking.id: self._duration_slots(booking) for booking in bookings}
+        equipment = {booking.id: self._equipment_segments(booking) for booking in bookings}
+        ctx.shift_rules = self._shift_rules(staff_list, schedule_date, horizon)
+        scheduler = GreedyScheduler(max_concurrent=self.salon_constraints.max_staff_count,
+                                    station_capacities=self.salon_constraints.equipment_constraints)
+        return scheduler.schedule(staff_list, bookings, start_domains, durations, horizon,
+                                  first=ctx.pinned.keys(), budgets=ctx.staff_budgets,
+                                  equipment=equipment, shift_rules=ctx.shift_rules)
+    
+    def _shift_rules(self, staff_list: List[Staff], schedule_date: datetime,
+                     horizon: int) -> Dict[str, ShiftRule]:
+        """勤務可能なスタッフごとのシフトの長さの上限と休憩の規則（スロット数）
+        
+        休憩は min_staff_break_duration とスタッフの min_break_minutes の長い方。
+        """
+        frequency = max(1, int(self.scheduling_constraints.staff_break_frequency.total_seconds()
+                               // 60 // SLOT_MINUTES))
+        rules = {}
+        for staff in staff_list:
+            windows = self._staff_windows(staff, schedule_date, horizon)
+            if not windows:
+                continue
+            span = max(end for _, end in windows) - min(start for start, _ in windows)
+            break_minutes = max(
+                self.scheduling_constraints.min_staff_break_duration.total_seconds() // 60,
+                staff.min_break_minutes)
+            rules[staff.id] = ShiftRule(
+                max_length=min(span, staff.max_hours_per_day * 60 // SLOT_MINUTES),
+                frequency=frequency, break_slots=-(-int(break_minutes) // SLOT_MINUTES))
+        return rules
+    
+    def _greedy_result(self, ctx: _SolveContext, assignments: Assignments, unscheduled: List[str],
+                       bookings: List[Booking], staff_list: List[Staff]) -> Dict:
+        """貪欲法の割り当てをレスポンス形式にまとめる"""
+        staff_map = {s.id: s for s in staff_list}
+        schedule = [
+            self._schedule_entry(booking, staff_map[assignments[booking.id][0]],
+                                 assignments[booking.id][1])
+            for booking in bookings
+            if booking.id in assignments
+        ]
+        # 貪欲法のシフトは担当する施術の最初から最後まで（休憩は CP-SAT と同じ規則で置く）
+        spans: Dict[str, Tuple[int, int]] = {}
+        for item in schedule:
+            start, end = spans.get(item["staff_id"], (item["start_slot"], 0))
+            spans[item["staff_id"]] = (min(start, item["start_slot"]),
+                                       max(end, item["start_slot"] + item["duration_slots"]))
+        shifts = []
+        for staff in staff_list:
+            if staff.id not in spans:
+                continue
+            rule = ctx.shift_rules.get(staff.id)
+            tasks = [(item["start_slot"], item["duration_slots"])
+                     for item in schedule if item["staff_id"] == staff.id]
+            breaks = shift_breaks(tasks, rule) if rule is not None else None
+            shifts.append(self._shift_entry(staff, *spans[staff.id], breaks or []))
+        result = {
+            "status": "PARTIAL" if unscheduled else "FEASIBLE",
+            "schedule": schedule,
+            "shifts": shifts,
+            "labor_cost": sum(shift["labor_cost"] for shift in shifts),
+            "unscheduled_booking_ids": list(unscheduled),
+            "fallback": False,
+            "solver_stats": {"engine": "greedy"},
+        }
+        if ctx.now is not None:
+            result["frozen_booking_ids"] = sorted(ctx.pinned)
+        return result
+    
+    def _create_stability_terms(self, ctx: _SolveContext,
+                                assignment_vars: AssignmentVariables) -> cp_model.LinearExpr:
+        """前回と同じ担当・開始時刻を維持した予約への報酬"""
+        if not self._stability_weight:
+            return 0
+        kept = []
+        for booking_id, (staff_id, slot) in ctx.previous_assignments.items():
+            var = assignment_vars.get(booking_id, staff_id, slot)
+            if var is not None:
+                kept.append(var)
+        return self._stability_weight * sum(kept) if kept else 0
+    
+    def _new_solver(self) -> cp_model.CpSolver:
+        """SolverConfig を反映したCP-SATソルバーを作成"""
+        solver = cp_model.CpSolver()
+        config = self.solver_config
+        if config.max_time_in_seconds is not None:
+            solver.parameters.max_time_in_seconds = config.max_time_in_seconds
+        if config.num_search_workers is not None:
+            solver.parameters.num_workers = config.num_search_workers
+        if config.relative_gap_limit is not None:
+            solver.parameters.relative_gap_limit = config.relative_gap_limit
+        if config.random_seed is not None:
+            solver.parameters.random_seed = config.random_seed
+        solver.parameters.log_search_progress = config.log_search_progress
+        return solver
+    
+    def request_stop(self, stop_event: Optional[threading.Event] = None):
+        """実行中の探索を打ち切る（別スレッドから呼び出し可能）
+        
+        stop_event を指定するとその呼び出しだけを、省略すると実行中の全呼び出しを
+        停止する。それまでに見つかった最良解があればそれを返し、なければ
+        CANCELLED を返す。
+        """
+        if stop_event is not None:
+            stop_event.set()
+        with self._active_lock:
+            contexts = list(self._active_contexts)
+        for ctx in contexts:
+            if stop_event is None or ctx.stop_event is stop_event:
+                ctx.stop_event.set()
+                ctx.solver.StopSearch()
+    
+    def _solve(self, ctx: _SolveContext, on_solution: Optional[SolutionHandler] = None,
+               schedule_builder: Optional[Callable[[ValueFn], List[Dict]]] = None) -> int:
+        """停止要求と改善解の通知に対応して求解"""
+        if ctx.stop_event.is_set():
+            return cp_model.UNKNOWN
+        observer = _SolutionObserver(on_solution, ctx.stop_event, schedule_builder)
+        return ctx.solver.Solve(ctx.model, observer)
+    
+    def _no_solution_result(self, ctx: _SolveContext, status: int) -> Dict:
+        """解が得られなかったときのレスポンス"""
+        if ctx.stop_event.is_set():
+            return {"status": "CANCELLED", "message": "最適化がキャンセルされました"}
+        if status == cp_model.UNKNOWN:
+            return {"status": "UNKNOWN", "message": "制限時間内に解が見つかりませんでした"}
+        if status == cp_model.MODEL_INVALID:
+            # 予約の矛盾ではないので、矛盾の説明や貪欲法へのフォールバックは行わない
+            return {"status": "MODEL_INVALID", "message": "モデルまたはソルバー設定が不正です"}
+        return {"status": "INFEASIBLE", "message": "最適解が見つかりませんでした"}
     
     def _generate_time_slots(self, schedule_date: datetime) -> List[int]:
-        """15分単位のタイムスロットを生成"""
+        """15分単位のタイムスロットを生成（曜日ごとにキャッシュ）"""
+        day_of_week = schedule_date.weekday()
+        with self._cache_lock:
+            cached = self._time_slot_cache.get(day_of_week)
+        if cached is None:
+            cached = tuple(self._build_time_slots(schedule_date))
+            with self._cache_lock:
+                self._time_slot_cache[day_of_week] = cached
+        return list(cached)
+    
+    def _build_time_slots(self, schedule_date: datetime) -> List[int]:
         day_of_week = schedule_date.weekday()
         if day_of_week not in self.salon_constraints.operating_hours:
             return []
@@ -76,11 +757,156 @@ class BeautySchedulerOptimizer:
         slot_id = 0
         while current_time < end_datetime:
             slots.append(slot_id)
-            current_time += timedelta(minutes=15)
+            current_time += timedelta(minutes=SLOT_MINUTES)
             slot_id += 1
         
         return slots
     
+    def _day_start(self, schedule_date: datetime) -> Optional[datetime]:
+        """スロット0に対応する開店日時（定休日はNone）"""
+        hours = self.salon_constraints.operating_hours.get(schedule_date.weekday())
+        if hours is None:
+            return None
+        return datetime.combine(schedule_date.date(), hours[0])
+    
+    def _to_slot(self, moment: datetime, day_start: datetime, round_up: bool) -> int:
+        """日時を開店時刻からのスロット番号に変換"""
+        minutes = (moment - day_start).total_seconds() / 60
+        if round_up:
+            return -int(-minutes // SLOT_MINUTES)
+        return int(minutes // SLOT_MINUTES)
+    
+    def _staff_windows(self, staff: Staff, schedule_date: datetime,
+                       horizon: int) -> List[Tuple[int, int]]:
+        """スタッフの勤務可能時間帯を [開始スロット, 終了スロット) のリストで返す
+        
+        勤務可能時間が一切登録されていないスタッフは営業時間中すべて勤務可能とみなす。
+        """
+        if not staff.availability:
+            return [(0, horizon)]
+        
+        day_start = self._day_start(schedule_date)
+        windows = []
+        for availability in staff.availability:
+            if availability.day_of_week != schedule_date.weekday():
+                continue
+            start = self._to_slot(datetime.combine(schedule_date.date(), availability.start_time),
+                                  day_start, round_up=True)
+            end = self._to_slot(datetime.combine(schedule_date.date(), availability.end_time),
+                                day_start, round_up=False)
+            start, end = max(start, 0), min(end, horizon)
+            if start < end:
+                windows.append((start, end))
+        return windows
+    
+    def _staff_available_slots(self, staff: Staff, schedule_date: datetime,
+                               horizon: int) -> List[int]:
+        """スタッフが勤務可能なスロット一覧"""
+        slots = set()
+        for start, end in self._staff_windows(staff, schedule_date, horizon):
+            slots.update(range(start, end))
+        return sorted(slots)
+    
+    def _lunch_break_slots(self, schedule_date: datetime) -> Optional[Tuple[int, int]]:
+        """サロンの昼休みを [開始スロット, 終了スロット) で返す"""
+        if self.salon_constraints.lunch_break_duration <= timedelta(0):
+            return None
+        day_start = self._day_start(schedule_date)
+        lunch_start = datetime.combine(schedule_date.date(), self.salon_constraints.lunch_break_start)
+        lunch_end = lunch_start + self.salon_constraints.lunch_break_duration
+        return (self._to_slot(lunch_start, day_start, round_up=False),
+                self._to_slot(lunch_end, day_start, round_up=True))
+    
+    def _booking_start_window(self, booking: Booking, schedule_date: datetime,
+                              horizon: int) -> Tuple[int, int]:
+        """顧客が受け入れ可能な開始スロットの範囲 [最早, 最遅]
+        
+        時間調整可能な予約は latest_acceptable_start（未指定なら閉店まで）まで、
+        それ以外は予約時刻から最大待ち時間までを許容する。
+        """
+        day_start = self._day_start(schedule_date)
+        if booking.is_flexible_time:
+            latest_start = booking.latest_acceptable_start
+        else:
+            latest_start = booking.scheduled_start + self.scheduling_constraints.max_customer_wait_time
+        
+        earliest = max(self._to_slot(booking.scheduled_start, day_start, round_up=True), 0)
+        latest = horizon - 1
+        if latest_start is not None:
+            latest = min(self._to_slot(latest_start, day_start, round_up=False), latest)
+        return earliest, latest
+    
+    def _compute_start_domains(self, staff_list: List[Staff], bookings: List[Booking],
+                               schedule_date: datetime, time_slots: List[int],
+                               now: Optional[datetime] = None,
+                               pinned: Optional[PinnedAssignments] = None) -> StartDomains:
+        """(予約, スタッフ) ごとに実行可能な開始スロットを計算
+        
+        スキル要件、スタッフの勤務可能時間、昼休み、閉店時刻までの所要時間、
+        顧客の希望時間帯をすべて満たす開始スロットだけを残す。
+        now 以降に開始するスロットだけを残し、pinned の予約は固定した
+        担当・開始スロットだけを候補にする。
+        """
+        domains: StartDomains = {}
+        horizon = len(time_slots)
+        if horizon == 0:
+            return domains
+        pinned = pinned or {}
+        now_slot = 0
+        if now is not None:
+            now_slot = max(self._to_slot(now, self._day_start(schedule_date), round_up=True), 0)
+        
+        staff_windows = {
+            staff.id: self._staff_windows(staff, schedule_date, horizon) for staff in staff_list
+        }
+        lunch = self._lunch_break_slots(schedule_date)
+        eligibility = EligibilityMatrix(staff_list, bookings)
+        
+        for booking in bookings:
+            if booking.id in pinned:
+                staff_id, slot = pinned[booking.id]
+                staff_ids = [staff_id] if staff_id is not None else eligibility.eligible_staff_ids(booking.id)
+                for staff_id in staff_ids:
+                    if staff_id in staff_windows and 0 <= slot < horizon:
+                        domains[(booking.id, staff_id)] = [slot]
+                continue
+            
+            duration = self._duration_slots(booking)
+            earliest, latest = self._booking_start_window(booking, schedule_date, horizon)
+            earliest = max(earliest, now_slot)
+            if earliest > latest:
+                continue
+            
+            for staff_id in eligibility.eligible_staff_ids(booking.id):
+                starts = set()
+                for window_start, window_end in staff_windows[staff_id]:
+                    for slot in range(max(window_start, earliest),
+                                      min(window_end - duration, latest) + 1):
+                        if lunch and slot < lunch[1] and slot + duration > lunch[0]:
+                            continue
+                        starts.add(slot)
+                if starts:
+                    domains[(booking.id, staff_id)] = sorted(starts)
+        
+        return domains
+    
+    def _duration_slots(self, booking: Booking) -> int:
+        """準備・片付けを含む予約の所要スロット数（切り上げ）"""
+        total_minutes = int(booking.total_duration.total_seconds() // 60)
+        return -(-total_minutes // SLOT_MINUTES)
+    
+    def _equipment_segments(self, booking: Booking) -> List[Tuple[str, int, int]]:
+        """容量のある設備について予約開始からの (設備, 開始オフセット, 占有スロット数)"""
+        capacities = self.salon_constraints.equipment_constraints
+        segments = []
+        for station, offset_minutes, minutes in booking.equipment_usage():
+            if station not in capacities:
+                continue
+            offset = offset_minutes // SLOT_MINUTES
+            end = -(-(offset_minutes + minutes) // SLOT_MINUTES)
+            segments.append((station, offset, end - offset))
+        return segments
+    
     def _can_staff_handle_booking(self, staff: Staff, booking: Booking) -> bool:
         """スタッフが予約を処理できるかチェック"""
         for service in booking.services:
@@ -88,134 +914,548 @@ class BeautySchedulerOptimizer:
                 return False
         return True
     
-    def _add_booking_constraints(self, assignment_vars: Dict, bookings: List[Booking], 
-                               staff_list: List[Staff], time_slots: List[int]):
+    def _add_booking_constraints(self, ctx: _SolveContext, assignment_vars: AssignmentVariables,
+                               bookings: List[Booking], staff_list: List[Staff], time_slots: List[int]):
         """予約関連の制約を追加"""
         for booking in bookings:
             # 各予約は必ず1人のスタッフに1つの時間に割り当てられる
-            booking_assignments = []
-            for staff in staff_list:
-                for slot in time_slots:
-                    var_name = f"assign|{booking.id}|{staff.id}|{slot}"
-                    if var_name in assignment_vars:
-                        booking_assignments.append(assignment_vars[var_name])
+            booking_assignments = assignment_vars.for_booking(booking.id)
             
             if booking_assignments:
-                self.model.Add(sum(booking_assignments) == 1)
+                total = sum(booking_assignments)
+                constraint = total <= 1 if self._is_optional(ctx, booking.id) else total == 1
+                self._guard(ctx, ctx.model.Add(constraint), CONSTRAINT_BOOKING, booking.id)
+    
+    def _is_optional(self, ctx: _SolveContext, booking_id: str) -> bool:
+        """部分割り当てモードで、割り当てなくてもよい予約か（固定した予約は必須）"""
+        return ctx.allow_partial and booking_id not in ctx.pinned
+    
+    def _create_placement_terms(self, ctx: _SolveContext, bookings: List[Booking],
+                                placements: Callable[[str], List[cp_model.IntVar]]
+                                ) -> cp_model.LinearExpr:
+        """部分割り当てモードで、割り当てた予約への優先度に応じた報酬"""
+        if not ctx.allow_partial:
+            return 0
+        terms = []
+        for booking in bookings:
+            literals = placements(booking.id)
+            if literals:
+                terms.append(PLACEMENT_REWARD * booking.customer.priority.value * sum(literals))
+        return sum(terms) if terms else 0
+    
+    def _slot_tasks(self, model: cp_model.CpModel, assignment_vars: AssignmentVariables,
+                    bookings: List[Booking]) -> Dict[str, List[Task]]:
+        """割り当て変数ごとの固定開始のオプショナル施術区間（スタッフ別）"""
+        durations = {booking.id: self._duration_slots(booking) for booking in bookings}
+        tasks: Dict[str, List[Task]] = {}
+        for key, var in assignment_vars.items():
+            duration = durations[key.booking_id]
+            interval = model.NewOptionalFixedSizeIntervalVar(
+                key.slot, duration, var, f"task|{key.booking_id}|{key.staff_id}|{key.slot}")
+            tasks.setdefault(key.staff_id, []).append(Task(var, key.slot, duration, interval))
+        return tasks
     
-    def _add_staff_constraints(self, staff_schedule_vars: Dict, assignment_vars: Dict,
+    def _add_staff_constraints(self, ctx: _SolveContext, tasks: Dict[str, List[Task]],
+                             assignment_vars: AssignmentVariables,
                              staff_list: List[Staff], time_slots: List[int]):
         """スタッフ関連の制約を追加"""
         for staff in staff_list:
-            # 同時に複数の予約を担当できない
-            for slot in time_slots:
-                slot_assignments = []
-                for var_name in assignment_vars.keys():
-                    if f"|{staff.id}|{slot}" in var_name:
-                        slot_assignments.append(assignment_vars[var_name])
-                
-                if slot_assignments:
-                    self.model.Add(sum(slot_assignments) <= 1)
+            intervals = [task.interval for task in tasks.get(staff.id, [])]
+            # 同時に複数の予約を担当できず、休憩中は施術しない
+            self._add_no_overlap(ctx, staff.id, intervals)
             
             # 連続勤務時間制限
-            self._add_consecutive_work_constraint(staff, assignment_vars, time_slots)
+            self._add_consecutive_work_constraint(ctx, staff, intervals, len(time_slots))
     
-    def _add_salon_constraints(self, assignment_vars: Dict, staff_schedule_vars: Dict,
-                             staff_list: List[Staff], time_slots: List[int]):
-        """サロン全体の制約を追加"""
-        # 最小・最大スタッフ数制約
-        for slot in time_slots:
-            working_staff = []
-            for staff in staff_list:
-                var_name = f"staff_{staff.id}_slot_{slot}"
-                if var_name in staff_schedule_vars:
-                    working_staff.append(staff_schedule_vars[var_name])
+    def _add_no_overlap(self, ctx: _SolveContext, staff_id: str,
+                        intervals: List[cp_model.IntervalVar]):
+        """スタッフの施術区間と休憩が重ならない"""
+        shift = ctx.shifts.get(staff_id)
+        intervals = intervals + ([b.interval for b in shift.breaks] if shift else [])
+        if len(intervals) > 1:
+            self._guard(ctx, ctx.model.AddNoOverlap(intervals), CONSTRAINT_STAFF_OVERLAP, staff_id)
+    
+    def _add_shift_model(self, ctx: _SolveContext, staff_list: List[Staff],
+                         tasks: Dict[str, List[Task]], schedule_date: datetime,
+                         horizon: int) -> Dict[str, ShiftEntry]:
+        """スタッフごとのシフト [開始, 終了) を変数として追加
+        
+        シフトは勤務可能時間の範囲内で max_hours_per_day 以下とし、担当する
+        施術をすべて含む。シフトが staff_break_frequency を超えるごとに、
+        min_staff_break_duration（スタッフの min_break_minutes の方が長ければ
+        そちら）の休憩を施術と重ならないようにシフト内に取る。k 回目の休憩は
+        シフト開始から k * staff_break_frequency 以内、かつ前の休憩の終了から
+        staff_break_frequency 以内に始め、最後の休憩の後もシフト終了まで
+        staff_break_frequency 以内とする。矛盾の説明用のモデルでは、休憩の要否と
+        間隔の制約をスタッフごとに CONSTRAINT_BREAKS の仮定リテラルで有効にする。
+        """
+        model = ctx.model
+        rules = self._shift_rules(staff_list, schedule_date, horizon)
+        shifts: Dict[str, ShiftEntry] = {}
+        for staff in staff_list:
+            windows = self._staff_windows(staff, schedule_date, horizon)
+            if not windows:
+                continue
+            earliest = min(start for start, _ in windows)
+            latest = max(end for _, end in windows)
+            max_length, frequency, break_slots = rules[staff.id]
+            
+            suffix = staff.id
+            on_duty = model.NewBoolVar(f"on_duty|{suffix}")
+            start = model.NewIntVar(earliest, latest, f"shift_start|{suffix}")
+            end = model.NewIntVar(earliest, latest, f"shift_end|{suffix}")
+            if ctx.assumptions is None:
+                length = model.NewIntVar(0, max_length, f"shift_length|{suffix}")
+            else:
+                length = model.NewIntVar(0, latest - earliest, f"shift_length|{suffix}")
+                self._guard(ctx, model.Add(length <= max_length), CONSTRAINT_SHIFT_LENGTH, staff.id)
+            interval = model.NewOptionalIntervalVar(start, length, end, on_duty, f"shift|{suffix}")
+            model.Add(end == start + length)
+            model.Add(length == 0).OnlyEnforceIf(on_duty.Not())
+            
+            for task in tasks.get(staff.id, []):
+                model.AddImplication(task.presence, on_duty)
+                model.Add(start <= task.start).OnlyEnforceIf(task.presence)
+                model.Add(task.start + task.duration <= end).OnlyEnforceIf(task.presence)
             
-            if working_staff:
-                self.model.Add(sum(working_staff) >= self.salon_constraints.min_staff_count)
-                self.model.Add(sum(working_staff) <= self.salon_constraints.max_staff_count)
-    
-    def _add_consecutive_work_constraint(self, staff: Staff, assignment_vars: Dict, 
-                                       time_slots: List[int]):
-        """連続勤務時間制限を追加"""
-        consecutive_limit_slots = staff.consecutive_work_limit * 4  # 4スロット = 1時間
-        
-        for start_slot in range(len(time_slots) - consecutive_limit_slots):
-            consecutive_vars = []
-            for i in range(consecutive_limit_slots + 1):
-                slot = time_slots[start_slot + i]
-                for var_name in assignment_vars:
-                    if f"_{staff.id}_{slot}" in var_name:
-                        consecutive_vars.append(assignment_vars[var_name])
+            breaks = []
+            for k in range(1, (max_length - 1) // frequency + 1 if max_length > 0 else 1):
+                # シフトが k * frequency を超えたら k 回目の休憩が必要
+                needed = model.NewBoolVar(f"break_needed|{suffix}|{k}")
+                model.Add(length >= k * frequency + 1).OnlyEnforceIf(needed)
+                not_needed = model.Add(length <= k * frequency)
+                not_needed.OnlyEnforceIf(needed.Not())
+                break_start = model.NewIntVar(earliest, latest, f"break_start|{suffix}|{k}")
+                break_interval = model.NewOptionalFixedSizeIntervalVar(
+                    break_start, break_slots, needed, f"break|{suffix}|{k}")
+                model.Add(start <= break_start).OnlyEnforceIf(needed)
+                model.Add(break_start + break_slots <= end).OnlyEnforceIf(needed)
+                within_shift = model.Add(break_start <= start + k * frequency)
+                within_shift.OnlyEnforceIf(needed)
+                guarded = [not_needed, within_shift]
+                if breaks:
+                    previous = breaks[-1]
+                    model.Add(previous.start < break_start).OnlyEnforceIf(needed)
+                    interval_limit = model.Add(break_start <= previous.start + break_slots + frequency)
+                    interval_limit.OnlyEnforceIf(needed)
+                    # k 回目が不要なら k-1 回目が最後の休憩
+                    last_limit = model.Add(end <= previous.start + break_slots + frequency)
+                    last_limit.OnlyEnforceIf([previous.presence, needed.Not()])
+                    guarded += [interval_limit, last_limit]
+                for constraint in guarded:
+                    self._guard(ctx, constraint, CONSTRAINT_BREAKS, staff.id)
+                breaks.append(ShiftBreak(break_start, needed, break_interval))
+            if breaks:
+                last = breaks[-1]
+                last_limit = model.Add(end <= last.start + break_slots + frequency)
+                last_limit.OnlyEnforceIf(last.presence)
+                self._guard(ctx, last_limit, CONSTRAINT_BREAKS, staff.id)
             
-            if consecutive_vars:
-                self.model.Add(sum(consecutive_vars) <= consecutive_limit_slots)
+            shifts[staff.id] = ShiftEntry(staff.id, on_duty, start, end, length, interval, breaks)
+        return shifts
     
-    def _create_objective_function(self, assignment_vars: Dict, staff_schedule_vars: Dict,
-                                 bookings: List[Booking], staff_list: List[Staff], 
-                                 time_slots: List[int]) -> cp_model.LinearExpr:
+    def _add_salon_constraints(self, ctx: _SolveContext, staff_list: List[Staff],
+                               schedule_date: datetime, horizon: int):
+        """サロン全体の制約を追加
+        
+        同時に勤務するスタッフ数はシフト区間の Cumulative で最大スタッフ数以下にする。
+        最小スタッフ数は勤務可能なスタッフがいるスロットごとの充足を目標とし、
+        不足分には大きなペナルティを課す（勤務可能人数が足りない日も解を返せる）。
+        """
+        model = ctx.model
+        constraints = self.salon_constraints
+        shift_intervals = [shift.interval for shift in ctx.shifts.values()]
+        if len(shift_intervals) > constraints.max_staff_count:
+            self._guard(ctx, model.AddCumulative(shift_intervals, [1] * len(shift_intervals),
+                                                 constraints.max_staff_count),
+                        CONSTRAINT_MAX_STAFF, "salon")
+        
+        if constraints.min_staff_count <= 0:
+            return
+        available: Dict[int, List[ShiftEntry]] = {}
+        for staff in staff_list:
+            shift = ctx.shifts.get(staff.id)
+            if shift is None:
+                continue
+            for slot in self._staff_available_slots(staff, schedule_date, horizon):
+                available.setdefault(slot, []).append(shift)
+        for slot, shifts in sorted(available.items()):
+            on_shift = []
+            for shift in shifts:
+                # このスロットでシフト中（勤務可能なスロットのみ変数を作る）
+                var = model.NewBoolVar(f"on_shift|{shift.staff_id}|{slot}")
+                model.AddImplication(var, shift.on_duty)
+                model.Add(shift.start <= slot).OnlyEnforceIf(var)
+                model.Add(shift.end >= slot + 1).OnlyEnforceIf(var)
+                on_shift.append(var)
+            shortfall = model.NewIntVar(0, constraints.min_staff_count, f"shortfall|{slot}")
+            model.Add(sum(on_shift) + shortfall >= constraints.min_staff_count)
+            ctx.coverage_shortfalls.append(shortfall)
+    
+    def _add_budget_constraints(self, ctx: _SolveContext, assignment_vars: AssignmentVariables,
+                                bookings: List[Booking]):
+        """スタッフごとの担当スロット数の合計を上限以下にする"""
+        if not ctx.staff_budgets:
+            return
+        durations = {booking.id: self._duration_slots(booking) for booking in bookings}
+        load: Dict[str, List[cp_model.LinearExpr]] = {}
+        for key, var in assignment_vars.items():
+            if key.staff_id in ctx.staff_budgets:
+                load.setdefault(key.staff_id, []).append(durations[key.booking_id] * var)
+        for staff_id, terms in load.items():
+            self._guard(ctx, ctx.model.Add(sum(terms) <= ctx.staff_budgets[staff_id]),
+                        CONSTRAINT_STAFF_BUDGET, staff_id)
+    
+    def _add_equipment_constraints(self, ctx: _SolveContext, assignment_vars: AssignmentVariables,
+                                   bookings: List[Booking]):
+        """設備ごとに同時使用数を容量以下にする（予約ごとの区間 + Cumulative）"""
+        segments = {booking.id: self._equipment_segments(booking) for booking in bookings}
+        if not any(segments.values()):
+            return
+        starts: Dict[str, List[Tuple[int, cp_model.IntVar]]] = {}
+        for key, var in assignment_vars.items():
+            if segments[key.booking_id]:
+                starts.setdefault(key.booking_id, []).append((key.slot, var))
+        
+        model = ctx.model
+        station_intervals: Dict[str, List[cp_model.IntervalVar]] = {}
+        for booking_id, candidates in starts.items():
+            assigned = model.NewBoolVar(f"assigned|{booking_id}")
+            model.Add(sum(var for _, var in candidates) == assigned)
+            start = model.NewIntVarFromDomain(
+                cp_model.Domain.FromValues(sorted({0} | {slot for slot, _ in candidates})),
+                f"start|{booking_id}")
+            model.Add(start == sum(slot * var for slot, var in candidates))
+            for station, offset, length in segments[booking_id]:
+                station_intervals.setdefault(station, []).append(model.NewOptionalFixedSizeIntervalVar(
+                    start + offset, length, assigned, f"equipment|{station}|{booking_id}"))
+        self._add_station_cumulatives(ctx, station_intervals)
+    
+    def _add_station_cumulatives(self, ctx: _SolveContext,
+                                 station_intervals: Dict[str, List[cp_model.IntervalVar]]):
+        """設備ごとのCumulative制約（同時使用数が容量を超えうる場合のみ）"""
+        for station, intervals in station_intervals.items():
+            capacity = self.salon_constraints.equipment_constraints[station]
+            if len(intervals) > capacity:
+                self._guard(ctx, ctx.model.AddCumulative(intervals, [1] * len(intervals), capacity),
+                            CONSTRAINT_EQUIPMENT, station)
+    
+    def _add_consecutive_work_constraint(self, ctx: _SolveContext, staff: Staff,
+                                         intervals: List[cp_model.IntervalVar], horizon: int):
+        """連続勤務時間制限を追加
+        
+        施術で埋まった時間（準備・片付け込み）が consecutive_work_limit を超えて
+        続かないように、施術と重ならない1スロットの空き r_1 < r_2 < ... を
+        先頭から limit 以内、互いに limit + 1 以内の間隔で置き、最後の空きから
+        終業（horizon）までも limit 以内にする。余った空きは horizon 以降に置ける。
+        """
+        limit = staff.consecutive_work_limit * 4  # 4スロット = 1時間
+        if not intervals or horizon <= limit:
+            return
+        model = ctx.model
+        count = horizon // (limit + 1) + 1
+        rests, previous = [], None
+        for i in range(count):
+            rest = model.NewIntVar(0, horizon + count, f"rest|{staff.id}|{i}")
+            rests.append(model.NewFixedSizeIntervalVar(rest, 1, f"rest_slot|{staff.id}|{i}"))
+            if previous is None:
+                self._guard(ctx, model.Add(rest <= limit), CONSTRAINT_CONSECUTIVE_WORK, staff.id)
+            else:
+                model.Add(previous < rest)
+                self._guard(ctx, model.Add(rest <= previous + limit + 1),
+                            CONSTRAINT_CONSECUTIVE_WORK, staff.id)
+            previous = rest
+        self._guard(ctx, model.Add(horizon <= previous + limit + 1),
+                    CONSTRAINT_CONSECUTIVE_WORK, staff.id)
+        # 空きは施術と重ならない（施術どうしの重なりは staff_overlap に任せ、矛盾の説明で区別する）
+        size = len(intervals)
+        self._guard(ctx, model.AddCumulative(intervals + rests, [1] * size + [size] * count, size),
+                    CONSTRAINT_CONSECUTIVE_WORK, staff.id)
+    
+    def _create_objective_function(self, assignment_vars: AssignmentVariables,
+                                 bookings: List[Booking]) -> cp_model.LinearExpr:
         """目的関数を作成"""
         objective_terms = []
         
         # 顧客満足度: 希望スタッフとの組み合わせ
         for booking in bookings:
-            for preferred_staff_id in booking.customer.preferred_staff_ids:
-                for staff in staff_list:
-                    if staff.id == preferred_staff_id:
-                        for slot in time_slots:
-                            var_name = f"assign|{booking.id}|{staff.id}|{slot}"
-                            if var_name in assignment_vars:
-                                weight = int(self.objectives.customer_satisfaction_weight * 100)
-                                objective_terms.append(weight * assignment_vars[var_name])
-        
-        # スタッフ稼働率の最大化
-        for staff in staff_list:
-            for slot in time_slots:
-                var_name = f"staff_{staff.id}_slot_{slot}"
-                if var_name in staff_schedule_vars:
-                    weight = int(self.objectives.staff_utilization_weight * 10)
-                    objective_terms.append(weight * staff_schedule_vars[var_name])
+            for preferred_staff_id in set(booking.customer.preferred_staff_ids):
+                for var in assignment_vars.for_booking_staff(booking.id, preferred_staff_id):
+                    objective_terms.append(self._satisfaction_weight * var)
         
         return sum(objective_terms) if objective_terms else 0
     
-    def _extract_solution(self, assignment_vars: Dict, staff_schedule_vars: Dict,
-                         bookings: List[Booking], staff_list: List[Staff], 
-                         time_slots: List[int]) -> Dict:
+    def _create_shift_cost_terms(self, ctx: _SolveContext, staff_list: List[Staff],
+                                 tasks: Dict[str, List[Task]]) -> cp_model.LinearExpr:
+        """人件費・遊休時間（シフト中で施術のない時間）・最小スタッフ数の不足へのペナルティ"""
+        terms = []
+        for staff in staff_list:
+            shift = ctx.shifts.get(staff.id)
+            if shift is None:
+                continue
+            cost = self._slot_labor_cost(staff)
+            busy = sum(task.duration * task.presence for task in tasks.get(staff.id, []))
+            terms.append(-cost * shift.length)
+            terms.append(-self._utilization_weight * (shift.length - busy))
+        if ctx.coverage_shortfalls:
+            terms.append(-COVERAGE_SHORTFALL_PENALTY * sum(ctx.coverage_shortfalls))
+        return sum(terms) if terms else 0
+    
+    def _slot_labor_cost(self, staff: Staff) -> int:
+        """1スロットあたりの人件費の目的関数係数（1000円単位 × コスト重み）"""
+        return int(round(self._cost_weight * staff.hourly_rate * SLOT_MINUTES / 60 / 1000))
+    
+    def _extract_solution(self, ctx: _SolveContext, assignment_vars: AssignmentVariables,
+                         bookings: List[Booking], staff_list: List[Staff], status: int) -> Dict:
         """解を抽出"""
+        schedule = self._collect_schedule(assignment_vars, bookings, staff_list, ctx.solver.Value)
+        return self._build_result(ctx, schedule, staff_list, status)
+    
+    def _collect_schedule(self, assignment_vars: AssignmentVariables, bookings: List[Booking],
+                          staff_list: List[Staff], value: ValueFn) -> List[Dict]:
+        """割り当て変数の値からスケジュールを組み立てる"""
         schedule = []
+        booking_map = {b.id: b for b in bookings}
+        staff_map = {s.id: s for s in staff_list}
         
-        for var_name, var in assignment_vars.items():
-            if self.solver.Value(var) == 1:
-                # var_name format: "assign|booking_id|staff_id|slot"
-                parts = var_name.split('|')
-                if len(parts) >= 4:
-                    try:
-                        booking_id = parts[1]
-                        staff_id = parts[2]
-                        slot_id = int(parts[3])
-                        
-                        booking = next((b for b in bookings if b.id == booking_id), None)
-                        staff_member = next((s for s in staff_list if s.id == staff_id), None)
-                        
-                        if booking and staff_member:
-                            schedule.append({
-                                "booking_id": booking_id,
-                                "staff_id": staff_id,
-                                "staff_name": staff_member.name,
-                                "customer_name": booking.customer.name,
-                                "services": [s.service_type.value for s in booking.services],
-                                "start_slot": slot_id,
-                                "duration_slots": int(booking.total_duration.total_seconds() // 900)  # 15分単位
-                            })
-                    except (ValueError, IndexError) as e:
-                        print(f"Warning: Failed to parse variable {var_name}: {e}")
-                        continue
+        for key, var in assignment_vars.items():
+            if value(var) == 1:
+                booking = booking_map.get(key.booking_id)
+                staff_member = staff_map.get(key.staff_id)
+                
+                if booking and staff_member:
+                    schedule.append(self._schedule_entry(booking, staff_member, key.slot))
         
+        return schedule
+    
+    def _schedule_entry(self, booking: Booking, staff: Staff, start_slot: int) -> Dict:
+        """スケジュール1件分のレスポンス項目"""
         return {
-            "status": "OPTIMAL" if schedule else "INFEASIBLE",
+            "booking_id": booking.id,
+            "staff_id": staff.id,
+            "staff_name": staff.name,
+            "customer_name": booking.customer.name,
+            "services": [s.service_type.value for s in booking.services],
+            "start_slot": start_slot,
+            "duration_slots": self._duration_slots(booking)
+        }
+    
+    def _collect_shifts(self, ctx: _SolveContext, staff_list: List[Staff]) -> List[Dict]:
+        """勤務するスタッフのシフトと休憩"""
+        value = ctx.solver.Value
+        shifts = []
+        for staff in staff_list:
+            shift = ctx.shifts.get(staff.id)
+            if shift is None or not value(shift.on_duty) or value(shift.length) == 0:
+                continue
+            shifts.append(self._shift_entry(
+                staff, value(shift.start), value(shift.end),
+                [value(b.start) for b in shift.breaks if value(b.presence)]))
+        return shifts
+    
+    def _shift_entry(self, staff: Staff, start_slot: int, end_slot: int,
+                     break_slots: List[int]) -> Dict:
+        """シフト1件分のレスポンス項目"""
+        return {
+            "staff_id": staff.id,
+            "staff_name": staff.name,
+            "start_slot": start_slot,
+            "end_slot": end_slot,
+            "break_slots": break_slots,
+            "labor_cost": staff.hourly_rate * (end_slot - start_slot) * SLOT_MINUTES / 60,
+        }
+    
+    def _build_result(self, ctx: _SolveContext, schedule: List[Dict], staff_list: List[Staff],
+                      status: int) -> Dict:
+        """抽出したスケジュールをレスポンス形式にまとめる"""
+        solver = ctx.solver
+        objective_value = solver.ObjectiveValue()
+        best_bound = solver.BestObjectiveBound()
+        shifts = self._collect_shifts(ctx, staff_list)
+        # 部分割り当てモードでは1件も割り当てられなくても解なので、PARTIAL は _mark_unscheduled が付ける
+        result = {
+            "status": solver.StatusName(status) if schedule or ctx.allow_partial else "INFEASIBLE",
             "schedule": schedule,
+            "shifts": shifts,
+            "labor_cost": sum(shift["labor_cost"] for shift in shifts),
             "solver_stats": {
-                "solve_time": self.solver.WallTime(),
-                "objective_value": self.solver.ObjectiveValue() if schedule else 0
+                "status": solver.StatusName(status),
+                "solve_time": solver.WallTime(),
+                "objective_value": objective_value if schedule else 0,
+                "best_bound": best_bound,
+                "gap": abs(best_bound - objective_value) / max(1.0, abs(objective_value)),
+                "solver_config": asdict(self.solver_config),
+                "model": model_size(ctx.model),
+                "search": search_statistics(solver),
             }
-        }
\ No newline at end of file
+        }
+        if ctx.now is not None:
+            result["frozen_booking_ids"] = sorted(ctx.pinned)
+        return result
+    
+    # ---- 区間変数による定式化 ----
+    
+    def _optimize_interval_model(self, ctx: _SolveContext, staff_list: List[Staff],
+                                 bookings: List[Booking], schedule_date: datetime,
+                                 time_slots: List[int], start_domains: StartDomains,
+                                 on_solution: Optional[SolutionHandler] = None) -> Dict:
+        """(予約, スタッフ) ごとのオプショナル区間変数で最適化"""
+        model, timer = ctx.model, ctx.timer
+        interval_vars = IntervalVariables()
+        booking_map = {b.id: b for b in bookings}
+        
+        with timer.phase("variables", model):
+            for (booking_id, staff_id), starts in start_domains.items():
+                duration = self._duration_slots(booking_map[booking_id])
+                interval_vars.add(model, booking_id, staff_id,
+                                  cp_model.Domain.FromValues(starts), duration)
+            
+            tasks = {
+                staff.id: [Task(entry.presence, entry.start, entry.duration, entry.interval)
+                           for entry in interval_vars.for_staff(staff.id)]
+                for staff in staff_list
+            }
+        with timer.phase("shift_model", model):
+            ctx.shifts = self._add_shift_model(ctx, staff_list, tasks, schedule_date, len(time_slots))
+        
+        with timer.phase("booking_constraints", model):
+            self._add_interval_booking_constraints(ctx, interval_vars, bookings)
+        with timer.phase("staff_constraints", model):
+            self._add_interval_staff_constraints(ctx, interval_vars, staff_list, len(time_slots))
+        if ctx.salon_wide:
+            with timer.phase("salon_constraints", model):
+                self._add_salon_constraints(ctx, staff_list, schedule_date, len(time_slots))
+        with timer.phase("equipment_constraints", model):
+            self._add_interval_equipment_constraints(ctx, interval_vars, bookings)
+        with timer.phase("budget_constraints", model):
+            self._add_interval_budget_constraints(ctx, interval_vars)
+        
+        with timer.phase("objective", model):
+            objective_expr = self._create_interval_objective_function(interval_vars, bookings)
+            objective_expr += self._create_shift_cost_terms(ctx, staff_list, tasks)
+            objective_expr += self._create_interval_stability_terms(ctx, interval_vars)
+            objective_expr += self._create_placement_terms(
+                ctx, bookings, lambda booking_id: [entry.presence for entry
+                                                   in interval_vars.for_booking(booking_id)])
+            model.Maximize(objective_expr)
+        
+        with timer.phase("hints"):
+            self._add_interval_solution_hints(ctx, interval_vars)
+        
+        with timer.phase("solve", process_cpu=True):
+            status = self._solve(ctx, on_solution, lambda value: self._collect_interval_schedule(
+                interval_vars, bookings, staff_list, value))
+        
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            with timer.phase("extraction"):
+                return self._extract_interval_solution(ctx, interval_vars, bookings, staff_list,
+                                                       status)
+        else:
+            return self._no_solution_result(ctx, status)
+    
+    def _add_interval_booking_constraints(self, ctx: _SolveContext,
+                                          interval_vars: IntervalVariables,
+                                          bookings: List[Booking]):
+        """各予約はちょうど1人のスタッフが担当する（部分割り当てモードでは高々1人）"""
+        for booking in bookings:
+            presences = [entry.presence for entry in interval_vars.for_booking(booking.id)]
+            if not presences:
+                continue
+            if self._is_optional(ctx, booking.id):
+                ctx.model.AddAtMostOne(presences)
+            else:
+                ctx.model.AddExactlyOne(presences)
+    
+    def _add_interval_staff_constraints(self, ctx: _SolveContext,
+                                        interval_vars: IntervalVariables,
+                                        staff_list: List[Staff], horizon: int):
+        """スタッフごとに施術区間（準備・片付け込み）と休憩が重ならず、連続勤務時間制限を守る"""
+        for staff in staff_list:
+            intervals = [entry.interval for entry in interval_vars.for_staff(staff.id)]
+            self._add_no_overlap(ctx, staff.id, intervals)
+            self._add_consecutive_work_constraint(ctx, staff, intervals, horizon)
+    
+    def _add_interval_budget_constraints(self, ctx: _SolveContext,
+                                         interval_vars: IntervalVariables):
+        """スタッフごとの担当スロット数の合計を上限以下にする"""
+        for staff_id, budget in ctx.staff_budgets.items():
+            entries = interval_vars.for_staff(staff_id)
+            if entries:
+                ctx.model.Add(sum(entry.duration * entry.presence for entry in entries) <= budget)
+    
+    def _add_interval_equipment_constraints(self, ctx: _SolveContext,
+                                            interval_vars: IntervalVariables,
+                                            bookings: List[Booking]):
+        """設備ごとに同時使用数を容量以下にする（施術区間からのオフセット区間 + Cumulative）"""
+        station_intervals: Dict[str, List[cp_model.IntervalVar]] = {}
+        for booking in bookings:
+            segments = self._equipment_segments(booking)
+            if not segments:
+                continue
+            for entry in interval_vars.for_booking(booking.id):
+                for station, offset, length in segments:
+                    station_intervals.setdefault(station, []).append(
+                        ctx.model.NewOptionalFixedSizeIntervalVar(
+                            entry.start + offset, length, entry.presence,
+                            f"equipment|{station}|{booking.id}|{entry.staff_id}"))
+        self._add_station_cumulatives(ctx, station_intervals)
+    
+    def _create_interval_objective_function(self, interval_vars: IntervalVariables,
+                                            bookings: List[Booking]) -> cp_model.LinearExpr:
+        """区間モデルの目的関数: 希望スタッフとの組み合わせ"""
+        objective_terms = []
+        for booking in bookings:
+            for preferred_staff_id in set(booking.customer.preferred_staff_ids):
+                entry = interval_vars.get(booking.id, preferred_staff_id)
+                if entry is not None:
+                    objective_terms.append(self._satisfaction_weight * entry.presence)
+        
+        return sum(objective_terms) if objective_terms else 0
+    
+    def _add_interval_solution_hints(self, ctx: _SolveContext, interval_vars: IntervalVariables):
+        """貪欲解・前回のスケジュールから区間変数にヒントを与える"""
+        for booking_id, (staff_id, slot) in ctx.hints.items():
+            for entry in interval_vars.for_booking(booking_id):
+                kept = entry.staff_id == staff_id
+                ctx.model.AddHint(entry.presence, kept)
+                if kept:
+                    ctx.model.AddHint(entry.start, slot)
+    
+    def _create_interval_stability_terms(self, ctx: _SolveContext,
+                                         interval_vars: IntervalVariables) -> cp_model.LinearExpr:
+        """前回と同じ担当・開始時刻を維持した予約への報酬"""
+        if not self._stability_weight:
+            return 0
+        kept_vars = []
+        for booking_id, (staff_id, slot) in ctx.previous_assignments.items():
+            entry = interval_vars.get(booking_id, staff_id)
+            if entry is None:
+                continue
+            kept = ctx.model.NewBoolVar(f"kept|{booking_id}")
+            ctx.model.AddImplication(kept, entry.presence)
+            ctx.model.Add(entry.start == slot).OnlyEnforceIf(kept)
+            kept_vars.append(kept)
+        return self._stability_weight * sum(kept_vars) if kept_vars else 0
+    
+    def _extract_interval_solution(self, ctx: _SolveContext, interval_vars: IntervalVariables,
+                                   bookings: List[Booking], staff_list: List[Staff],
+                                   status: int) -> Dict:
+        """区間モデルの解を抽出"""
+        schedule = self._collect_interval_schedule(interval_vars, bookings, staff_list,
+                                                   ctx.solver.Value)
+        return self._build_result(ctx, schedule, staff_list, status)
+    
+    def _collect_interval_schedule(self, interval_vars: IntervalVariables, bookings: List[Booking],
+                                   staff_list: List[Staff], value: ValueFn) -> List[Dict]:
+        """区間変数の値からスケジュールを組み立てる"""
+        schedule = []
+        booking_map = {b.id: b for b in bookings}
+        staff_map = {s.id: s for s in staff_list}
+        
+        for entry in interval_vars.entries():
+            if value(entry.presence) == 1:
+                schedule.append(self._schedule_entry(
+                    booking_map[entry.booking_id], staff_map[entry.staff_id],
+                    value(entry.start)))
+        
+        return schedule
@@ -0,0 +1,154 @@
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from ortools.sat.python import cp_model
+
+# (booking_id, staff_id) -> 実行可能な開始スロット一覧
+StartDomains = Dict[Tuple[str, str], List[int]]
+# booking_id -> (staff_id, start_slot)
+Assignments = Dict[str, Tuple[str, int]]
+
+
+class AssignmentKey(NamedTuple):
+    """割り当て変数のキー (予約, スタッフ, 開始スロット)"""
+    booking_id: str
+    staff_id: str
+    slot: int
+
+
+class AssignmentVariables:
+    """予約-スタッフ-スロットの割り当て変数レジストリ
+
+    変数を (booking, staff, slot) で保持し、予約・スタッフ・スロット別の
+    索引を同時に構築する。制約の構築は変数数に対して線形になる。
+    """
+
+    def __init__(self):
+        self._vars: Dict[AssignmentKey, cp_model.IntVar] = {}
+        self._by_booking: Dict[str, List[AssignmentKey]] = defaultdict(list)
+        self._by_staff: Dict[str, List[AssignmentKey]] = defaultdict(list)
+        self._by_slot: Dict[int, List[AssignmentKey]] = defaultdict(list)
+        self._by_staff_slot: Dict[Tuple[str, int], List[AssignmentKey]] = defaultdict(list)
+        self._by_booking_staff: Dict[Tuple[str, str], List[AssignmentKey]] = defaultdict(list)
+
+    def add(self, model: cp_model.CpModel, booking_id: str, staff_id: str,
+            slot: int) -> cp_model.IntVar:
+        """変数を作成して全ての索引に登録"""
+        key = AssignmentKey(booking_id, staff_id, slot)
+        var = model.NewBoolVar(f"assign|{booking_id}|{staff_id}|{slot}")
+        self._vars[key] = var
+        self._by_booking[booking_id].append(key)
+        self._by_staff[staff_id].append(key)
+        self._by_slot[slot].append(key)
+        self._by_staff_slot[(staff_id, slot)].append(key)
+        self._by_booking_staff[(booking_id, staff_id)].append(key)
+        return var
+
+    def get(self, booking_id: str, staff_id: str, slot: int) -> Optional[cp_model.IntVar]:
+        return self._vars.get(AssignmentKey(booking_id, staff_id, slot))
+
+    def __len__(self) -> int:
+        return len(self._vars)
+
+    def __contains__(self, key: AssignmentKey) -> bool:
+        return key in self._vars
+
+    def items(self) -> Iterator[Tuple[AssignmentKey, cp_model.IntVar]]:
+        return iter(self._vars.items())
+
+    def _lookup(self, keys: List[AssignmentKey]) -> List[cp_model.IntVar]:
+        return [self._vars[key] for key in keys]
+
+    def for_booking(self, booking_id: str) -> List[cp_model.IntVar]:
+        return self._lookup(self._by_booking.get(booking_id, []))
+
+    def for_staff(self, staff_id: str) -> List[cp_model.IntVar]:
+        return self._lookup(self._by_staff.get(staff_id, []))
+
+    def for_slot(self, slot: int) -> List[cp_model.IntVar]:
+        return self._lookup(self._by_slot.get(slot, []))
+
+    def for_staff_slot(self, staff_id: str, slot: int) -> List[cp_model.IntVar]:
+        return self._lookup(self._by_staff_slot.get((staff_id, slot), []))
+
+    def for_booking_staff(self, booking_id: str, staff_id: str) -> List[cp_model.IntVar]:
+        return self._lookup(self._by_booking_staff.get((booking_id, staff_id), []))
+
+
+class IntervalEntry(NamedTuple):
+    """(予約, スタッフ) ごとのオプショナル区間変数"""
+    booking_id: str
+    staff_id: str
+    start: cp_model.IntVar
+    presence: cp_model.IntVar
+    interval: cp_model.IntervalVar
+    duration: int
+
+
+class IntervalVariables:
+    """予約-スタッフのオプショナル区間変数レジストリ
+
+    開始スロットは整数変数1つで表し、担当の有無をpresenceリテラルで表す。
+    変数数はスロット数に依存しない。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], IntervalEntry] = {}
+        self._by_booking: Dict[str, List[IntervalEntry]] = defaultdict(list)
+        self._by_staff: Dict[str, List[IntervalEntry]] = defaultdict(list)
+
+    def add(self, model: cp_model.CpModel, booking_id: str, staff_id: str,
+            start_domain: cp_model.Domain, duration: int) -> IntervalEntry:
+        """区間変数を作成して索引に登録"""
+        suffix = f"{booking_id}|{staff_id}"
+        start = model.NewIntVarFromDomain(start_domain, f"start|{suffix}")
+        presence = model.NewBoolVar(f"presence|{suffix}")
+        interval = model.NewOptionalFixedSizeIntervalVar(
+            start, duration, presence, f"interval|{suffix}")
+        entry = IntervalEntry(booking_id, staff_id, start, presence, interval, duration)
+        self._entries[(booking_id, staff_id)] = entry
+        self._by_booking[booking_id].append(entry)
+        self._by_staff[staff_id].append(entry)
+        return entry
+
+    def get(self, booking_id: str, staff_id: str) -> Optional[IntervalEntry]:
+        return self._entries.get((booking_id, staff_id))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entries(self) -> Iterator[IntervalEntry]:
+        return iter(self._entries.values())
+
+    def for_booking(self, booking_id: str) -> List[IntervalEntry]:
+        return list(self._by_booking.get(booking_id, []))
+
+    def for_staff(self, staff_id: str) -> List[IntervalEntry]:
+        return list(self._by_staff.get(staff_id, []))
+
+
+
+class Task(NamedTuple):
+    """スタッフが担当しうる施術（presence が真なら start から duration スロット）"""
+    presence: cp_model.IntVar
+    start: cp_model.LinearExprT
+    duration: int
+    interval: cp_model.IntervalVar
+
+
+class ShiftBreak(NamedTuple):
+    """シフト中の休憩（presence が真ならシフト内に施術と重ならずに取る）"""
+    start: cp_model.IntVar
+    presence: cp_model.IntVar
+    interval: cp_model.IntervalVar
+
+
+class ShiftEntry(NamedTuple):
+    """スタッフ1人分のシフト変数 [start, end)"""
+    staff_id: str
+    on_duty: cp_model.IntVar
+    start: cp_model.IntVar
+    end: cp_model.IntVar
+    length: cp_model.IntVar
+    interval: cp_model.IntervalVar
+    breaks: List[ShiftBreak]
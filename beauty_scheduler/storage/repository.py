@@ -0,0 +1,342 @@
+import os
+import threading
+from dataclasses import replace
+from datetime import date, datetime, time
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import create_engine, delete, event, func, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..models.staff import Staff, Skill, Availability, ServiceType, SkillLevel
+from ..models.booking import Booking, BookingStatus, Service, Customer, Priority, EquipmentUsage
+from .tables import Base, BookingRow, StaffRow
+
+DEFAULT_DATABASE_URL = "sqlite:///beauty_scheduler.db"
+DEFAULT_SALON_ID = "default"
+
+
+def create_database_engine(url: str = DEFAULT_DATABASE_URL, pool_size: int = 5) -> Engine:
+    """コネクションプール付きのエンジンを作成
+
+    SQLiteのファイルはWALモードにして、複数のワーカーから読み書きできるようにする。
+    インメモリのSQLiteは1つの接続を共有する。
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=pool_size, max_overflow=pool_size, pool_pre_ping=True)
+    if parsed.database in (None, "", ":memory:"):
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    engine = create_engine(url, connect_args={"check_same_thread": False},
+                           pool_size=pool_size, max_overflow=pool_size, pool_pre_ping=True)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(connection, _):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    return engine
+
+
+def _parse_id(prefix: str, value: str) -> Optional[int]:
+    """"staff_12" のようなIDから主キーを取り出す（形式が違えば None）"""
+    head, _, number = value.partition("_")
+    return int(number) if head == prefix and number.isdigit() else None
+
+
+class ScheduleRepository:
+    """スタッフと予約の永続化（SQLAlchemy）
+
+    IDはデータベースの自動採番から "staff_<n>" / "booking_<n>" の形で作るため、
+    削除後や複数ワーカー間でも重複しない。予約は開始できる期間
+    [service_date, window_end_date] の (サロン, 日付) インデックスとスタッフの
+    インデックスで引けるので、最適化では対象日に開始できる行だけを読み込める。
+    """
+
+    def __init__(self, engine: Engine, salon_id: str = DEFAULT_SALON_ID):
+        self.engine = engine
+        self.salon_id = salon_id
+        self._sessions = sessionmaker(engine, expire_on_commit=False)
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @classmethod
+    def from_env(cls) -> "ScheduleRepository":
+        """環境変数から設定を読み込んで作成"""
+        engine = create_database_engine(
+            os.environ.get("BEAUTY_SCHEDULER_DATABASE_URL", DEFAULT_DATABASE_URL),
+            pool_size=int(os.environ.get("BEAUTY_SCHEDULER_DB_POOL_SIZE", "5")),
+        )
+        return cls(engine, salon_id=os.environ.get("BEAUTY_SCHEDULER_SALON_ID", DEFAULT_SALON_ID))
+
+    def create_schema(self):
+        """テーブルとインデックスを作成（作成済みなら何もしない）"""
+        with self._schema_lock:
+            if not self._schema_ready:
+                Base.metadata.create_all(self.engine)
+                self._schema_ready = True
+
+    def _session(self) -> Session:
+        self.create_schema()
+        return self._sessions.begin()
+
+    # ---- スタッフ ----
+
+    def add_staff(self, staff: Staff) -> Staff:
+        """スタッフを保存し、採番したIDを設定したスタッフを返す"""
+        with self._session() as session:
+            row = StaffRow(salon_id=self.salon_id, name=staff.name, payload=_staff_payload(staff))
+            session.add(row)
+            session.flush()
+            return replace(staff, id=f"staff_{row.pk}")
+
+    def get_staff(self, staff_id: str) -> Optional[Staff]:
+        staff = self.list_staff([staff_id])
+        return staff[0] if staff else None
+
+    def list_staff(self, staff_ids: Optional[Sequence[str]] = None) -> List[Staff]:
+        """サロンのスタッフ（staff_ids を指定するとその順に、存在するものだけ）"""
+        query = select(StaffRow).where(StaffRow.salon_id == self.salon_id)
+        if staff_ids is not None:
+            keys = [pk for pk in (_parse_id("staff", sid) for sid in staff_ids) if pk is not None]
+            query = query.where(StaffRow.pk.in_(keys))
+        with self._session() as session:
+            staff = {f"staff_{row.pk}": _staff_from_row(row)
+                     for row in session.scalars(query.order_by(StaffRow.pk))}
+        if staff_ids is None:
+            return list(staff.values())
+        return [staff[sid] for sid in staff_ids if sid in staff]
+
+    def delete_staff(self, staff_id: str) -> bool:
+        return self._delete(StaffRow, _parse_id("staff", staff_id))
+
+    def count_staff(self) -> int:
+        return self._count(StaffRow)
+
+    # ---- 予約 ----
+
+    def add_booking(self, booking: Booking) -> Booking:
+        """予約を保存し、採番したID（顧客IDが空ならそれも）を設定した予約を返す"""
+        with self._session() as session:
+            row = BookingRow(salon_id=self.salon_id, service_date=booking.scheduled_start.date(),
+                             window_end_date=_window_end_date(booking),
+                             scheduled_start=booking.scheduled_start,
+                             assigned_staff_id=booking.assigned_staff_id, payload={})
+            session.add(row)
+            session.flush()
+            customer = booking.customer
+            if not customer.id:
+                customer = replace(customer, id=f"customer_{row.pk}")
+            saved = replace(booking, id=f"booking_{row.pk}", customer=customer)
+            row.payload = _booking_payload(saved)
+            return saved
+
+    def get_booking(self, booking_id: str) -> Optional[Booking]:
+        bookings = self.list_bookings([booking_id])
+        return bookings[0] if bookings else None
+
+    def list_bookings(self, booking_ids: Optional[Sequence[str]] = None) -> List[Booking]:
+        """サロンの予約（booking_ids を指定するとその順に、存在するものだけ）"""
+        query = select(BookingRow).where(BookingRow.salon_id == self.salon_id)
+        if booking_ids is not None:
+            keys = [pk for pk in (_parse_id("booking", bid) for bid in booking_ids) if pk is not None]
+            query = query.where(BookingRow.pk.in_(keys))
+        bookings = {booking.id: booking for booking in self._load_bookings(query)}
+        if booking_ids is None:
+            return list(bookings.values())
+        return [bookings[bid] for bid in booking_ids if bid in bookings]
+
+    def find_bookings(self, first_day: Optional[date] = None, last_day: Optional[date] = None,
+                      staff_id: Optional[str] = None) -> List[Booking]:
+        """first_day から last_day（両端を含む）のいずれかの日に開始できる予約
+
+        予約日が last_day 以前で、開始できる最後の日が first_day 以降の予約を
+        (サロン, 日付) インデックスで絞り込む。staff_id を指定すると担当スタッフでも絞り込む。
+        """
+        query = select(BookingRow).where(BookingRow.salon_id == self.salon_id)
+        if last_day is not None:
+            query = query.where(BookingRow.service_date <= last_day)
+        if first_day is not None:
+            query = query.where(BookingRow.window_end_date >= first_day)
+        if staff_id is not None:
+            query = query.where(BookingRow.assigned_staff_id == staff_id)
+        return self._load_bookings(query)
+
+    def bookings_between(self, first_day: date, last_day: date) -> List[Booking]:
+        return self.find_bookings(first_day, last_day)
+
+    def bookings_on(self, day: date) -> List[Booking]:
+        return self.find_bookings(day, day)
+
+    def delete_booking(self, booking_id: str) -> bool:
+        return self._delete(BookingRow, _parse_id("booking", booking_id))
+
+    def count_bookings(self) -> int:
+        return self._count(BookingRow)
+
+    def _load_bookings(self, query) -> List[Booking]:
+        with self._session() as session:
+            return [_booking_from_row(row)
+                    for row in session.scalars(query.order_by(BookingRow.scheduled_start,
+                                                              BookingRow.pk))]
+
+    def _delete(self, table, pk: Optional[int]) -> bool:
+        if pk is None:
+            return False
+        with self._session() as session:
+            deleted = session.execute(delete(table).where(table.salon_id == self.salon_id,
+                                                          table.pk == pk))
+            return deleted.rowcount > 0
+
+    def _count(self, table) -> int:
+        with self._session() as session:
+            return session.scalar(select(func.count()).select_from(table)
+                                  .where(table.salon_id == self.salon_id))
+
+
+def _window_end_date(booking: Booking) -> date:
+    """予約を開始できる最後の日（時間調整可能で latest_acceptable_start があればその日）"""
+    if booking.is_flexible_time and booking.latest_acceptable_start is not None:
+        return max(booking.latest_acceptable_start.date(), booking.scheduled_start.date())
+    return booking.scheduled_start.date()
+
+
+# ---- ドメインモデルと payload の変換 ----
+
+def _staff_payload(staff: Staff) -> Dict:
+    return {
+        "skills": [
+            {
+                "service_type": skill.service_type.value,
+                "level": skill.level.value,
+                "certification_date": (skill.certification_date.isoformat()
+                                       if skill.certification_date else None),
+                "years_experience": skill.years_experience,
+            }
+            for skill in staff.skills
+        ],
+        "availability": [
+            {
+                "day_of_week": a.day_of_week,
+                "start_time": a.start_time.isoformat(),
+                "end_time": a.end_time.isoformat(),
+                "is_preferred": a.is_preferred,
+            }
+            for a in staff.availability
+        ],
+        "hourly_rate": staff.hourly_rate,
+        "max_hours_per_day": staff.max_hours_per_day,
+        "max_hours_per_week": staff.max_hours_per_week,
+        "min_break_minutes": staff.min_break_minutes,
+        "consecutive_work_limit": staff.consecutive_work_limit,
+        "preferred_customers": list(staff.preferred_customers),
+    }
+
+
+def _staff_from_row(row: StaffRow) -> Staff:
+    payload = row.payload
+    return Staff(
+        id=f"staff_{row.pk}",
+        name=row.name,
+        skills=[
+            Skill(
+                service_type=ServiceType(skill["service_type"]),
+                level=SkillLevel(skill["level"]),
+                certification_date=(datetime.fromisoformat(skill["certification_date"])
+                                    if skill["certification_date"] else None),
+                years_experience=skill["years_experience"],
+            )
+            for skill in payload["skills"]
+        ],
+        availability=[
+            Availability(
+                day_of_week=a["day_of_week"],
+                start_time=time.fromisoformat(a["start_time"]),
+                end_time=time.fromisoformat(a["end_time"]),
+                is_preferred=a["is_preferred"],
+            )
+            for a in payload["availability"]
+        ],
+        hourly_rate=payload["hourly_rate"],
+        max_hours_per_day=payload["max_hours_per_day"],
+        max_hours_per_week=payload["max_hours_per_week"],
+        min_break_minutes=payload["min_break_minutes"],
+        consecutive_work_limit=payload["consecutive_work_limit"],
+        preferred_customers=payload["preferred_customers"],
+    )
+
+
+def _booking_payload(booking: Booking) -> Dict:
+    customer = booking.customer
+    return {
+        "customer": {
+            "id": customer.id,
+            "name": customer.name,
+            "phone": customer.phone,
+            "email": customer.email,
+            "priority": customer.priority.name,
+            "preferred_staff_ids": list(customer.preferred_staff_ids),
+            "notes": customer.notes,
+        },
+        "services": [
+            {
+                "service_type": service.service_type.value,
+                "duration_minutes": service.duration_minutes,
+                "required_skill_level": service.required_skill_level.value,
+                "price": service.price,
+                "setup_time_minutes": service.setup_time_minutes,
+                "cleanup_time_minutes": service.cleanup_time_minutes,
+                "equipment": [
+                    {"station": usage.station, "offset_minutes": usage.offset_minutes,
+                     "duration_minutes": usage.duration_minutes}
+                    for usage in service.equipment
+                ],
+            }
+            for service in booking.services
+        ],
+        "status": booking.status.value,
+        "notes": booking.notes,
+        "is_flexible_time": booking.is_flexible_time,
+        "latest_acceptable_start": (booking.latest_acceptable_start.isoformat()
+                                    if booking.latest_acceptable_start else None),
+    }
+
+
+def _booking_from_row(row: BookingRow) -> Booking:
+    payload = row.payload
+    customer = payload["customer"]
+    latest = payload["latest_acceptable_start"]
+    return Booking(
+        id=f"booking_{row.pk}",
+        customer=Customer(
+            id=customer["id"],
+            name=customer["name"],
+            phone=customer["phone"],
+            email=customer["email"],
+            priority=Priority[customer["priority"]],
+            preferred_staff_ids=customer["preferred_staff_ids"],
+            notes=customer["notes"],
+        ),
+        services=[
+            Service(
+                service_type=ServiceType(service["service_type"]),
+                duration_minutes=service["duration_minutes"],
+                required_skill_level=SkillLevel(service["required_skill_level"]),
+                price=service["price"],
+                setup_time_minutes=service["setup_time_minutes"],
+                cleanup_time_minutes=service["cleanup_time_minutes"],
+                equipment=[EquipmentUsage(**usage) for usage in service["equipment"]],
+            )
+            for service in payload["services"]
+        ],
+        scheduled_start=row.scheduled_start,
+        status=BookingStatus(payload["status"]),
+        assigned_staff_id=row.assigned_staff_id,
+        notes=payload["notes"],
+        is_flexible_time=payload["is_flexible_time"],
+        latest_acceptable_start=datetime.fromisoformat(latest) if latest else None,
+    )
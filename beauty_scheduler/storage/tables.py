@@ -0,0 +1,40 @@
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from sqlalchemy import JSON, Date, DateTime, Index, Integer, String
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class StaffRow(Base):
+    """スタッフ（スキル・勤務可能時間などは payload に保持）"""
+    __tablename__ = "staff"
+    # 削除後もIDを再利用しない
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    pk: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    salon_id: Mapped[str] = mapped_column(String(64), index=True)
+    name: Mapped[str] = mapped_column(String(255))
+    payload: Mapped[Dict] = mapped_column(JSON)
+
+
+class BookingRow(Base):
+    """予約（顧客・サービスなどは payload に保持）"""
+    __tablename__ = "bookings"
+    __table_args__ = (
+        Index("ix_bookings_salon_date", "salon_id", "service_date"),
+        Index("ix_bookings_salon_window_end", "salon_id", "window_end_date"),
+        Index("ix_bookings_staff", "assigned_staff_id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    pk: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    salon_id: Mapped[str] = mapped_column(String(64))
+    service_date: Mapped[date] = mapped_column(Date)  # scheduled_start の日付
+    window_end_date: Mapped[date] = mapped_column(Date)  # 開始できる最後の日（時間調整可能な予約）
+    scheduled_start: Mapped[datetime] = mapped_column(DateTime)
+    assigned_staff_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    payload: Mapped[Dict] = mapped_column(JSON)
@@ -258,6 +258,12 @@ def print_schedule_result(result):
         print("✅ 最適解が見つかりました！")
     elif result['status'] == 'FEASIBLE':
         print("⚠️  実行可能解が見つかりました")
+    elif result['status'] == 'PARTIAL':
+        print("⚠️  一部の予約を割り当てられませんでした")
+        print(f"   未割り当て: {', '.join(result['unscheduled_booking_ids'])}")
+        for issue in result.get('diagnostics', []):
+            if issue['booking_ids']:
+                print(f"   理由: {issue['message']} ({', '.join(issue['booking_ids'])})")
     else:
         print("❌ 解が見つかりませんでした")
         print(f"理由: {result.get('message', '不明なエラー')}")
@@ -319,7 +325,7 @@ def main():
     print_schedule_result(result)
     
     # スタッフ別サマリー
-    if result['status'] in ['OPTIMAL', 'FEASIBLE']:
+    if result['status'] in ['OPTIMAL', 'FEASIBLE', 'PARTIAL']:
         print("\n👥 スタッフ別稼働サマリー:")
         print("-" * 40)
         staff_workload = {}
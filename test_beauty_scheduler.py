@@ -1,9 +1,23 @@
+import json
 import pytest
 from datetime import datetime, time, timedelta
 from beauty_scheduler.models.staff import Staff, Skill, Availability, ServiceType, SkillLevel
-from beauty_scheduler.models.booking import Booking, Service, Customer, Priority
-from beauty_scheduler.models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives
+from beauty_scheduler.models.booking import Booking, BookingStatus, Service, Customer, Priority, EquipmentUsage
+from beauty_scheduler.models.constraints import SalonConstraints, SchedulingConstraints, OptimizationObjectives, SolverConfig
 from beauty_scheduler.optimizer.schedule_optimizer import BeautySchedulerOptimizer
+from beauty_scheduler.optimizer.variables import AssignmentVariables
+from beauty_scheduler.optimizer.batch import BatchScheduleOptimizer
+from beauty_scheduler.optimizer.lns import LargeNeighborhoodSearch
+from beauty_scheduler.optimizer.cache import ResultCache, fingerprint
+from beauty_scheduler.optimizer.eligibility import EligibilityMatrix, get_skill_matrix
+from beauty_scheduler.benchmark.workload import SIZES, WorkloadConfig, generate_workload
+from beauty_scheduler.benchmark.runner import BenchmarkCase, compare, run_suite, write_csv
+from beauty_scheduler.storage.repository import ScheduleRepository, create_database_engine
+from beauty_scheduler.api.solver_pool import SolverPool, SolverPoolSaturated
+from beauty_scheduler.api.jobs import JobManager, JobStatus
+from ortools.sat.python import cp_model
+import threading
+import time as time_module
 
 def create_sample_staff():
     """サンプルスタッフを作成"""
@@ -199,8 +213,10 @@ def test_optimization_basic():
         for item in result['schedule']:
             print(f"  予約ID: {item['booking_id']}, スタッフ: {item['staff_name']}, 顧客: {item['customer_name']}")
     
-    # 実行可能解または最適解が見つかることを確認
-    assert result['status'] in ['OPTIMAL', 'FEASIBLE', 'INFEASIBLE']
+    # 実行可能解または最適解が見つかることを確認（昼休みをまたぐ予約などは未割り当て）
+    assert result['status'] in ['OPTIMAL', 'FEASIBLE', 'PARTIAL', 'INFEASIBLE']
+    if result['status'] == 'PARTIAL':
+        assert result['unscheduled_booking_ids']
 
 def test_staff_can_handle_booking():
     """スタッフが予約を処理できるかのテスト"""
@@ -222,6 +238,1098 @@ def test_staff_can_handle_booking():
     # ジュニアスタイリストはエキスパートレベルのカラー予約を処理できないはず
     assert not optimizer._can_staff_handle_booking(junior_stylist, expert_color_booking)
 
+def test_assignment_variables_indexes():
+    """割り当て変数レジストリの索引テスト"""
+    model = cp_model.CpModel()
+    registry = AssignmentVariables()
+    registry.add(model, "booking_001", "staff_001", 0)
+    registry.add(model, "booking_001", "staff_002", 1)
+    registry.add(model, "booking_002", "staff_001", 1)
+    
+    assert len(registry) == 3
+    assert registry.get("booking_001", "staff_002", 1) is not None
+    assert registry.get("booking_002", "staff_002", 1) is None
+    assert len(registry.for_booking("booking_001")) == 2
+    assert len(registry.for_staff("staff_001")) == 2
+    assert len(registry.for_slot(1)) == 2
+    assert len(registry.for_staff_slot("staff_001", 1)) == 1
+    assert len(registry.for_booking_staff("booking_001", "staff_001")) == 1
+    assert registry.for_staff("staff_999") == []
+
+def test_interval_formulation_respects_duration():
+    """区間モデルでは施術時間（準備・片付け込み）が重ならないことをテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    
+    customer = Customer(id="customer_010", name="テスト顧客", phone="", email="")
+    bookings = [
+        Booking(
+            id=f"booking_{i}",
+            customer=customer,
+            services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000,
+                              setup_time_minutes=10, cleanup_time_minutes=5)],
+            scheduled_start=datetime(2024, 1, 15, 10, 0),
+            is_flexible_time=True
+        )
+        for i in range(3)
+    ]
+    
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    
+    assert result['status'] == 'OPTIMAL'
+    assert len(result['schedule']) == 3
+    items = sorted(result['schedule'], key=lambda item: item['start_slot'])
+    for item in items:
+        assert item['duration_slots'] == 5  # 75分 -> 5スロット
+    for earlier, later in zip(items, items[1:]):
+        assert earlier['start_slot'] + earlier['duration_slots'] <= later['start_slot']
+
+def test_start_domains_respect_availability_and_lunch():
+    """勤務可能時間・昼休み・閉店時刻・希望時間帯による開始スロットの絞り込みテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    
+    customer = Customer(id="customer_011", name="テスト顧客", phone="", email="")
+    flexible_cut = Booking(
+        id="booking_flex",
+        customer=customer,
+        services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+        scheduled_start=datetime(2024, 1, 16, 9, 0),
+        is_flexible_time=True,
+        latest_acceptable_start=datetime(2024, 1, 16, 15, 0)
+    )
+    fixed_cut = Booking(
+        id="booking_fixed",
+        customer=customer,
+        services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+        scheduled_start=datetime(2024, 1, 16, 10, 0)
+    )
+    
+    # 2024年1月16日（火曜日）: 営業9:00-19:00、昼休み12:00-13:00
+    schedule_date = datetime(2024, 1, 16)
+    time_slots = optimizer._generate_time_slots(schedule_date)
+    domains = optimizer._compute_start_domains(staff_list, [flexible_cut, fixed_cut],
+                                               schedule_date, time_slots)
+    
+    # 佐藤健二は火曜10:00開始なので9:00台には入れない
+    flex_sato = domains[("booking_flex", "staff_002")]
+    assert min(flex_sato) == 4
+    # 昼休みに掛かる開始（11:15〜12:45）は除外、15:00以降は希望外
+    assert all(slot <= 8 or slot >= 16 for slot in flex_sato)
+    assert max(flex_sato) == 24
+    
+    # 時間指定の予約は予約時刻から最大待ち時間（15分）まで
+    assert domains[("booking_fixed", "staff_001")] == [4, 5]
+    
+    # 山田花子も火曜10:00は勤務可能
+    assert ("booking_fixed", "staff_003") in domains
+    
+    # 月曜日は佐藤健二が休みなので変数が作られない
+    monday = datetime(2024, 1, 15)
+    monday_domains = optimizer._compute_start_domains(
+        staff_list, create_sample_bookings(), monday, optimizer._generate_time_slots(monday))
+    assert not any(staff_id == "staff_002" for _, staff_id in monday_domains)
+
+def test_eligibility_matrix_matches_skill_check():
+    """担当可否行列がスキルチェックと一致し、ロスター単位でキャッシュされることをテスト"""
+    staff_list = create_sample_staff()
+    bookings = create_sample_bookings()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    
+    eligibility = EligibilityMatrix(staff_list, bookings)
+    for booking in bookings:
+        for staff in staff_list:
+            assert (eligibility.is_eligible(booking.id, staff.id)
+                    == optimizer._can_staff_handle_booking(staff, booking))
+    assert eligibility.eligible_staff_ids("booking_003") == ["staff_002"]
+    
+    # 並び順が違っても同じロスターならキャッシュを再利用
+    assert get_skill_matrix(staff_list) is get_skill_matrix(list(reversed(staff_list)))
+
+def test_solver_config_applied_and_reported():
+    """ソルバー設定が反映され、ステータスとギャップが solver_stats に出ることをテスト"""
+    staff_list = create_sample_staff()
+    bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+    for booking in bookings:
+        booking.is_flexible_time = True  # 昼休みをまたがない時刻に動かせる
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    
+    config = SolverConfig(max_time_in_seconds=120, num_search_workers=32, random_seed=7)
+    capped = config.capped(SolverConfig(max_time_in_seconds=10, num_search_workers=4))
+    assert capped.max_time_in_seconds == 10 and capped.num_search_workers == 4
+    assert capped.random_seed == 7
+    assert SolverConfig().capped(SolverConfig(max_time_in_seconds=10)).max_time_in_seconds == 10
+    # 0（全コア）もサーバー側の上限に丸める
+    assert SolverConfig(num_search_workers=0).capped(
+        SolverConfig(num_search_workers=4)).num_search_workers == 4
+    for invalid in ({"max_time_in_seconds": -1}, {"max_time_in_seconds": 0},
+                    {"num_search_workers": -2}, {"relative_gap_limit": -0.1}):
+        with pytest.raises(ValueError):
+            SolverConfig(**invalid)
+    
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         solver_config=capped)
+    solver = optimizer._new_solver()
+    assert solver.parameters.max_time_in_seconds == 10
+    assert solver.parameters.num_workers == 4
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["status"] in ("OPTIMAL", "FEASIBLE")
+    stats = result["solver_stats"]
+    assert stats["status"] == result["status"]
+    assert stats["gap"] >= 0
+    assert stats["solver_config"]["random_seed"] == 7
+
+def test_invalid_solver_config_rejected():
+    """不正なソルバー設定はAPIで400になり、モデルが不正なら INFEASIBLE 扱いしないことをテスト"""
+    from fastapi import HTTPException
+    from beauty_scheduler.api import routes
+    
+    request = routes.ScheduleOptimizationRequest(schedule_date=datetime(2024, 1, 15),
+                                                 solver={"max_time_in_seconds": -1})
+    with pytest.raises(HTTPException) as error:
+        routes._build_optimizer(request)
+    assert error.value.status_code == 400
+    
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    config = SolverConfig()
+    config.max_time_in_seconds = -1  # 検証を通らない値を直接設定
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         solver_config=config)
+    bookings = [b for b in create_sample_bookings() if b.id == "booking_002"]
+    result = optimizer.optimize_schedule(create_sample_staff(), bookings, datetime(2024, 1, 15))
+    assert result["status"] == "MODEL_INVALID"
+    assert "fallback" not in result and "diagnostics" not in result
+
+def test_optimizer_reusable_across_calls_and_threads():
+    """同じ最適化器を繰り返し・並行して呼び出しても結果が変わらないことをテスト"""
+    staff_list = create_sample_staff()
+    bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+    for booking in bookings:
+        booking.is_flexible_time = True
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         solver_config=SolverConfig(num_search_workers=1))
+    schedule_date = datetime(2024, 1, 15)
+    
+    first = optimizer.optimize_schedule(staff_list, bookings, schedule_date)
+    second = optimizer.optimize_schedule(staff_list, bookings, schedule_date)
+    assert first["status"] == second["status"] == "OPTIMAL"
+    assert len(second["schedule"]) == len(bookings)
+    assert first["solver_stats"]["objective_value"] == second["solver_stats"]["objective_value"]
+    
+    results = [None] * 4
+    def run(index):
+        results[index] = optimizer.optimize_schedule(staff_list, bookings, schedule_date)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result in results:
+        assert result["solver_stats"]["objective_value"] == first["solver_stats"]["objective_value"]
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_warm_start_keeps_previous_schedule(formulation):
+    """前回のスケジュールをヒントにし、安定性の重みで同じ割り当てを維持することをテスト"""
+    staff_list = create_sample_staff()
+    bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+    for booking in bookings:
+        booking.is_flexible_time = True
+        booking.customer.preferred_staff_ids = []
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    objectives.cost_minimization_weight = objectives.staff_utilization_weight = 0
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    schedule_date = datetime(2024, 1, 15)
+    
+    # 目的関数上は等価な割り当てが多数あるので、前回の解をそのまま維持するはず
+    previous = [
+        {"booking_id": "booking_001", "staff_id": "staff_001", "start_slot": 20},
+        {"booking_id": "booking_002", "staff_id": "staff_003", "start_slot": 22},
+    ]
+    result = optimizer.optimize_schedule(staff_list, bookings, schedule_date,
+                                         previous_schedule=previous)
+    assert result["status"] == "OPTIMAL"
+    kept = {(item["booking_id"], item["staff_id"], item["start_slot"]) for item in result["schedule"]}
+    assert kept == {(p["booking_id"], p["staff_id"], p["start_slot"]) for p in previous}
+
+def test_incremental_mode_freezes_started_bookings():
+    """増分モードで施術中の予約を固定し、残りを現在時刻以降で再最適化することをテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    customer = Customer(id="customer_012", name="テスト顧客", phone="", email="")
+    
+    def cut_booking(booking_id, hour, **kwargs):
+        return Booking(id=booking_id, customer=customer,
+                       services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                       scheduled_start=datetime(2024, 1, 15, hour, 0), **kwargs)
+    
+    bookings = [
+        cut_booking("in_chair", 10, status=BookingStatus.IN_PROGRESS, assigned_staff_id="staff_001"),
+        cut_booking("done", 9, status=BookingStatus.COMPLETED, assigned_staff_id="staff_001"),
+        cut_booking("waiting", 9, is_flexible_time=True),
+    ]
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15),
+                                         now=datetime(2024, 1, 15, 10, 30))
+    
+    assert result["status"] == "OPTIMAL"
+    assert result["frozen_booking_ids"] == ["in_chair"]
+    placed = {item["booking_id"]: item for item in result["schedule"]}
+    assert set(placed) == {"in_chair", "waiting"}
+    assert placed["in_chair"]["start_slot"] == 4  # 10:00のまま
+    assert placed["waiting"]["start_slot"] >= 8  # 施術中の予約が終わる11:00以降
+
+def _competing_cut_bookings():
+    """同じ時刻に開始したい通常客とVIP客のカット予約"""
+    def cut_booking(booking_id, priority):
+        customer = Customer(id=f"customer_{booking_id}", name=booking_id, phone="", email="",
+                            priority=priority)
+        return Booking(id=booking_id, customer=customer,
+                       services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                       scheduled_start=datetime(2024, 1, 15, 10, 0))
+    return [cut_booking("normal", Priority.NORMAL), cut_booking("vip", Priority.VIP)]
+
+def test_fast_mode_schedules_vip_first():
+    """貪欲法モードでVIPを優先して重ならないように割り当てることをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    
+    result = optimizer.optimize_schedule(staff_list[:1], _competing_cut_bookings(),
+                                         datetime(2024, 1, 15), mode="fast")
+    assert result["status"] == "PARTIAL"
+    assert result["solver_stats"]["engine"] == "greedy"
+    assert [item["booking_id"] for item in result["schedule"]] == ["vip"]
+    assert result["schedule"][0]["start_slot"] == 4
+    assert result["unscheduled_booking_ids"] == ["normal"]
+    
+    # スタッフが足りれば全員を割り当て、同じスタッフの施術は重ならない
+    bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+    for booking in bookings:
+        booking.is_flexible_time = True
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15), mode="fast")
+    assert result["status"] == "FEASIBLE"
+    by_staff = {}
+    for item in result["schedule"]:
+        by_staff.setdefault(item["staff_id"], []).append(
+            (item["start_slot"], item["start_slot"] + item["duration_slots"]))
+    for intervals in by_staff.values():
+        intervals.sort()
+        assert all(end <= start for (_, end), (start, _) in zip(intervals, intervals[1:]))
+    
+    with pytest.raises(ValueError):
+        optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15), mode="unknown")
+
+def test_infeasible_model_falls_back_to_greedy():
+    """CP-SATで解がない場合に貪欲法の結果を返すことをテスト"""
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    
+    result = optimizer.optimize_schedule(create_sample_staff()[:1], _competing_cut_bookings(),
+                                         datetime(2024, 1, 15))
+    assert result["fallback"] is True
+    assert result["solver_stats"]["cp_status"] == "INFEASIBLE"
+    assert result["status"] == "PARTIAL"
+    assert [item["booking_id"] for item in result["schedule"]] == ["vip"]
+
+def test_batch_optimization_respects_weekly_hours():
+    """期間内を日ごとに最適化し、週の勤務時間上限を調整パスで守ることをテスト"""
+    staff_list = create_sample_staff()[:2]
+    staff_list[0].max_hours_per_week = 2  # 田中美咲は週2時間まで
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    customer = Customer(id="customer_013", name="常連客", phone="", email="",
+                        preferred_staff_ids=["staff_001"])
+    bookings = [
+        Booking(id=f"day_{day}", customer=customer,
+                services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                scheduled_start=datetime(2024, 1, day, 10, 0))
+        for day in (15, 16, 17, 22)  # 22日は翌週
+    ]
+    
+    batch = BatchScheduleOptimizer(optimizer, max_workers=4)
+    result = batch.optimize_range(staff_list, bookings, datetime(2024, 1, 15), datetime(2024, 1, 21))
+    
+    assert result["status"] == "OPTIMAL"
+    assert sorted(result["days"]) == ["2024-01-15", "2024-01-16", "2024-01-17"]
+    assert result["rebalanced_days"] == ["2024-01-15", "2024-01-16", "2024-01-17"]
+    assert result["weekly_hours"]["2024-W03"]["staff_001"] == 2
+    assert result["weekly_limit_violations"] == {}
+    staff_by_date = {item["date"]: item["staff_id"] for item in result["schedule"]}
+    assert staff_by_date == {"2024-01-15": "staff_001", "2024-01-16": "staff_001",
+                             "2024-01-17": "staff_002"}
+
+def test_batch_rebalancing_repeats_until_weekly_hours_hold():
+    """調整パスで予約が移ったスタッフも上限を超えれば、上限を守るまで繰り返すことをテスト"""
+    staff_list = create_sample_staff()[:2]
+    staff_list[0].max_hours_per_week = 2  # 田中美咲は週2時間まで
+    staff_list[1].max_hours_per_week = 1  # 佐藤健二は週1時間まで（月曜は休み）
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    customer = Customer(id="customer_023", name="常連客", phone="", email="",
+                        preferred_staff_ids=["staff_001"])
+    bookings = [
+        Booking(id=f"cut_{day}_{hour}", customer=customer,
+                services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                scheduled_start=datetime(2024, 1, day, hour, 0))
+        for day in (15, 16) for hour in (10, 14)
+    ]
+    
+    batch = BatchScheduleOptimizer(optimizer, max_workers=4)
+    result = batch.optimize_range(staff_list, bookings, datetime(2024, 1, 15), datetime(2024, 1, 21))
+    
+    assert result["weekly_hours"]["2024-W03"] == {"staff_001": 2, "staff_002": 1}
+    assert result["weekly_limit_violations"] == {}
+    # 3時間分しか担当できないので1件は割り当てられない
+    assert result["status"] == "PARTIAL"
+    assert len(result["schedule"]) == 3
+
+def test_batch_shares_search_workers_between_days():
+    """並列に求解する日どうしで探索ワーカー数を分け合うことをテスト"""
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         solver_config=SolverConfig(num_search_workers=8))
+    batch = BatchScheduleOptimizer(optimizer, max_workers=4)
+    
+    assert batch._day_optimizer(1) is optimizer
+    assert batch._day_optimizer(4).solver_config.num_search_workers == 2
+    assert batch._day_optimizer(3).solver_config.num_search_workers == 2
+    # 日数がワーカー数より多くても各日1ワーカー（0 = 全コアにはしない）
+    assert batch._day_optimizer(16).solver_config.num_search_workers == 1
+
+def test_decomposition_solves_independent_components():
+    """担当可能グラフの連結成分ごとに分解して求解し、結果を結合することをテスト"""
+    esthetician = Staff(id="staff_004", name="鈴木エステ",
+                        skills=[Skill(ServiceType.FACIAL, SkillLevel.EXPERT)],
+                        availability=[], hourly_rate=2000)
+    staff_list = create_sample_staff() + [esthetician]
+    customer = Customer(id="customer_014", name="テスト顧客", phone="", email="")
+    bookings = [
+        Booking(id=f"booking_{service.value}_{hour}", customer=customer,
+                services=[Service(service, 60, SkillLevel.INTERMEDIATE, 5000)],
+                scheduled_start=datetime(2024, 1, 15, hour, 0), is_flexible_time=True)
+        for service, hour in [(ServiceType.FACIAL, 10), (ServiceType.FACIAL, 14),
+                              (ServiceType.CUT, 10), (ServiceType.CUT, 14)]
+    ]
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.max_staff_count = 10
+    salon_constraints.min_staff_count = 0
+    
+    results = {}
+    for decompose in (False, True):
+        optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                             formulation="interval", decompose=decompose)
+        results[decompose] = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    
+    decomposed = results[True]
+    assert decomposed["status"] == "OPTIMAL"
+    assert decomposed["solver_stats"]["decomposition"] == {"components": 2}
+    assert [item["booking_id"] for item in decomposed["schedule"]] == [b.id for b in bookings]
+    assert decomposed["solver_stats"]["objective_value"] == results[False]["solver_stats"]["objective_value"]
+    facial_staff = {item["staff_id"] for item in decomposed["schedule"] if "facial" in item["booking_id"]}
+    assert facial_staff == {"staff_004"}
+    
+    # 最大スタッフ数が成分間を結びつける場合は1つのモデルで求解する
+    salon_constraints.max_staff_count = 3
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval", decompose=True)
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["status"] == "OPTIMAL"
+    assert result["solver_stats"]["decomposition"] == {"components": 2,
+                                                       "fallback_reason": "max_staff_count"}
+    
+    # APIの既定の制約（最小スタッフ数2名）では分解せず、理由を返す
+    from beauty_scheduler.api import routes
+    optimizer = routes._build_optimizer(routes.ScheduleOptimizationRequest(
+        schedule_date=datetime(2024, 1, 15), formulation="interval", decompose=True))
+    assert optimizer.decompose and optimizer.salon_constraints.min_staff_count == 2
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["solver_stats"]["decomposition"] == {"components": 2,
+                                                       "fallback_reason": "min_staff_count"}
+
+def test_lns_improves_greedy_schedule():
+    """大近傍探索で貪欲法の解を改善し、目的関数曲線を返すことをテスト"""
+    staff_list = [s for s in create_sample_staff() if s.id != "staff_002"]
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.min_staff_count = 0
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation="interval")
+    
+    def cut_booking(booking_id, priority, **kwargs):
+        customer = Customer(id=f"customer_{booking_id}", name=booking_id, phone="", email="",
+                            priority=priority, preferred_staff_ids=["staff_001"])
+        return Booking(id=booking_id, customer=customer,
+                       services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                       scheduled_start=datetime(2024, 1, 15, 9, 0), **kwargs)
+    
+    # 貪欲法はVIPに田中美咲を割り当て、通常客を最も早い山田花子に回す
+    bookings = [cut_booking("vip", Priority.VIP), cut_booking("regular", Priority.NORMAL,
+                                                              is_flexible_time=True)]
+    lns = LargeNeighborhoodSearch(optimizer, seed=0)
+    improvements = []
+    result = lns.optimize(staff_list, bookings, datetime(2024, 1, 15), max_iterations=5,
+                          on_improvement=improvements.append)
+    
+    assert result["status"] == "FEASIBLE"
+    assert {item["staff_id"] for item in result["schedule"]} == {"staff_001"}
+    curve = result["curve"]
+    assert curve == improvements
+    assert curve[0]["neighborhood"] is None  # CP-SATで検証した貪欲法の初期解
+    objectives_curve = [point["objective_value"] for point in curve]
+    assert len(objectives_curve) > 1 and objectives_curve == sorted(objectives_curve)
+    assert result["solver_stats"]["objective_value"] == curve[-1]["objective_value"]
+    # 目的関数値は反復ごとに変わる現在の解との一致（安定性）を含まない
+    assert lns.sub_optimizer.objectives.schedule_stability_weight == 0
+    assert optimizer.objectives.schedule_stability_weight > 0
+
+def test_lns_repairs_infeasible_seed(monkeypatch):
+    """初期解が制約を満たさなければCP-SATで解き直し、部分問題の矛盾の説明は省くことをテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    phases = []
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         phase_hook=lambda event: phases.append(event.get("phase")))
+    customer = Customer(id="customer_024", name="テスト顧客", phone="", email="")
+    bookings = [
+        Booking(id=f"cut_{i}", customer=customer,
+                services=[Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)],
+                scheduled_start=datetime(2024, 1, 15, 9, 0), is_flexible_time=True)
+        for i in range(2)
+    ]
+    lns = LargeNeighborhoodSearch(optimizer, seed=0)
+    # 同じ時刻に重なる（制約を満たさない）初期解
+    seed = {"status": "FEASIBLE", "solver_stats": {"engine": "greedy"}, "schedule": [
+        {"booking_id": b.id, "staff_id": "staff_001", "start_slot": 0, "duration_slots": 4}
+        for b in bookings]}
+    monkeypatch.setattr(lns.optimizer, "optimize_schedule", lambda *args, **kwargs: seed)
+    
+    result = lns.optimize(staff_list, bookings, datetime(2024, 1, 15), max_iterations=2)
+    assert result["status"] == "FEASIBLE"
+    starts = sorted(item["start_slot"] for item in result["schedule"])
+    assert len(starts) == 2 and starts[1] - starts[0] >= 4
+    assert result["curve"][0]["objective_value"] is not None
+    assert "explanation" not in phases
+
+@pytest.mark.parametrize("formulation,mode", [("slot", "cp"), ("interval", "cp"), ("slot", "fast")])
+def test_equipment_capacity_respected(formulation, mode):
+    """設備の容量を超えて同時に使用しないことをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.equipment_constraints = {"color_station": 1}
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_016", name="テスト顧客", phone="", email="")
+    # カラーの最初の30分だけカラーステーションを使う
+    color = Service(ServiceType.COLOR, 60, SkillLevel.ADVANCED, 8000,
+                    equipment=[EquipmentUsage("color_station", duration_minutes=30)])
+    bookings = [
+        Booking(id=f"color_{i}", customer=customer, services=[color],
+                scheduled_start=datetime(2024, 1, 16, 10, 0), is_flexible_time=True)
+        for i in range(2)
+    ]
+    assert bookings[0].equipment_usage() == [("color_station", 0, 30)]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 16), mode=mode)
+    assert len(result["schedule"]) == 2
+    first, second = sorted(item["start_slot"] for item in result["schedule"])
+    assert second - first >= 2
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_shift_covers_assignments_with_breaks(formulation):
+    """シフトが施術を含み、長いシフトには休憩が入り、人件費が報告されることをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.min_staff_count = 0
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_017", name="テスト顧客", phone="", email="",
+                        preferred_staff_ids=["staff_001"])
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)
+    bookings = [
+        Booking(id="morning", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 9, 0)),
+        Booking(id="evening", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 15, 0)),
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert {item["staff_id"] for item in result["schedule"]} == {"staff_001"}
+    # 担当のないスタッフは勤務しない
+    assert [shift["staff_id"] for shift in result["shifts"]] == ["staff_001"]
+    shift = result["shifts"][0]
+    assert shift["start_slot"] == min(item["start_slot"] for item in result["schedule"])
+    assert shift["end_slot"] == max(item["start_slot"] + item["duration_slots"]
+                                    for item in result["schedule"])
+    assert shift["end_slot"] - shift["start_slot"] <= 8 * 4
+    # 4時間を超えるシフトには施術と重ならない休憩が入る
+    assert len(shift["break_slots"]) == 1
+    busy = {slot for item in result["schedule"]
+            for slot in range(item["start_slot"], item["start_slot"] + item["duration_slots"])}
+    assert shift["break_slots"][0] not in busy
+    hours = (shift["end_slot"] - shift["start_slot"]) / 4
+    assert result["labor_cost"] == shift["labor_cost"] == 2500 * hours
+
+@pytest.mark.parametrize("formulation,mode", [("slot", "cp"), ("interval", "cp"), ("slot", "fast")])
+def test_breaks_split_shift_by_break_frequency(formulation, mode):
+    """休憩が休憩頻度ごとに入り、休憩なしで休憩頻度を超えて働かないことを全エンジンでテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.lunch_break_duration = timedelta(0)
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_021", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)
+    bookings = [
+        Booking(id=f"cut_{i}", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 9, 0), is_flexible_time=True)
+        for i in range(7)
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15), mode=mode)
+    assert result["status"] == ("OPTIMAL" if mode == "cp" else "FEASIBLE")
+    assert len(result["schedule"]) == 7
+    [shift] = result["shifts"]
+    assert shift["end_slot"] - shift["start_slot"] <= 8 * 4  # max_hours_per_day
+    assert len(shift["break_slots"]) == 1
+    frequency = 4 * 4  # 4時間
+    rest_end = shift["start_slot"]
+    for k, break_slot in enumerate(shift["break_slots"], start=1):
+        assert break_slot <= shift["start_slot"] + k * frequency
+        assert break_slot <= rest_end + frequency
+        rest_end = break_slot + 2  # スタッフの最低休憩時間30分
+    assert shift["end_slot"] <= rest_end + frequency
+    # 休憩と重なる施術はない
+    busy = {slot for item in result["schedule"]
+            for slot in range(item["start_slot"], item["start_slot"] + item["duration_slots"])}
+    assert not busy & {slot for start in shift["break_slots"] for slot in range(start, start + 2)}
+
+@pytest.mark.parametrize("formulation,mode", [("slot", "cp"), ("interval", "cp"), ("slot", "fast")])
+def test_consecutive_work_limit_on_occupied_time(formulation, mode):
+    """施術で埋まった時間が連続勤務時間制限を超えないことを全エンジンでテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    staff_list[0].consecutive_work_limit = 1
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.lunch_break_duration = timedelta(0)
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_022", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)
+    bookings = [
+        Booking(id=f"cut_{hour}", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, hour, 0))
+        for hour in (9, 10)
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15), mode=mode)
+    first, second = sorted((item["start_slot"], item["duration_slots"]) for item in result["schedule"])
+    # 1時間の施術を続けて担当せず、間に空きを入れる
+    assert first[0] + first[1] < second[0]
+
+def test_fingerprint_ignores_list_order():
+    """入力の並び順に依存せず、制約の変更には反応するフィンガープリントのテスト"""
+    staff_list = create_sample_staff()
+    bookings = create_sample_bookings()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    schedule_date = datetime(2024, 1, 15)
+    key = fingerprint(optimizer, staff_list, bookings, schedule_date, mode="cp")
+    
+    reordered_staff = list(reversed(create_sample_staff()))
+    reordered_staff[0].skills.reverse()
+    reordered_staff[0].availability.reverse()
+    assert fingerprint(optimizer, reordered_staff, list(reversed(bookings)), schedule_date,
+                       mode="cp", stop_event=threading.Event()) == key
+    
+    assert fingerprint(optimizer, staff_list, bookings, schedule_date, mode="fast") != key
+    salon_constraints.max_staff_count = 2
+    assert fingerprint(optimizer, staff_list, bookings, schedule_date, mode="cp") != key
+
+def test_result_cache_ttl_bound_and_persistence(tmp_path):
+    """結果キャッシュのヒット・有効期限・容量制限・ディスク永続化のテスト"""
+    staff_list = create_sample_staff()
+    bookings = create_sample_bookings()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    now = [1000.0]
+    cache = ResultCache(max_entries=2, ttl_seconds=60, directory=str(tmp_path),
+                        clock=lambda: now[0])
+    
+    first = cache.optimize(optimizer, staff_list, bookings, datetime(2024, 1, 15), mode="fast")
+    second = cache.optimize(optimizer, list(reversed(staff_list)), bookings,
+                            datetime(2024, 1, 15), mode="fast")
+    assert second == first and second is not first
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+    
+    # 再起動後もディスクから読み込める
+    restarted = ResultCache(ttl_seconds=60, directory=str(tmp_path), clock=lambda: now[0])
+    assert restarted.optimize(optimizer, staff_list, bookings, datetime(2024, 1, 15),
+                              mode="fast") == first
+    assert restarted.stats()["disk_hits"] == 1
+    
+    # 容量を超えると古いものから捨て、有効期限が切れると再求解する
+    for day in (16, 17):
+        cache.optimize(optimizer, staff_list, bookings, datetime(2024, 1, day), mode="fast")
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    now[0] += 61
+    cache.optimize(optimizer, staff_list, bookings, datetime(2024, 1, 17), mode="fast")
+    assert cache.stats()["misses"] == 4
+
+def test_repository_round_trip_and_date_lookup(tmp_path):
+    """永続化したスタッフ・予約の復元、日付での絞り込み、削除後の採番のテスト"""
+    url = f"sqlite:///{tmp_path / 'scheduler.db'}"
+    repository = ScheduleRepository(create_database_engine(url))
+    staff = [repository.add_staff(s) for s in create_sample_staff()]
+    bookings = [repository.add_booking(b) for b in create_sample_bookings()]
+    other_day = create_sample_bookings()[0]
+    other_day.scheduled_start = datetime(2024, 1, 16, 10, 0)
+    other_day = repository.add_booking(other_day)
+    
+    # 別の接続（再起動後）からも同じ内容を読める
+    reopened = ScheduleRepository(create_database_engine(url))
+    assert reopened.list_staff() == staff
+    assert reopened.get_booking(bookings[0].id) == bookings[0]
+    assert reopened.list_bookings([bookings[2].id, "booking_999", "unknown"]) == [bookings[2]]
+    assert reopened.bookings_on(datetime(2024, 1, 16).date()) == [other_day]
+    assert {b.id for b in reopened.bookings_on(datetime(2024, 1, 15).date())} == {b.id for b in bookings}
+    
+    # 削除後もIDは再利用しない
+    assert reopened.delete_booking(other_day.id)
+    assert not reopened.delete_booking(other_day.id)
+    added = reopened.add_booking(create_sample_bookings()[1])
+    assert added.id not in {b.id for b in bookings} | {other_day.id}
+    assert reopened.count_bookings() == 4
+    assert ScheduleRepository(reopened.engine, salon_id="other").count_bookings() == 0
+
+def test_booking_range_queries_include_flexible_window(monkeypatch):
+    """対象日に開始できる予約（時間調整可能な予約を含む）だけが最適化と一覧に渡されることをテスト"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from beauty_scheduler.api import routes
+    
+    repository = ScheduleRepository(create_database_engine("sqlite://"))
+    monkeypatch.setattr(routes, "repository", repository)
+    bookings = create_sample_bookings()
+    bookings[1].scheduled_start = datetime(2024, 1, 12, 14, 0)  # 3日前に締め切った予約
+    bookings[2].scheduled_start = datetime(2024, 1, 14, 11, 0)  # 翌日まで調整可能
+    bookings[2].is_flexible_time = True
+    bookings[2].latest_acceptable_start = datetime(2024, 1, 15, 17, 0)
+    bookings[2].assigned_staff_id = "staff_2"
+    saved = [repository.add_booking(b) for b in bookings]
+    
+    on_day = repository.bookings_on(datetime(2024, 1, 15).date())
+    assert [b.id for b in on_day] == [saved[2].id, saved[0].id]
+    assert repository.find_bookings(staff_id="staff_2") == [saved[2]]
+    
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    client = TestClient(app)
+    listed = client.get("/api/v1/bookings/", params={"start_date": "2024-01-12",
+                                                      "end_date": "2024-01-13"}).json()
+    assert [item["id"] for item in listed] == [saved[1].id]
+    assert len(client.get("/api/v1/bookings/").json()) == 3
+    assert client.get("/api/v1/bookings/", params={"start_date": "2024-01-15",
+                                                    "end_date": "2024-01-14"}).status_code == 400
+
+def test_workload_generator_is_reproducible():
+    """同じ seed から同じ合成サロンが生成され、設定した規模になることをテスト"""
+    config = WorkloadConfig(staff_count=6, bookings_per_staff=2.0, vip_ratio=0.5, seed=7)
+    first, second = generate_workload(config), generate_workload(config)
+    assert first.staff == second.staff and first.bookings == second.bookings
+    assert len(first.staff) == 6 and len(first.bookings) == 12
+    assert any(b.customer.priority == Priority.VIP for b in first.bookings)
+    other = generate_workload(WorkloadConfig(staff_count=6, bookings_per_staff=2.0, seed=8))
+    assert other.bookings != first.bookings
+    with pytest.raises(ValueError):
+        WorkloadConfig(availability_pattern="unknown")
+
+def test_benchmark_reports_phases_and_detects_regressions(tmp_path):
+    """ベンチマークがフェーズごとの時間を記録し、基準との比較で回帰を検出することをテスト"""
+    case = BenchmarkCase("small-slot", SIZES["small"],
+                         solver_config=SolverConfig(max_time_in_seconds=2, random_seed=0))
+    report = run_suite([case], repeats=1)
+    result = report["results"][0]
+    assert result["status"] in ("OPTIMAL", "FEASIBLE") and not result["fallback"]
+    assert result["scheduled"] == result["bookings"]
+    assert result["phases"]["solve"] > 0 and result["phases"]["start_domains"] > 0
+    assert result["total_time"] >= result["phases"]["solve"]
+    assert compare(report, report) == []
+    
+    write_csv(report, str(tmp_path / "bench.csv"))
+    header = (tmp_path / "bench.csv").read_text(encoding="utf-8").splitlines()[0]
+    assert "phase_solve" in header and "total_time" in header
+    
+    faster = json.loads(json.dumps(report))
+    faster["results"][0]["total_time"] = result["total_time"] / 10
+    faster["results"][0]["scheduled"] += 1
+    metrics = {r["metric"] for r in compare(faster, report, threshold=1.25, min_delta=0.0)}
+    assert metrics == {"total_time", "scheduled"}
+
+def test_precheck_fails_fast_on_skill_shortage():
+    """スキルごとの所要時間が勤務可能時間を超えると、CP-SATを実行せずに理由を返すことをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)  # staff_001 のみ担当可能
+    bookings = [
+        Booking(id=f"booking_{i:03d}", services=[cut],
+                customer=Customer(id=f"customer_{i:03d}", name="テスト顧客", phone="", email=""),
+                scheduled_start=datetime(2024, 1, 15, 9, 0), is_flexible_time=True,
+                latest_acceptable_start=datetime(2024, 1, 15, 17, 0))
+        for i in range(12)
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["fallback"] and result["solver_stats"]["cp_status"] == "INFEASIBLE"
+    assert "solve" not in result["solver_stats"]["phases"]
+    [issue] = result["diagnostics"]
+    assert issue["kind"] == "skill_capacity" and issue["severity"] == "error"
+    assert issue["staff_ids"] == ["staff_001"] and len(issue["booking_ids"]) == 12
+    assert result["message"] == issue["message"]
+    # 貪欲法で割り当てられる分は返す
+    assert 0 < len(result["schedule"]) < 12
+
+def test_precheck_ignores_pinned_bookings_in_skill_capacity():
+    """担当スタッフが固定された施術中の予約は、スキルが合わなくても所要時間の不足に数えないことをテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ（フェイシャルは担当できない）
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    customer = Customer(id="customer_020", name="テスト顧客", phone="", email="")
+    bookings = [
+        Booking(id="in_chair", customer=customer,
+                services=[Service(ServiceType.FACIAL, 60, SkillLevel.BEGINNER, 6000)],
+                scheduled_start=datetime(2024, 1, 15, 10, 0),
+                status=BookingStatus.IN_PROGRESS, assigned_staff_id="staff_001"),
+        Booking(id="waiting", customer=customer,
+                services=[Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)],
+                scheduled_start=datetime(2024, 1, 15, 9, 0), is_flexible_time=True),
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15),
+                                         now=datetime(2024, 1, 15, 10, 30))
+    assert result["status"] == "OPTIMAL" and not result.get("fallback")
+    assert "diagnostics" not in result
+    assert {item["booking_id"] for item in result["schedule"]} == {"in_chair", "waiting"}
+
+def test_infeasible_model_names_conflicting_bookings():
+    """前検査で分からない矛盾は、CP-SATのコアから予約と制約を特定することをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+    customer = Customer(id="customer_018", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)
+    bookings = [
+        Booking(id="first", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 10, 0)),
+        Booking(id="second", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 10, 0)),
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["fallback"] and result["solver_stats"]["cp_status"] == "INFEASIBLE"
+    issues = {issue["kind"]: issue for issue in result["diagnostics"]}
+    conflict = issues["conflict"]
+    assert conflict["booking_ids"] == ["first", "second"]
+    assert conflict["constraints"] == ["staff_overlap:staff_001"]
+    assert result["message"] == conflict["message"]
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_infeasible_breaks_are_named_in_conflict(formulation):
+    """休憩を取る隙間がなく実行不可能な場合、休憩頻度の制約を矛盾として返すことをテスト"""
+    staff_list = create_sample_staff()[:1]  # 田中美咲のみ
+    staff_list[0].consecutive_work_limit = 8
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    salon_constraints.lunch_break_duration = timedelta(0)
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_024", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)
+    bookings = [  # 9:00から5時間連続（休憩頻度4時間）
+        Booking(id=f"cut_{hour:02d}", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, hour, 0))
+        for hour in range(9, 14)
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert result["fallback"] and result["solver_stats"]["cp_status"] == "INFEASIBLE"
+    conflict = {issue["kind"]: issue for issue in result["diagnostics"]}["conflict"]
+    assert "staff_break_frequency:staff_001" in conflict["constraints"]
+    assert conflict["staff_ids"] == ["staff_001"]
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_booking_without_start_slot_is_reported_unscheduled(formulation):
+    """開始候補のない予約を黙って落とさず、未割り当てとして PARTIAL で返すことをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_019", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)
+    bookings = [
+        Booking(id="morning", customer=customer, services=[cut],
+                scheduled_start=datetime(2024, 1, 15, 10, 0)),
+        Booking(id="late", customer=customer, services=[cut],  # 18:00閉店に終わらない
+                scheduled_start=datetime(2024, 1, 15, 17, 30)),
+    ]
+    
+    for allow_partial in (False, True):
+        result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15),
+                                             allow_partial=allow_partial)
+        assert result["status"] == "PARTIAL"
+        assert [item["booking_id"] for item in result["schedule"]] == ["morning"]
+        assert result["unscheduled_booking_ids"] == ["late"]
+        issues = {issue["kind"]: issue for issue in result["diagnostics"]}
+        assert issues["exceeds_closing"]["booking_ids"] == ["late"]
+        # 通常のモードでは実行不可能としてCP-SATを実行せず、理由をメッセージに返す
+        assert issues["exceeds_closing"]["severity"] == ("warning" if allow_partial else "error")
+        assert result.get("fallback", False) is not allow_partial
+        assert ("solve" in result["solver_stats"]["phases"]) is allow_partial
+        if not allow_partial:
+            assert result["message"] == issues["exceeds_closing"]["message"]
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_partial_mode_schedules_highest_priority_subset(formulation):
+    """部分割り当てモードでは優先度の高い予約を割り当て、残りを unscheduled_booking_ids に返すことをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    cut = Service(ServiceType.CUT, 60, SkillLevel.EXPERT, 5000)  # staff_001 のみ担当可能
+    bookings = [
+        Booking(id=booking_id, services=[cut],
+                customer=Customer(id=f"customer_{booking_id}", name="テスト顧客", phone="", email="",
+                                  priority=priority),
+                scheduled_start=datetime(2024, 1, 15, 10, 0))
+        for booking_id, priority in (("regular", Priority.LOW), ("vip", Priority.VIP))
+    ]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15),
+                                         allow_partial=True)
+    assert result["status"] == "PARTIAL" and not result.get("fallback")
+    assert result["solver_stats"]["status"] in ("OPTIMAL", "FEASIBLE")
+    assert [item["booking_id"] for item in result["schedule"]] == ["vip"]
+    assert result["unscheduled_booking_ids"] == ["regular"]
+    # 既定では全予約の割り当てが必要なため、CP-SATは実行不可能で貪欲法にフォールバックする
+    strict = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    assert strict["fallback"] and strict["solver_stats"]["cp_status"] == "INFEASIBLE"
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_partial_mode_without_placeable_bookings_keeps_solver_status(formulation):
+    """部分割り当てモードで1件も割り当てられなくても、フォールバックせず PARTIAL で返すことをテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation)
+    customer = Customer(id="customer_025", name="テスト顧客", phone="", email="")
+    cut = Service(ServiceType.CUT, 60, SkillLevel.INTERMEDIATE, 4000)
+    bookings = [Booking(id="late", customer=customer, services=[cut],  # 18:00閉店に終わらない
+                        scheduled_start=datetime(2024, 1, 15, 17, 30))]
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15),
+                                         allow_partial=True)
+    assert result["status"] == "PARTIAL" and not result.get("fallback")
+    assert result["solver_stats"]["status"] == "OPTIMAL"
+    assert result["schedule"] == [] and result["unscheduled_booking_ids"] == ["late"]
+
+@pytest.mark.parametrize("formulation", ["slot", "interval"])
+def test_solver_stats_report_phases_and_call_hook(formulation):
+    """フェーズごとの時間・モデル規模・探索統計が solver_stats に含まれ、フックに通知されることをテスト"""
+    staff_list = create_sample_staff()
+    bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+    for booking in bookings:
+        booking.is_flexible_time = True
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    events = []
+    optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                         formulation=formulation, phase_hook=events.append)
+    
+    result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 15))
+    stats = result["solver_stats"]
+    assert result["status"] in ("OPTIMAL", "FEASIBLE")
+    phases = stats["phases"]
+    for phase in ("time_slots", "start_domains", "greedy", "variables", "shift_model",
+                  "booking_constraints", "staff_constraints", "objective", "solve", "extraction"):
+        assert phases[phase]["wall_time"] >= 0 and phases[phase]["cpu_time"] >= 0
+    assert phases["variables"]["variables"] > 0 and phases["booking_constraints"]["constraints"] > 0
+    assert sum(phase.get("variables", 0) for phase in phases.values()) == stats["model"]["variables"]
+    assert stats["wall_time"] >= phases["solve"]["wall_time"]
+    assert stats["search"]["presolved_booleans"] > 0 and stats["search"]["branches"] >= 0
+    
+    assert [event["phase"] for event in events if event["event"] == "phase"] == list(phases)
+    assert events[-1] == {"event": "result", "status": result["status"], "solver_stats": stats}
+
+def test_unknown_formulation_rejected():
+    """未対応の定式化モードはエラーになる"""
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    with pytest.raises(ValueError):
+        BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives,
+                                 formulation="unknown")
+
+def test_solver_pool_rejects_when_saturated():
+    """ワーカープールが満杯のときは即座に拒否されることをテスト"""
+    pool = SolverPool(max_workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        running = pool.submit(release.wait, 5)
+        queued = pool.submit(release.wait, 5)
+        with pytest.raises(SolverPoolSaturated):
+            pool.submit(release.wait, 5)
+        
+        release.set()
+        assert running.result(timeout=5) and queued.result(timeout=5)
+        assert pool.submit(lambda: "ok").result(timeout=5) == "ok"
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.stats()["in_flight"] == 0 and pool.stats()["queue_depth"] == 0
+
+def test_job_manager_runs_and_cancels_jobs():
+    """最適化ジョブの実行とキャンセルのテスト"""
+    staff_list = create_sample_staff()
+    salon_constraints, scheduling_constraints, objectives = create_test_constraints()
+    pool = SolverPool(max_workers=1, max_queue=2)
+    manager = JobManager(pool)
+    try:
+        # 火曜日: 全予約を担当可能なスタッフが出勤している
+        bookings = [b for b in create_sample_bookings() if b.id != "booking_003"]
+        for booking in bookings:
+            booking.is_flexible_time = True
+        optimizer = BeautySchedulerOptimizer(salon_constraints, scheduling_constraints, objectives)
+        job = manager.submit(optimizer, staff_list, bookings, datetime(2024, 1, 16))
+        
+        deadline = time_module.time() + 10
+        while manager.get(job.id).status not in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            assert time_module.time() < deadline
+            time_module.sleep(0.01)
+        
+        finished = manager.get(job.id).to_dict()
+        assert finished["status"] == "succeeded"
+        assert finished["result"]["status"] in ("OPTIMAL", "FEASIBLE")
+        assert finished["solutions_found"] >= 1
+        assert finished["best_objective"] is not None
+        
+        # 停止要求済みの呼び出しは探索せずにCANCELLEDを返す
+        stop_event = threading.Event()
+        optimizer.request_stop(stop_event)
+        result = optimizer.optimize_schedule(staff_list, bookings, datetime(2024, 1, 16),
+                                             stop_event=stop_event)
+        assert result["status"] == "CANCELLED"
+        assert manager.cancel("unknown") is None
+    finally:
+        pool.shutdown()
+
+def test_stream_optimize_schedule_emits_solutions(monkeypatch):
+    """SSEで改善解と最終結果が配信されることをテスト"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from beauty_scheduler.api import routes
+    
+    monkeypatch.setattr(routes, "repository", ScheduleRepository(create_database_engine("sqlite://")))
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    client = TestClient(app)
+    # APIの既定制約は最低2名のスタッフが必要
+    for name, level in [("田中美咲", 4), ("山田花子", 1)]:
+        client.post("/api/v1/staff/", json={
+            "name": name,
+            "skills": [{"service_type": "cut", "level": level}],
+            "availability": [{"day_of_week": 1, "start_time": "09:00", "end_time": "18:00"}],
+            "hourly_rate": 2500
+        })
+    client.post("/api/v1/bookings/", json={
+        "customer_name": "鈴木太郎",
+        "customer_phone": "090-1234-5678",
+        "services": [{"service_type": "cut", "duration_minutes": 60,
+                      "required_skill_level": 2, "price": 4000}],
+        "scheduled_start": "2024-01-16T10:00:00"
+    })
+    
+    response = client.post("/api/v1/optimize-schedule/stream",
+                           json={"schedule_date": "2024-01-16T00:00:00"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    
+    events = [block for block in response.text.split("\n\n") if block]
+    names = [block.split("\n")[0] for block in events]
+    assert names[-1] == "event: result"
+    assert "event: solution" in names
+    solution = json.loads(events[names.index("event: solution")].split("\n")[1][len("data: "):])
+    assert solution["schedule"][0]["staff_name"] == "田中美咲"
+    assert "best_bound" in solution
+
+def test_metrics_endpoint_exposes_prometheus_text(monkeypatch):
+    """最適化後の /metrics にルート別リクエスト数・フェーズ時間・ステータス・モデル規模が出ることをテスト"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from beauty_scheduler.api import routes
+    
+    monkeypatch.setattr(routes, "repository", ScheduleRepository(create_database_engine("sqlite://")))
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    client = TestClient(app)
+    for name in ("田中美咲", "山田花子"):
+        client.post("/api/v1/staff/", json={
+            "name": name,
+            "skills": [{"service_type": "cut", "level": 4}],
+            "availability": [{"day_of_week": 2, "start_time": "09:00", "end_time": "18:00"}],
+            "hourly_rate": 2500
+        })
+    client.post("/api/v1/bookings/", json={
+        "customer_name": "鈴木太郎",
+        "customer_phone": "090-1234-5678",
+        "services": [{"service_type": "cut", "duration_minutes": 60,
+                      "required_skill_level": 2, "price": 4000}],
+        "scheduled_start": "2024-01-17T10:00:00"
+    })
+    requests = routes.metrics.requests
+    before = requests.value(route="/api/v1/optimize-schedule/", method="POST", status="200")
+    solves = routes.metrics.phase_seconds.count(phase="solve")
+    
+    assert client.post("/api/v1/optimize-schedule/",
+                       json={"schedule_date": "2024-01-17T00:00:00"}).status_code == 200
+    assert client.get("/api/v1/staff/unknown").status_code == 404
+    response = client.get("/api/v1/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    
+    text = response.text
+    assert requests.value(route="/api/v1/optimize-schedule/", method="POST", status="200") == before + 1
+    assert routes.metrics.phase_seconds.count(phase="solve") == solves + 1
+    assert 'beauty_scheduler_http_requests_total{route="/api/v1/staff/{staff_id}",method="GET",status="404"}' in text
+    assert '# TYPE beauty_scheduler_optimize_phase_duration_seconds histogram' in text
+    assert 'beauty_scheduler_optimize_phase_duration_seconds_bucket{phase="solve",le="+Inf"}' in text
+    assert 'beauty_scheduler_solver_status_total{engine="cp",status="OPTIMAL"}' in text
+    assert "beauty_scheduler_model_variables_count" in text
+    assert "beauty_scheduler_solver_pool_in_flight 0" in text
+    assert 'beauty_scheduler_result_cache_events_total{event="misses"}' in text
+    assert "beauty_scheduler_result_cache_hit_ratio" in text
+
+
+def test_metrics_cache_hit_ratio_counts_disk_hits_once():
+    """ディスクからの復元はヒットとして一度だけ数える"""
+    from beauty_scheduler.api.metrics import SchedulerMetrics
+
+    class StubCache:
+        def stats(self):
+            return {"hits": 1, "disk_hits": 1, "misses": 1, "evictions": 0,
+                    "entries": 1, "bytes": 10, "max_entries": 8, "max_bytes": 1024}
+
+    metrics = SchedulerMetrics()
+    metrics.watch_result_cache(StubCache())
+    text = metrics.render()
+    assert "beauty_scheduler_result_cache_hit_ratio 0.5" in text
+    assert 'beauty_scheduler_result_cache_events_total{event="memory_hits"} 0' in text
+    assert metrics.cache_events.value(event="disk_hits") == 1
+
 if __name__ == "__main__":
     # 手動テスト実行
     print("=== Beauty Scheduler テスト実行 ===")